@@ -1,8 +1,8 @@
 from strands import Agent
 from strands.models.ollama import OllamaModel
-import chromadb
-
-chroma_client = chromadb.HttpClient(host='localhost', port=8000)
+from ingestion.chunker import load_token_counter
+from retrieval.context import pack_context
+from retrieval.service import get_service
 
 # Create an Ollama model instance
 ollama_model = OllamaModel(
@@ -16,11 +16,8 @@ agent = Agent(model=ollama_model, system_prompt="You are an expert marketer writ
 # Use the agent
 
 users_prompt = "What healthcare plans are available for me and my family? Im also a small business owner as well"
-collection = chroma_client.get_collection("html_documents")
-context = collection.query(
-    query_texts=[users_prompt],
-    include=["documents"]
-)
+results = get_service().search(users_prompt, "html_documents", n_results=10)
+context = pack_context(results, load_token_counter(ollama_model.get_config()['model_id']))
 
 
 print("""
@@ -33,7 +30,7 @@ print("""
   </user prompt>
 
   Using the <context> provided give the answer the <user prompt>. Keep your answer grounded in the facts of the <context>. If the <context> doesn't contain the answer, say you don't know
-""".format(prompt=users_prompt, context=context["documents"]))
+""".format(prompt=users_prompt, context=context))
 
 
 agent("""
@@ -0,0 +1,62 @@
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from strands import Agent
+from strands.agent.state import AgentState
+from strands.telemetry.metrics import EventLoopMetrics
+
+logger = logging.getLogger(__name__)
+
+
+class AgentPool:
+    """Pre-built agents reused across tool calls instead of constructing one per call
+
+    Building an Agent registers its tools and generates their schemas; a
+    pooled agent pays that once. ``acquire`` hands each caller an agent of its
+    own, since an Agent serves one invocation at a time, and clears its
+    conversation when it is returned. It never blocks: when every agent is in
+    use an extra one is built, and it is kept afterwards only while fewer than
+    ``max_idle`` agents are idle. Safe to share between threads and event loops.
+    """
+
+    def __init__(self, factory: Callable[[], Agent], size: int = 2, max_idle: int = 8):
+        self.factory = factory
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+        self.idle = [factory() for _ in range(size)]
+        self.created = size
+
+    @contextmanager
+    def acquire(self) -> Iterator[Agent]:
+        with self.lock:
+            agent = self.idle.pop() if self.idle else None
+        if agent is None:
+            agent = self.factory()
+            with self.lock:
+                self.created += 1
+            logger.debug(f"All pooled agents busy, built agent #{self.created}")
+        try:
+            yield agent
+        finally:
+            self.release(agent)
+
+    def release(self, agent: Agent):
+        try:
+            reset(agent)
+        except Exception as e:
+            # An agent that cannot be cleared is dropped rather than reused with stale history
+            logger.warning(f"Could not reset pooled agent, discarding it: {e}")
+            return
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(agent)
+
+
+def reset(agent: Agent):
+    """Clear an agent's conversation, state and metrics so its next caller starts fresh"""
+    agent.messages = []
+    agent.state = AgentState()
+    agent.event_loop_metrics = EventLoopMetrics()
+    agent.conversation_manager.removed_message_count = 0
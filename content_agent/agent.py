@@ -1,6 +1,14 @@
+import asyncio
+import threading
+from typing import AsyncIterator, Optional
+
 from strands import Agent, tool
 # from strands.models.ollama import OllamaModel
-import chromadb
+from agent_pool.pool import AgentPool
+from content_agent.response_cache import PlaceholderFiller, ResponseCache, fill, open_response_cache, templatize
+from ingestion.chunker import load_token_counter
+from retrieval.context import ContextPacker
+from retrieval.service import get_service
 from local_model.model import model as qwen
 import logging
 
@@ -13,8 +21,6 @@ logging.basicConfig(
     handlers=[logging.StreamHandler()]
 )
 
-chroma_client = chromadb.HttpClient(host='localhost', port=8000)
-
 CONTENT_SYSTEM_PROMPT = """
 You are an expert in customer communication creating personalized content. 
 Use tools to create engaging content for customers to interact with and provide valuable concise information
@@ -26,35 +32,55 @@ Do not include any reasoning in your output
 #     host="http://localhost:11434",  # Ollama server address
 #     model_id="qwen3:4b"               # Specify which model to use
 # )
-agent = Agent(model=qwen, system_prompt=CONTENT_SYSTEM_PROMPT)
 
-@tool
-def generate_content(fname: str, lname: str, prompt: str):
-    """Generates personalized content from a clients knowledge base and prompt
+# An Agent runs one invocation at a time and keeps its conversation, so each
+# call borrows one of its own and the pool clears it afterwards
+content_agents = AgentPool(lambda: Agent(model=qwen, system_prompt=CONTENT_SYSTEM_PROMPT))
 
-    Args:
-        fname: Customer first name
-        lname: Customer last name
-        prompt: instructions on what content to generate for a customer
-    """
+# Chunks retrieved per request, before the packer trims them
+CONTENT_RESULTS = 10
+
+_packer = None
+_responses = None
+_caches_lock = threading.Lock()
+
+
+def embed_prompt(prompt: str):
+    """Prompt embedding from the retriever's query cache, which the search has just filled"""
+    cache = get_service().retriever("html_documents").cache
+    return cache.embed(prompt) if cache is not None else None
+
+
+def _open_caches():
+    global _packer, _responses
+    if _packer is None:
+        with _caches_lock:
+            if _packer is None:
+                model_id = qwen.get_config().get('model_id', '')
+                # Customers in a segment send the same request and get the same context, so
+                # one generation serves them all with their own names filled in
+                _responses = open_response_cache(namespace=model_id, embed=embed_prompt)
+                _packer = ContextPacker(load_token_counter(model_id))
+
+
+def get_packer() -> ContextPacker:
+    """Dedupes, diversifies and trims retrieved chunks to a token budget for the generating model"""
+    _open_caches()
+    return _packer
 
-    # Create an agent using the Ollama model
-    
 
-    # Use the agent
-    collection = chroma_client.get_collection("html_documents")
-    context = collection.query(
-        query_texts=[prompt],
-        include=["documents"]
-    )
+def get_responses() -> Optional[ResponseCache]:
+    """The shared response cache, or None when response caching is disabled"""
+    _open_caches()
+    return _responses
 
-    agent("""
+CONTENT_PROMPT = """
       <context>
       {context}
       <context>
       
       <customer info>
-      {fname} {lname}
+      {{{{fname}}}} {{{{lname}}}}
       </customer info>
           
       <user prompt>
@@ -64,7 +90,61 @@ def generate_content(fname: str, lname: str, prompt: str):
 
       Using the <context> provided give the answer the <user prompt>. 
       Keep your answer grounded in the facts of the <context>.
-    """.format(prompt=prompt, context=context["documents"], fname=fname, lname=lname))
+      Write the customer's names exactly as {{{{fname}}}} and {{{{lname}}}}; they are filled in afterwards.
+    """
+
+
+async def stream_content(fname: str, lname: str, prompt: str, results: Optional[dict] = None,
+                         ccid: Optional[str] = None) -> AsyncIterator:
+    """Generate content, yielding a token event per text delta and finally the full text
+
+    ``results`` are the prompt's search results when the caller already has
+    them. A ``ccid``, when known, is kept out of the model's prompt and the
+    cached response like the customer's name.
+    """
+    if results is None:
+        results = await get_service().asearch(prompt, "html_documents", n_results=CONTENT_RESULTS)
+    context = get_packer().pack(results)
+    responses = get_responses()
+    values = {'fname': fname, 'lname': lname}
+    if ccid:
+        values['ccid'] = str(ccid)
+
+    if responses is not None:
+        cached = await asyncio.to_thread(responses.get, prompt, context, values)
+        if cached is not None:
+            yield {'type': 'token', 'data': cached}
+            yield cached
+            return
 
+    # The model writes placeholders rather than the customer's details, so its
+    # output is a template that can be cached and filled for anyone
+    result = None
+    filler = PlaceholderFiller(values)
+    with content_agents.acquire() as agent:
+        async for event in agent.stream_async(CONTENT_PROMPT.format(prompt=templatize(prompt, values), context=context)):
+            if 'data' in event:
+                if delta := filler.feed(event['data']):
+                    yield {'type': 'token', 'data': delta}
+            elif 'result' in event:
+                result = event['result']
+    if delta := filler.flush():
+        yield {'type': 'token', 'data': delta}
+    template = str(result)
+    if responses is not None and template.strip():
+        await asyncio.to_thread(responses.put, prompt, context, values, template)
+    yield fill(template, values)
 
-  
\ No newline at end of file
+
+@tool
+async def generate_content(fname: str, lname: str, prompt: str):
+    """Generates personalized content from a clients knowledge base and prompt
+
+    Args:
+        fname: Customer first name
+        lname: Customer last name
+        prompt: instructions on what content to generate for a customer
+    """
+    # Tokens reach the orchestrator's stream as tool stream events; the last value is the tool result
+    async for event in stream_content(fname, lname, prompt):
+        yield event
@@ -0,0 +1,251 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE = os.environ.get("RESPONSE_CACHE", "memory")
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH", ".response_cache/responses.db")
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 7 * 24 * 3600))
+RESPONSE_CACHE_THRESHOLD = float(os.environ.get("RESPONSE_CACHE_THRESHOLD", 0.95))
+
+STORES = ('memory', 'sqlite', 'off')
+
+# Prompt tokens that look like personal identifiers: anything with a digit, and email addresses
+IDENTIFIER = re.compile(r'[^\s,;:!?()]*\d[^\s,;:!?()]*|\S+@\S+')
+
+
+def templatize(text: str, values: dict[str, str]) -> str:
+    """Replace personal values (names, IDs) in a prompt with ``{{key}}`` placeholders
+
+    Matching is case-sensitive on whole words, but a name that is also a
+    word ("Will", "Grant") is replaced wherever it is capitalized, so this
+    is only used on prompts. Generated text gets its placeholders from the
+    model instead.
+    """
+    for key, value in sorted(values.items(), key=lambda item: len(item[1] or ''), reverse=True):
+        if value and len(value.strip()) > 1:
+            text = re.sub(rf'(?<!\w){re.escape(value.strip())}(?!\w)', f'{{{{{key}}}}}', text)
+    return text
+
+
+def fill(template: str, values: dict[str, str]) -> str:
+    for key, value in values.items():
+        template = template.replace(f'{{{{{key}}}}}', value or '')
+    return template
+
+
+class PlaceholderFiller:
+    """Fills ``{{key}}`` placeholders in streamed text
+
+    A placeholder can be split across deltas, so a tail that may be the
+    start of one is held back until the next delta or ``flush``.
+    """
+
+    PARTIAL = re.compile(r'\{(\{(\w*(\})?)?)?$')
+
+    def __init__(self, values: dict[str, str]):
+        self.values = values
+        self.pending = ''
+
+    def feed(self, delta: str) -> str:
+        text = self.pending + delta
+        partial = self.PARTIAL.search(text)
+        cut = partial.start() if partial else len(text)
+        self.pending = text[cut:]
+        return fill(text[:cut], self.values)
+
+    def flush(self) -> str:
+        text, self.pending = self.pending, ''
+        return fill(text, self.values)
+
+
+def normalize_prompt(prompt: str, values: dict[str, str]) -> str:
+    return re.sub(r'\s+', ' ', templatize(prompt, values)).strip().lower()
+
+
+def identifiers(prompt: str) -> list[str]:
+    """Identifier-like tokens left in a normalized prompt, such as account or phone numbers"""
+    return sorted({token.rstrip('.') for token in IDENTIFIER.findall(prompt)})
+
+
+class MemoryResponseStore:
+    """LRU-bounded in-process store of response templates"""
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()   # key -> (context_hash, expires, embedding, template)
+
+    def get(self, key: str) -> Optional[tuple]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def candidates(self, context_hash: str) -> list[tuple]:
+        with self.lock:
+            return [(key, entry) for key, entry in self.entries.items() if entry[0] == context_hash]
+
+    def put(self, key: str, entry: tuple):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def close(self):
+        pass
+
+
+class SQLiteResponseStore:
+    """Response templates in a local SQLite file, shared by processes and kept across restarts"""
+
+    def __init__(self, db_path: str = RESPONSE_CACHE_PATH):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.con = sqlite3.connect(db_path, check_same_thread=False)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        with self.con:
+            self.con.execute(
+                "CREATE TABLE IF NOT EXISTS responses("
+                "key TEXT PRIMARY KEY, context_hash TEXT NOT NULL, expires REAL NOT NULL, "
+                "embedding BLOB, template TEXT NOT NULL, used REAL NOT NULL)"
+            )
+            self.con.execute("CREATE INDEX IF NOT EXISTS responses_context ON responses(context_hash)")
+
+    @staticmethod
+    def _entry(row) -> tuple:
+        context_hash, expires, embedding, template = row
+        return context_hash, expires, np.frombuffer(embedding, dtype=np.float32) if embedding else None, template
+
+    def get(self, key: str) -> Optional[tuple]:
+        with self.lock:
+            row = self.con.execute(
+                "SELECT context_hash, expires, embedding, template FROM responses WHERE key=?", (key,)
+            ).fetchone()
+            if row is not None:
+                with self.con:
+                    self.con.execute("UPDATE responses SET used=? WHERE key=?", (time.time(), key))
+        return self._entry(row) if row else None
+
+    def candidates(self, context_hash: str) -> list[tuple]:
+        with self.lock:
+            rows = self.con.execute(
+                "SELECT key, context_hash, expires, embedding, template FROM responses WHERE context_hash=?",
+                (context_hash,)
+            ).fetchall()
+        return [(row[0], self._entry(row[1:])) for row in rows]
+
+    def put(self, key: str, entry: tuple):
+        context_hash, expires, embedding, template = entry
+        blob = np.asarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None
+        with self.lock, self.con:
+            self.con.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                             (key, context_hash, expires, blob, template, time.time()))
+
+    def delete(self, key: str):
+        with self.lock, self.con:
+            self.con.execute("DELETE FROM responses WHERE key=?", (key,))
+
+    def purge(self) -> int:
+        """Delete expired templates"""
+        with self.lock, self.con:
+            return self.con.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),)).rowcount
+
+    def close(self):
+        with self.lock:
+            self.con.close()
+
+
+class ResponseCache:
+    """Reuses generated content across customers who send the same request
+
+    Entries are keyed by the normalized prompt, with personal values replaced
+    by placeholders, together with a hash of the retrieved context and the
+    model. Responses are generated with ``{{key}}`` placeholders in place of
+    personal values and stored that way, then filled with each customer's
+    values, so "Hi {{fname}}" is served to John as "Hi John" and to Jane as
+    "Hi Jane". A prompt that misses
+    exactly still hits when its embedding has cosine similarity of at least
+    ``threshold`` with a cached prompt that was answered from the same
+    context and has the same identifier-like tokens (numbers, emails) after
+    templatizing, so a response written for one customer's account or
+    phone number is never served for another's. ``embed`` returns a unit embedding, or ``None`` to skip
+    similarity matching for that prompt.
+    """
+
+    def __init__(self, store, namespace: str = '', embed: Optional[Callable[[str], Optional[np.ndarray]]] = None,
+                 threshold: float = RESPONSE_CACHE_THRESHOLD, ttl: float = RESPONSE_CACHE_TTL):
+        self.store = store
+        self.namespace = namespace
+        self.embed = embed
+        self.threshold = threshold
+        self.ttl = ttl
+        self.stats = {'hits': 0, 'semantic_hits': 0, 'misses': 0}
+
+    def _keys(self, prompt: str, context: str, values: dict) -> tuple[str, str]:
+        """Exact key, and the group of entries a similar prompt may match"""
+        normalized = normalize_prompt(prompt, values)
+        group = '\0'.join([self.namespace, context, *identifiers(normalized)])
+        context_hash = hashlib.sha256(group.encode('utf-8')).hexdigest()
+        key = hashlib.sha256(f"{context_hash}\0{normalized}".encode('utf-8')).hexdigest()
+        return key, context_hash
+
+    def get(self, prompt: str, context: str, values: dict[str, str]) -> Optional[str]:
+        key, context_hash = self._keys(prompt, context, values)
+        now = time.time()
+        entry = self.store.get(key)
+        if entry is not None and entry[1] > now:
+            self.stats['hits'] += 1
+            return fill(entry[3], values)
+
+        embedding = self.embed(prompt) if self.embed is not None else None
+        if embedding is not None:
+            best, best_score = None, self.threshold
+            for candidate_key, (_, expires, candidate, template) in self.store.candidates(context_hash):
+                if expires <= now or candidate is None or candidate.shape != embedding.shape:
+                    continue
+                score = float(candidate @ embedding)
+                if score >= best_score:
+                    best, best_score = template, score
+            if best is not None:
+                self.stats['semantic_hits'] += 1
+                logger.debug(f"Semantic response cache hit ({best_score:.3f})")
+                return fill(best, values)
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, prompt: str, context: str, values: dict[str, str], template: str):
+        """Store a response generated with ``{{key}}`` placeholders for personal values"""
+        key, context_hash = self._keys(prompt, context, values)
+        embedding = self.embed(prompt) if self.embed is not None else None
+        self.store.put(key, (context_hash, time.time() + self.ttl, embedding, template))
+
+    def close(self):
+        self.store.close()
+
+
+def open_response_cache(store: str = RESPONSE_CACHE, namespace: str = '',
+                        embed: Optional[Callable[[str], Optional[np.ndarray]]] = None) -> Optional[ResponseCache]:
+    """Response cache on the configured store, or None when it is ``off``"""
+    if store not in STORES:
+        raise ValueError(f"Unknown response cache store {store!r}; expected one of {STORES}")
+    if store == 'off':
+        return None
+    backing = SQLiteResponseStore() if store == 'sqlite' else MemoryResponseStore()
+    return ResponseCache(backing, namespace=namespace, embed=embed)
@@ -1,6 +1,6 @@
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
-import sqlite3
-import json
+import asyncio
 import logging
 import sys
 
@@ -8,6 +8,9 @@ from strands import Agent, tool
 from pydantic import BaseModel, Field
 # from strands.models.ollama import OllamaModel
 
+from agent_pool.pool import AgentPool
+from customer_agent.bulk import import_file
+from customer_agent.repository import CustomerRepository
 from local_model.model import model as gwen
 
 
@@ -29,15 +32,19 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-con = sqlite3.connect("customer.db", check_same_thread=False)
-cur = con.cursor()
+customers = CustomerRepository()
 
-# Generate tables
-cur.execute("CREATE TABLE IF NOT EXISTS customer(ccid, fname, lname, channel_addr, metadata)")
+# Each worker thread keeps its own WAL connection, so lookups from concurrent
+# agents run side by side without blocking the event loop
+db_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="customer-db")
+
+
+async def run_db(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(db_executor, fn, *args)
 
 
 @tool
-def create_customer(ccid:str, fname:str, lname:str, channel_addr:str, metadata: dict):
+async def create_customer(ccid:str, fname:str, lname:str, channel_addr:str, metadata: dict):
     """Create a new customer with a ccid(primary id), first name, last name and channel address (phone number).
 
     Args:
@@ -51,35 +58,34 @@ def create_customer(ccid:str, fname:str, lname:str, channel_addr:str, metadata:
         Customer
     """
 
-    metadata_json = json.dumps(metadata)
     try:
-        with con:
-            cur.execute("INSERT INTO customer VALUES (?, ?, ?, ?, ?)", (ccid, fname, lname, channel_addr, metadata_json))
-            return Customer(ccid=ccid, fname=fname,lname=lname,channel_addr=channel_addr)
+        customer = await run_db(customers.create, ccid, fname, lname, channel_addr, metadata)
+        return Customer(**customer)
     except Exception as e:
         logger.exception(f"Error inserting customer: {e}")
         raise
 
 @tool
-def get_customer(ccid:str):
+async def get_customer(ccid:str):
     """Retrieves customer ifnormation by  ccid
 
     Args:
         ccid: Customer id, primary key
     
     Returns: 
-        Customer
+        Customer, or a message saying no customer has this ccid
     """
     try:
-        with con:
-            result = cur.execute("SELECT * FROM customer where ccid=?", (ccid,))
-            return Customer(ccid=ccid)
+        customer = await run_db(customers.get, ccid)
+        if customer is None:
+            return f"No customer found with ccid {ccid}"
+        return Customer(**customer)
     except Exception as e:
-        logger.exception(f"Error inserting customer: {e}")
+        logger.exception(f"Error retrieving customer: {e}")
         raise
 
 @tool
-def update_customer(ccid:str, fname:str, lname:str, channel_addr:str, metadata: dict):
+async def update_customer(ccid:str, fname:str, lname:str, channel_addr:str, metadata: dict):
     """Updates customer information by ccid
 
     Args:
@@ -90,16 +96,39 @@ def update_customer(ccid:str, fname:str, lname:str, channel_addr:str, metadata:
         metadata: Dictionary of additional customer data to be stored as JSON
 
     Returns:
-        Customer
+        Customer, or a message saying no customer has this ccid
     """
     try:
-        with con:
-            cur.execute("UPDATE customer SET fname=?, lname=?, channel_addr=?, metadata=? WHERE ccid=?", (fname, lname, channel_addr, json.dumps(metadata), ccid))
-            return Customer(ccid=ccid, fname=fname,lname=lname,channel_addr=channel_addr)
+        customer = await run_db(customers.update, ccid, fname, lname, channel_addr, metadata)
+        if customer is None:
+            return f"No customer found with ccid {ccid}"
+        return Customer(**customer)
     except Exception as e:
         logger.exception(f"Error updating customer: {e}")
         raise
 
+@tool
+async def import_customers(path: str, on_conflict: str = "update") -> str:
+    """Bulk load customers from a CSV or JSONL file in one call, for onboarding groups of members
+
+    Args:
+        path: Path to a .csv file with a header row (ccid, fname, lname, channel_addr, metadata) or a .jsonl file
+        on_conflict: "update" to overwrite existing customers, "skip" to keep them, "fail" to stop at the first existing ccid
+
+    Returns:
+        A summary of the rows imported
+    """
+    if path.strip() == '-':
+        # The agent's stdin is the server's, not a file the caller provided
+        return "Error importing customers: reading from stdin is only supported by the command line"
+    try:
+        stats = await asyncio.to_thread(import_file, path, on_conflict=on_conflict, repository=customers)
+        return (f"Imported {stats.rows} rows from {path}: {stats.written} customers inserted or changed, "
+                f"{stats.invalid} invalid rows skipped")
+    except Exception as e:
+        logger.exception(f"Error importing customers: {e}")
+        return f"Error importing customers from {path}: {e}"
+
 CUSTOMER_ASSISSTANT_PROMPT = """
 you are a helpful assisstant retrieving, updating, and creating customers
 
@@ -113,8 +142,16 @@ When handling requests, follow this priority order:
 Always select the most appropriate tool based on the user's query.
 """
 
+# Strands Agents SDK makes it easy to create a specialized agent; the pool
+# builds them once and clears their conversation between calls
+customer_agents = AgentPool(lambda: Agent(
+    model=gwen,
+    system_prompt=CUSTOMER_ASSISSTANT_PROMPT,
+    tools=[create_customer, get_customer, update_customer]
+))
+
 @tool
-def customer_assisstant(query: str) -> str:
+async def customer_assisstant(query: str) -> str:
     """
     Manage customers in a database
 
@@ -125,15 +162,9 @@ def customer_assisstant(query: str) -> str:
         A Customer
     """
     try:
-        # Strands Agents SDK makes it easy to create a specialized agent
-        customer_assisstant = Agent(
-            model=gwen,
-            system_prompt=CUSTOMER_ASSISSTANT_PROMPT,
-            tools=[create_customer, get_customer, update_customer]
-        )
-
-        # Call the agent and return its response
-        response = customer_assisstant.structured_output(Customer, query)
+        with customer_agents.acquire() as customer_assisstant:
+            # Call the agent and return its response
+            response = await customer_assisstant.structured_output_async(Customer, query)
         return str(response)
     except Exception as e:
         return f"Error in research assistant: {str(e)}"
@@ -0,0 +1,197 @@
+"""Bulk customer import and export
+
+    python -m customer_agent.bulk import members.csv
+    python -m customer_agent.bulk import - --format jsonl < members.jsonl
+    python -m customer_agent.bulk export members.jsonl
+
+CSV files have a header row. ``ccid``, ``fname``, ``lname`` and
+``channel_addr`` map to their columns, a ``metadata`` column holds a JSON
+object, and any other column is added to the customer's metadata. JSONL
+files have one customer object per line, with the same fields.
+"""
+import argparse
+import csv
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from typing import IO, Iterable, Iterator, Optional
+
+from customer_agent.repository import CONFLICT_SQL, CUSTOMER_DB, CustomerRepository
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('ccid', 'fname', 'lname', 'channel_addr')
+EXPORT_FIELDS = FIELDS + ('metadata', 'updated_at')
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.jl': 'jsonl'}
+
+
+@dataclass
+class ImportStats:
+    rows: int = 0
+    written: int = 0       # inserted or changed
+    invalid: int = 0
+    batches: int = 0
+    elapsed: float = 0.0
+
+
+def detect_format(path: str, format: Optional[str] = None) -> str:
+    if format:
+        return format
+    detected = FORMATS.get(Path(path).suffix.lower())
+    if detected is None:
+        raise ValueError(f"Cannot tell the format of {path}; pass csv or jsonl")
+    return detected
+
+
+@contextmanager
+def _open(path: str, mode: str) -> Iterator[IO]:
+    if path == '-':
+        yield sys.stdin if 'r' in mode else sys.stdout
+        return
+    with open(path, mode, encoding='utf-8', newline='') as f:
+        yield f
+
+
+def _customer(record: dict) -> Optional[dict]:
+    """Normalize a parsed record, or None when it has no ccid"""
+    ccid = str(record.get('ccid') or '').strip()
+    if not ccid:
+        return None
+    metadata = record.get('metadata') or {}
+    if isinstance(metadata, str):
+        metadata = json.loads(metadata)
+    extra = {key: value for key, value in record.items() if key not in EXPORT_FIELDS and value not in (None, '')}
+    customer = {field: record.get(field) or None for field in FIELDS[1:]}
+    return {'ccid': ccid, **customer, 'metadata': {**metadata, **extra}}
+
+
+def read_records(f: IO, format: str) -> Iterator[dict]:
+    if format == 'csv':
+        yield from csv.DictReader(f)
+    else:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"Line {number} is not valid JSON ({e})")
+                record = {}
+            if not isinstance(record, dict):
+                logger.warning(f"Line {number} is not a JSON object")
+                record = {}
+            yield record    # an empty record is counted as an invalid row
+
+
+def _batches(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def import_customers(repository: CustomerRepository, f: IO, format: str, batch_size: int = 5000,
+                     on_conflict: str = 'update') -> ImportStats:
+    """Stream customers from a CSV or JSONL file into the store
+
+    Rows are written ``batch_size`` at a time, each batch one transaction,
+    so memory stays flat and agents writing single customers only wait for
+    the current batch. Rows without a ccid, or whose metadata is not valid
+    JSON, are counted as invalid and skipped.
+    """
+    if on_conflict not in CONFLICT_SQL:
+        raise ValueError(f"Unknown conflict policy {on_conflict!r}; expected one of {tuple(CONFLICT_SQL)}")
+    stats = ImportStats()
+    start = time.perf_counter()
+
+    def customers():
+        for record in read_records(f, format):
+            stats.rows += 1
+            try:
+                customer = _customer(record)
+            except (json.JSONDecodeError, TypeError) as e:
+                logger.warning(f"Skipping row {stats.rows}: invalid metadata ({e})")
+                customer = None
+            if customer is None:
+                stats.invalid += 1
+                continue
+            yield customer
+
+    for batch in _batches(customers(), batch_size):
+        stats.written += repository.upsert_many(batch, on_conflict)
+        stats.batches += 1
+        if stats.batches % 20 == 0:
+            logger.info(f"Imported {stats.rows} rows")
+    stats.elapsed = time.perf_counter() - start
+    logger.info(f"Imported {stats.rows} rows ({stats.written} written, {stats.invalid} invalid) "
+                f"in {stats.elapsed:.1f}s")
+    return stats
+
+
+def export_customers(repository: CustomerRepository, f: IO, format: str, batch_size: int = 5000) -> int:
+    """Stream every customer to a CSV or JSONL file in ccid order, returning the count"""
+    count = 0
+    if format == 'csv':
+        writer = csv.DictWriter(f, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+    for customer in repository.iter_all(batch_size):
+        if format == 'csv':
+            writer.writerow({**customer, 'metadata': json.dumps(customer['metadata'])})
+        else:
+            f.write(json.dumps(customer) + '\n')
+        count += 1
+    return count
+
+
+def import_file(path: str, format: Optional[str] = None, on_conflict: str = 'update', batch_size: int = 5000,
+                repository: Optional[CustomerRepository] = None) -> ImportStats:
+    format = detect_format(path, format)
+    repository = repository if repository is not None else CustomerRepository()
+    with _open(path, 'r') as f:
+        return import_customers(repository, f, format, batch_size, on_conflict)
+
+
+def export_file(path: str, format: Optional[str] = None, batch_size: int = 5000,
+                repository: Optional[CustomerRepository] = None) -> int:
+    format = detect_format(path, format)
+    repository = repository if repository is not None else CustomerRepository()
+    with _open(path, 'w') as f:
+        return export_customers(repository, f, format, batch_size)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Import customers from, or export them to, CSV or JSONL")
+    parser.add_argument("command", choices=('import', 'export'))
+    parser.add_argument("path", help="File to read or write; - for stdin or stdout")
+    parser.add_argument("--format", choices=sorted(set(FORMATS.values())),
+                        help="File format; detected from the extension by default")
+    parser.add_argument("--db", default=CUSTOMER_DB, help="Customer database")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows per transaction or read")
+    parser.add_argument("--on-conflict", choices=tuple(CONFLICT_SQL), default='update',
+                        help="What to do with customers whose ccid already exists")
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        stream=sys.stderr)
+    args = parse_args()
+    repository = CustomerRepository(args.db)
+    try:
+        if args.command == 'import':
+            stats = import_file(args.path, args.format, args.on_conflict, args.batch_size, repository)
+            print(f"Imported {stats.rows} rows: {stats.written} inserted or changed, {stats.invalid} invalid, "
+                  f"{stats.elapsed:.1f}s", file=sys.stderr)
+        else:
+            count = export_file(args.path, args.format, args.batch_size, repository)
+            print(f"Exported {count} customers", file=sys.stderr)
+    finally:
+        repository.close()
+
+
+if __name__ == "__main__":
+    main()
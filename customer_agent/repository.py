@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+CUSTOMER_DB = os.environ.get("CUSTOMER_DB", "customer.db")
+
+COLUMNS = ('ccid', 'fname', 'lname', 'channel_addr', 'metadata', 'updated_at')
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS customer("
+    "ccid TEXT PRIMARY KEY NOT NULL, fname TEXT, lname TEXT, channel_addr TEXT, "
+    "metadata TEXT NOT NULL DEFAULT '{}', updated_at TEXT NOT NULL) WITHOUT ROWID"
+)
+
+# Constant statements so each connection's statement cache prepares them once
+GET_SQL = "SELECT * FROM customer WHERE ccid=?"
+INSERT_SQL = "INSERT INTO customer VALUES (?, ?, ?, ?, ?, ?)"
+UPDATE_SQL = "UPDATE customer SET fname=?, lname=?, channel_addr=?, metadata=?, updated_at=? WHERE ccid=?"
+UPSERT_SQL = (
+    "INSERT INTO customer VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(ccid) DO UPDATE SET "
+    "fname=excluded.fname, lname=excluded.lname, channel_addr=excluded.channel_addr, "
+    "metadata=excluded.metadata, updated_at=excluded.updated_at"
+)
+# Bulk upserts leave identical rows untouched, so rowcount is rows inserted or changed
+UPSERT_CHANGED_SQL = UPSERT_SQL + (
+    " WHERE fname IS NOT excluded.fname OR lname IS NOT excluded.lname "
+    "OR channel_addr IS NOT excluded.channel_addr OR metadata IS NOT excluded.metadata"
+)
+INSERT_NEW_SQL = "INSERT INTO customer VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(ccid) DO NOTHING"
+CONFLICT_SQL = {'update': UPSERT_CHANGED_SQL, 'skip': INSERT_NEW_SQL, 'fail': INSERT_SQL}
+
+
+def _row(row: Optional[sqlite3.Row]) -> Optional[dict]:
+    if row is None:
+        return None
+    customer = dict(row)
+    customer['metadata'] = json.loads(customer['metadata'] or '{}')
+    return customer
+
+
+class CustomerRepository:
+    """Customers in SQLite, keyed and clustered by ``ccid``
+
+    The table is ``WITHOUT ROWID`` with ``ccid`` as its primary key, so a
+    lookup is a single B-tree search however many members there are. The
+    database runs in WAL mode and every thread gets its own connection:
+    readers never wait for each other or for a writer, and writers queue on
+    SQLite's lock for up to ``busy_timeout`` seconds. A ``customer`` table
+    from before the schema had a key is migrated in place on open, keeping
+    the last row written for each ccid.
+    """
+
+    def __init__(self, db_path: str = CUSTOMER_DB, busy_timeout: float = 30.0):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        con = self.connection()
+        con.execute("PRAGMA journal_mode=WAL")
+        self._migrate(con)
+
+    def connection(self) -> sqlite3.Connection:
+        """This thread's connection, opened on first use"""
+        con = getattr(self.local, 'con', None)
+        if con is None:
+            # Only the owning thread uses it; close() may run on another
+            con = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False)
+            con.row_factory = sqlite3.Row
+            con.execute("PRAGMA synchronous=NORMAL")
+            self.local.con = con
+            with self.lock:
+                self.connections.append(con)
+        return con
+
+    def _migrate(self, con: sqlite3.Connection):
+        columns = con.execute("PRAGMA table_info(customer)").fetchall()
+        if columns and any(column['pk'] for column in columns):
+            return
+        if not columns:
+            with con:
+                con.execute(SCHEMA)
+            return
+        count = con.execute("SELECT COUNT(*) FROM customer").fetchone()[0]
+        logger.info(f"Migrating {count} customers to the keyed schema")
+        con.executescript(f"""
+            BEGIN IMMEDIATE;
+            ALTER TABLE customer RENAME TO customer_legacy;
+            {SCHEMA};
+            INSERT OR REPLACE INTO customer
+                SELECT CAST(ccid AS TEXT), fname, lname, channel_addr, COALESCE(metadata, '{{}}'), '{datetime.now().isoformat()}'
+                FROM customer_legacy WHERE ccid IS NOT NULL ORDER BY rowid;
+            DROP TABLE customer_legacy;
+            COMMIT;
+        """)
+
+    @staticmethod
+    def _values(ccid: str, fname: Optional[str], lname: Optional[str], channel_addr: Optional[str],
+                metadata: Optional[dict]) -> tuple:
+        return (str(ccid), fname, lname, channel_addr, json.dumps(metadata or {}), datetime.now().isoformat())
+
+    def get(self, ccid: str) -> Optional[dict]:
+        return _row(self.connection().execute(GET_SQL, (str(ccid),)).fetchone())
+
+    def create(self, ccid: str, fname: Optional[str], lname: Optional[str], channel_addr: Optional[str],
+               metadata: Optional[dict] = None) -> dict:
+        """Insert a new customer; raises ``sqlite3.IntegrityError`` if the ccid exists"""
+        values = self._values(ccid, fname, lname, channel_addr, metadata)
+        con = self.connection()
+        with con:
+            con.execute(INSERT_SQL, values)
+        return _row(dict(zip(COLUMNS, values)))
+
+    def update(self, ccid: str, fname: Optional[str], lname: Optional[str], channel_addr: Optional[str],
+               metadata: Optional[dict] = None) -> Optional[dict]:
+        """Replace an existing customer's fields, or return None when there is no such ccid"""
+        values = self._values(ccid, fname, lname, channel_addr, metadata)
+        con = self.connection()
+        with con:
+            updated = con.execute(UPDATE_SQL, values[1:] + values[:1]).rowcount
+        return _row(dict(zip(COLUMNS, values))) if updated else None
+
+    def upsert(self, ccid: str, fname: Optional[str], lname: Optional[str], channel_addr: Optional[str],
+               metadata: Optional[dict] = None) -> dict:
+        values = self._values(ccid, fname, lname, channel_addr, metadata)
+        con = self.connection()
+        with con:
+            con.execute(UPSERT_SQL, values)
+        return _row(dict(zip(COLUMNS, values)))
+
+    def upsert_many(self, customers: Iterable[dict], on_conflict: str = 'update') -> int:
+        """Write customers in one transaction, returning how many rows were inserted or changed
+
+        ``on_conflict`` decides what happens to an existing ccid: ``update``
+        overwrites it, ``skip`` keeps the stored row and ``fail`` raises
+        ``sqlite3.IntegrityError`` and rolls the whole batch back.
+        """
+        if on_conflict not in CONFLICT_SQL:
+            raise ValueError(f"Unknown conflict policy {on_conflict!r}; expected one of {tuple(CONFLICT_SQL)}")
+        values = [self._values(customer['ccid'], customer.get('fname'), customer.get('lname'),
+                               customer.get('channel_addr'), customer.get('metadata')) for customer in customers]
+        con = self.connection()
+        with con:
+            return con.executemany(CONFLICT_SQL[on_conflict], values).rowcount
+
+    def iter_all(self, batch_size: int = 5000) -> Iterator[dict]:
+        """Every customer in ccid order, read ``batch_size`` rows at a time"""
+        cursor = self.connection().execute("SELECT * FROM customer ORDER BY ccid")
+        try:
+            while rows := cursor.fetchmany(batch_size):
+                yield from (_row(row) for row in rows)
+        finally:
+            cursor.close()
+
+    def __len__(self) -> int:
+        return self.connection().execute("SELECT COUNT(*) FROM customer").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            for con in self.connections:
+                con.close()
+            self.connections.clear()
+        self.local = threading.local()
@@ -1,22 +1,45 @@
-from textwrap import wrap
-import chromadb
+import argparse
 import ollama
 import os
-import json
+import threading
 from pathlib import Path
+from typing import Iterator
 from markitdown import MarkItDown
 import logging
 
+from ingestion.boilerplate import BoilerplateStripper
+from ingestion.catalog import DocumentCatalog
+from ingestion.chunker import MarkdownChunker, load_token_counter, tokenizer_name
+from ingestion.dedupe import NearDuplicateIndex
+from ingestion.embedder import BatchEmbedder
+from ingestion.embedding_cache import CachedEmbedder, EmbeddingCache
+from ingestion.manifest import Manifest
+from ingestion.pipeline import IngestionPipeline, PipelineConfig
+from retrieval.backend import (BACKENDS, RETRIEVAL_BACKEND, VECTOR_DIMS, VECTOR_STORAGE, close_collection,
+                               open_collection)
+from retrieval.lexical import open_lexical_index
+from retrieval.store import STORAGE_DTYPES
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Initialize clients
-chroma_client = chromadb.HttpClient(host='localhost', port=8000)
-
 # Initialize markdown converter
 md_converter = MarkItDown()
 
+EMBEDDING_MODEL = "nomic-embed-text:latest"
+OLLAMA_URL = "http://localhost:11434"
+
+EMBEDDING_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR", ".embedding_cache")
+EMBEDDING_CACHE_MAX_BYTES = int(os.environ.get("EMBEDDING_CACHE_MAX_BYTES", 1 << 30))
+
+# Shared so the adaptive batch size is learned once across all callers
+embedder = BatchEmbedder(model=EMBEDDING_MODEL, client=ollama.Client(host=OLLAMA_URL))
+
+# On-disk embedding cache, opened on first use
+_cached_embedder = None
+_cached_embedder_lock = threading.Lock()
+
 
 def discover_html_files(html_downloads_dir: str = "html_downloads") -> list[Path]:
     """Discover all HTML files in the downloads directory"""
@@ -35,22 +58,11 @@ def discover_html_files(html_downloads_dir: str = "html_downloads") -> list[Path
     return html_files
 
 
-def load_url_mapping(html_downloads_dir: str = "html_downloads") -> dict:
-    """Load the URL mapping file if it exists"""
-    mapping_file = Path(html_downloads_dir) / "url_mapping.json"
-    
-    if mapping_file.exists():
-        try:
-            with open(mapping_file, 'r', encoding='utf-8') as f:
-                url_mapping = json.load(f)
-            logger.info(f"Loaded URL mapping with {len(url_mapping)} entries")
-            return url_mapping
-        except Exception as e:
-            logger.error(f"Failed to load URL mapping: {e}")
-    else:
-        logger.warning("No URL mapping file found")
-        
-    return {}
+def load_catalog(html_downloads_dir: str = "html_downloads") -> DocumentCatalog:
+    """Open the document catalog, importing url_mapping.json on first use"""
+    catalog = DocumentCatalog(str(Path(html_downloads_dir) / "catalog.db"))
+    logger.info(f"Loaded document catalog with {len(catalog)} entries")
+    return catalog
 
 
 def convert_html_to_markdown(html_file: Path) -> str:
@@ -71,37 +83,48 @@ def convert_html_to_markdown(html_file: Path) -> str:
         return ""
 
 
-def generate_embedding(text: str, model: str = "nomic-embed-text:latest") -> list[float]:
+def get_cached_embedder() -> CachedEmbedder:
+    """Return the embedder backed by the persistent embedding cache"""
+    global _cached_embedder
+    with _cached_embedder_lock:
+        if _cached_embedder is None:
+            cache = EmbeddingCache(EMBEDDING_CACHE_DIR, EMBEDDING_MODEL, max_bytes=EMBEDDING_CACHE_MAX_BYTES)
+            _cached_embedder = CachedEmbedder(embedder.embed, cache)
+        return _cached_embedder
+
+
+def generate_embedding(text: str, model: str = EMBEDDING_MODEL) -> list[float]:
     """Generate embedding for text using Ollama"""
     try:
+        if model == EMBEDDING_MODEL:
+            return get_cached_embedder().embed([text])[0]
         response = ollama.embed(
             model=model,
             input=text
         )
-        return response['embedding']
+        return response['embeddings'][0]
     except Exception as e:
         logger.error(f"Failed to generate embedding: {e}")
         return []
 
 
-def process_html_file(html_file: Path, url_mapping: dict) -> dict:
+def generate_embeddings(texts: list[str]) -> list[list[float]]:
+    """Generate embeddings for many texts using the cache and batched Ollama requests"""
+    return get_cached_embedder().embed(texts)
+
+
+def process_html_file(html_file: Path, catalog: DocumentCatalog) -> dict:
     """Process a single HTML file and extract metadata"""
     logger.info(f"Processing: {html_file}")
     
     # Get file info
     stats = html_file.stat()
     
-    # Find corresponding URL from mapping
-    original_url = None
-    title = None
-    timestamp = None
-    
-    for url, info in url_mapping.items():
-        if info.get('local_file_path') == str(html_file):
-            original_url = url
-            title = info.get('title', '')
-            timestamp = info.get('timestamp', '')
-            break
+    # Find corresponding URL in the catalog
+    page = catalog.by_path(html_file) or {}
+    original_url = page.get('url')
+    title = page.get('title')
+    timestamp = page.get('timestamp')
     
     # Convert to markdown
     markdown_content = convert_html_to_markdown(html_file)
@@ -124,17 +147,12 @@ def process_html_file(html_file: Path, url_mapping: dict) -> dict:
     }
 
 
-def create_or_get_collection(collection_name: str = "html_documents"):
-    """Create or get ChromaDB collection"""
-    try:
-        # Try to get existing collection
-        collection = chroma_client.get_collection(name=collection_name)
-        logger.info(f"Using existing collection: {collection_name}")
-    except Exception:
-        # Create new collection
-        collection = chroma_client.create_collection(name=collection_name)
-        logger.info(f"Created new collection: {collection_name}")
-    
+def create_or_get_collection(collection_name: str = "html_documents", backend: str = RETRIEVAL_BACKEND,
+                             storage: str = VECTOR_STORAGE, dims: int = VECTOR_DIMS):
+    """Create or get the collection on the configured retrieval backend"""
+    collection = open_collection(collection_name, backend=backend, storage=storage, dims=dims,
+                                 embedding_model=EMBEDDING_MODEL, ollama_url=OLLAMA_URL)
+    logger.info(f"Using {backend} collection: {collection_name}")
     return collection
 
 
@@ -152,28 +170,30 @@ def add_documents_to_collection(documents: list[dict], collection, batch_size: i
         embeddings = []
         metadatas = []
         
+        pending = []
         for j, doc in enumerate(batch):
-            doc_id = f"doc_{i + j}"
-            content = doc['content']
-            metadata = doc['metadata']
-            
             # Skip empty documents
-            if not content.strip():
-                logger.warning(f"Skipping empty document: {metadata.get('filename', 'unknown')}")
-                continue
-            
-            # Generate embedding
-            logger.info(f"Generating embedding for: {metadata.get('filename', 'unknown')}")
-            embedding = generate_embedding(content)
-            
-            if not embedding:
-                logger.warning(f"Failed to generate embedding for: {metadata.get('filename', 'unknown')}")
+            if not doc['content'].strip():
+                logger.warning(f"Skipping empty document: {doc['metadata'].get('filename', 'unknown')}")
                 continue
-            
+            pending.append((f"doc_{i + j}", doc))
+
+        if not pending:
+            continue
+
+        # Generate embeddings for the whole batch in as few requests as possible
+        logger.info(f"Generating embeddings for {len(pending)} documents")
+        try:
+            batch_embeddings = generate_embeddings([doc['content'] for _, doc in pending])
+        except Exception as e:
+            logger.warning(f"Failed to generate embeddings for batch: {e}")
+            continue
+
+        for (doc_id, doc), embedding in zip(pending, batch_embeddings):
             ids.append(doc_id)
-            documents_content.append(content)
+            documents_content.append(doc['content'])
             embeddings.append(embedding)
-            metadatas.append(metadata)
+            metadatas.append(doc['metadata'])
         
         # Add batch to collection
         if ids:
@@ -189,43 +209,139 @@ def add_documents_to_collection(documents: list[dict], collection, batch_size: i
                 logger.error(f"Failed to add batch to collection: {e}")
 
 
+def learn_templates(html_file_path: Path, sample_size: int, relearn: bool = False) -> dict[str, set[str]]:
+    """Learn or load the boilerplate template of every domain directory under the source"""
+    stripper = BoilerplateStripper(sample_size=sample_size)
+    samples = {}
+    for html_file in html_file_path.rglob("*.html"):
+        domain = html_file.parent.name
+        if domain in samples and len(samples[domain]) >= sample_size:
+            continue
+        samples.setdefault(domain, []).append(html_file)
+
+    templates = {}
+    for domain, files in samples.items():
+        if relearn:
+            stripper.forget(domain)
+        template = stripper.template(domain)
+        if template is None:
+            template = stripper.learn(domain, _read_samples(files))
+        templates[domain] = template
+    return templates
+
+
+def _read_samples(files: list[Path]) -> Iterator[str]:
+    """Sample pages' HTML, skipping files that cannot be read; the pipeline reports those itself"""
+    for f in files:
+        try:
+            yield f.read_text(encoding='utf-8')
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning(f"Skipping template sample {f}: {e}")
+
+
+def parse_args():
+    """Parse ingestion command line options"""
+    defaults = PipelineConfig()
+    parser = argparse.ArgumentParser(description="Convert, chunk, embed and index crawled HTML files")
+    parser.add_argument("--backend", choices=BACKENDS, default=RETRIEVAL_BACKEND,
+                        help="Retrieval backend to index into: a Chroma server or the embedded vector store")
+    parser.add_argument("--vector-storage", choices=list(STORAGE_DTYPES), default=VECTOR_STORAGE,
+                        help="Precision of the searched vectors in a new embedded collection")
+    parser.add_argument("--vector-dims", type=int, default=VECTOR_DIMS,
+                        help="Keep only the leading Matryoshka dimensions in the searched vectors of a new embedded collection")
+    parser.add_argument("--source", default="./html_downloads/ibx.com", help="Directory of HTML files to ingest")
+    parser.add_argument("--read-workers", type=int, default=defaults.read_workers)
+    parser.add_argument("--convert-processes", type=int, default=defaults.convert_processes)
+    parser.add_argument("--embed-workers", type=int, default=defaults.embed_workers)
+    parser.add_argument("--embed-batch-chunks", type=int, default=defaults.embed_batch_chunks,
+                        help="Chunks from several files gathered into one embedding call")
+    parser.add_argument("--write-workers", type=int, default=defaults.write_workers)
+    parser.add_argument("--queue-size", type=int, default=defaults.queue_size,
+                        help="Maximum documents buffered between two stages")
+    parser.add_argument("--chunk-tokens", type=int, default=defaults.chunk_tokens,
+                        help="Maximum embedding-model tokens per chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=defaults.chunk_overlap,
+                        help="Tokens of trailing context repeated at the start of the next chunk")
+    parser.add_argument("--write-batch-size", type=int, default=defaults.write_batch_size,
+                        help="Chunks per Chroma upsert request")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the on-disk embedding cache")
+    parser.add_argument("--manifest", default="ingest_manifest.db",
+                        help="SQLite manifest of indexed files used for incremental re-indexing")
+    parser.add_argument("--catalog", default="html_downloads/catalog.db",
+                        help="Document catalog written by the crawler, used to attach source URLs and titles")
+    parser.add_argument("--no-lexical", action="store_true",
+                        help="Do not add chunks to the BM25 lexical index")
+    parser.add_argument("--rebuild-lexical", action="store_true",
+                        help="Rebuild the BM25 lexical index from every chunk in the collection")
+    parser.add_argument("--full", action="store_true",
+                        help="Re-index every file, even those unchanged since the last run")
+    parser.add_argument("--no-dedupe", action="store_true",
+                        help="Store every chunk instead of collapsing near-duplicates")
+    parser.add_argument("--no-strip-templates", action="store_true",
+                        help="Keep repeated navigation, header and footer blocks")
+    parser.add_argument("--relearn-templates", action="store_true",
+                        help="Discard cached domain templates and learn them again")
+    parser.add_argument("--template-sample", type=int, default=50,
+                        help="Pages per domain used to learn its template")
+    return parser.parse_args()
+
+
 def main():
     """Main function to process HTML files and generate embeddings"""
+    args = parse_args()
     logger.info("Starting HTML files processing for embeddings generation...")
     
-    collection = create_or_get_collection()
+    collection = create_or_get_collection(backend=args.backend, storage=args.vector_storage, dims=args.vector_dims)
 
-    html_file_path = Path("./html_downloads/ibx.com")
+    html_file_path = Path(args.source)
     print(html_file_path)
-    
-    for html_file in html_file_path.rglob("*.html"):
-        md = md_converter.convert(html_file)
-        print(f"Processing {html_file.stem}")
-        
-        # Split content into 500 character chunks
-        chunks = wrap(md.text_content, width=500, break_long_words=False, break_on_hyphens=False)
-        
-        # Process each chunk
-        for i, chunk in enumerate(chunks):
-            if chunk.strip():  # Skip empty chunks
-                chunk_id = f"{html_file.stem}_chunk_{i}"
-                print(f"  Chunk {i}: {chunk[:100]}...")
-                
-                collection.add(
-                    ids=[chunk_id],
-                    documents=[chunk],
-                    metadatas=[{
-                        'filename': html_file.name,
-                        'chunk_index': i,
-                        'total_chunks': len(chunks),
-                        'chunk_size': len(chunk)
-                    }]
-                )
-            
-      
+
+    config = PipelineConfig(
+        read_workers=args.read_workers,
+        convert_processes=args.convert_processes,
+        embed_workers=args.embed_workers,
+        embed_batch_chunks=args.embed_batch_chunks,
+        write_workers=args.write_workers,
+        queue_size=args.queue_size,
+        write_batch_size=args.write_batch_size,
+        chunk_tokens=args.chunk_tokens,
+        chunk_overlap=args.chunk_overlap,
+    )
+    embed_fn = embedder.embed if args.no_cache else generate_embeddings
+    manifest = Manifest(args.manifest)
+    catalog = DocumentCatalog(args.catalog)
+    dedupe = None if args.no_dedupe else NearDuplicateIndex(manifest)
+    lexical = None if args.no_lexical else open_lexical_index("html_documents")
+    templates = {} if args.no_strip_templates else learn_templates(
+        html_file_path, args.template_sample, relearn=args.relearn_templates
+    )
+    pipeline = IngestionPipeline(collection, embed_fn, config, manifest=manifest, force=args.full,
+                                 dedupe=dedupe, templates=templates, catalog=catalog, lexical=lexical,
+                                 chunker=MarkdownChunker(args.chunk_tokens, args.chunk_overlap,
+                                                         load_token_counter(EMBEDDING_MODEL),
+                                                         tokenizer_name(EMBEDDING_MODEL)))
+    stats = pipeline.run(html_file_path.rglob("*.html"))
+    removed = pipeline.prune_missing(html_file_path)
+    if lexical is not None:
+        if args.rebuild_lexical:
+            lexical.rebuild_from(collection)
+        lexical.close()
+    manifest.close()
+    catalog.close()
+    close_collection(collection)
+
+    print("\nSummary:")
+    print(f"- Processed {stats.files} HTML files into {stats.chunks} chunks in {stats.elapsed:.1f}s")
+    print(f"- Skipped {stats.skipped} unchanged files, removed {removed} deleted files")
+    print(f"- Collapsed {stats.duplicate_chunks} near-duplicate chunks")
+    print(f"- Deleted {stats.deleted_chunks} stale chunks")
+    print(f"- Failed files: {stats.errors}, failed chunk writes: {stats.failed_chunks}")
+    if not args.no_cache:
+        cache = get_cached_embedder().cache
+        print(f"- Embedding cache: {cache.hits} hits, {cache.misses} misses")
     
     # # Load URL mapping
-    # url_mapping = load_url_mapping()
+    # catalog = load_catalog()
     
     # # Discover HTML files
     # html_files = discover_html_files('html_downloads/ibx.com')
@@ -238,7 +354,7 @@ def main():
     # documents = []
     # for html_file in html_files:
     #     try:
-    #         doc_data = process_html_file(html_file, url_mapping)
+    #         doc_data = process_html_file(html_file, catalog)
     #         if doc_data['content'].strip():  # Only add non-empty documents
     #             documents.append(doc_data)
     #     except Exception as e:
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, Optional
+
+import lxml.html
+
+logger = logging.getLogger(__name__)
+
+# Elements that commonly wrap a site's shared navigation, headers and footers
+BLOCK_TAGS = {'header', 'nav', 'footer', 'aside', 'div', 'section', 'ul', 'ol', 'form', 'table'}
+
+# Blocks with less text than this are cheap to keep and too generic to fingerprint
+MIN_BLOCK_CHARS = 20
+
+
+def _block_fingerprint(element) -> Optional[str]:
+    text = re.sub(r'\s+', ' ', element.text_content()).strip()
+    if len(text) < MIN_BLOCK_CHARS:
+        return None
+    return hashlib.sha1(f"{element.tag}\0{text}".encode('utf-8')).hexdigest()[:16]
+
+
+def _blocks(tree):
+    for element in tree.iter(*BLOCK_TAGS):
+        fingerprint = _block_fingerprint(element)
+        if fingerprint is not None:
+            yield element, fingerprint
+
+
+def page_fingerprints(html: str) -> set[str]:
+    """Fingerprints of every block-level element in a page"""
+    return {fingerprint for _, fingerprint in _blocks(lxml.html.fromstring(html))}
+
+
+def strip_template(html: str, template: set[str]) -> str:
+    """Remove every block whose fingerprint is part of the domain template"""
+    if not template or not html.strip():
+        return html
+    tree = lxml.html.fromstring(html)
+    matches = [element for element, fingerprint in _blocks(tree) if fingerprint in template]
+    if not matches:
+        return html
+    for element in matches:
+        element.drop_tree()
+    return lxml.html.tostring(tree, encoding='unicode')
+
+
+class BoilerplateStripper:
+    """Learns which DOM blocks repeat across a domain's pages and strips them
+
+    A block (nav, header, footer, div, ...) is part of the domain template when
+    the same tag and text appear on at least ``threshold`` of the first
+    ``sample_size`` pages seen for that domain. Learned templates are cached as
+    JSON under ``cache_dir`` so later runs strip from the first page on.
+    Until a domain's sample is complete pages pass through unchanged; call
+    ``finish`` at the end of a crawl to learn templates from smaller samples.
+    """
+
+    def __init__(self, cache_dir: str = ".template_cache", sample_size: int = 50,
+                 threshold: float = 0.6, min_pages: int = 5):
+        self.cache_dir = Path(cache_dir)
+        self.sample_size = sample_size
+        self.threshold = threshold
+        self.min_pages = min_pages
+        self.lock = threading.Lock()
+        self.templates = {}
+        self.observations = {}
+
+    def _cache_file(self, domain: str) -> Path:
+        return self.cache_dir / f"{re.sub(r'[^A-Za-z0-9_.-]', '_', domain)}.json"
+
+    def template(self, domain: str) -> Optional[set[str]]:
+        """Return the learned template for a domain, loading it from the cache if needed"""
+        with self.lock:
+            if domain not in self.templates:
+                cache_file = self._cache_file(domain)
+                if not cache_file.exists():
+                    return None
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    self.templates[domain] = set(json.load(f)['blocks'])
+                logger.info(f"Loaded template for {domain} ({len(self.templates[domain])} blocks)")
+            return self.templates[domain]
+
+    def learn(self, domain: str, pages: Iterable[str]) -> set[str]:
+        """Learn and cache a domain template from a sample of page HTML"""
+        for html in pages:
+            self._observe(domain, html)
+        with self.lock:
+            return self._freeze(domain)
+
+    def finish(self) -> list[str]:
+        """Learn templates for domains whose sample never filled but has ``min_pages`` pages
+
+        Returns the domains that got a template.
+        """
+        with self.lock:
+            domains = [domain for domain, (pages, _) in self.observations.items() if pages >= self.min_pages]
+            for domain in domains:
+                self._freeze(domain)
+        return domains
+
+    def forget(self, domain: str):
+        with self.lock:
+            self.templates.pop(domain, None)
+            self.observations.pop(domain, None)
+            self._cache_file(domain).unlink(missing_ok=True)
+
+    def strip(self, domain: str, html: str) -> str:
+        """Strip template blocks, learning the template from pages seen so far if needed"""
+        template = self.template(domain)
+        if template is None:
+            self._observe(domain, html)
+            with self.lock:
+                pages, _ = self.observations.get(domain, (0, None))
+                if pages >= self.sample_size:
+                    template = self._freeze(domain)
+        return strip_template(html, template) if template else html
+
+    def _observe(self, domain: str, html: str):
+        try:
+            fingerprints = page_fingerprints(html)
+        except Exception as e:
+            logger.warning(f"Could not parse page for template learning: {e}")
+            return
+        with self.lock:
+            pages, counts = self.observations.setdefault(domain, (0, Counter()))
+            counts.update(fingerprints)
+            self.observations[domain] = (pages + 1, counts)
+
+    def _freeze(self, domain: str) -> set[str]:
+        # Caller holds self.lock
+        if domain in self.templates:
+            return self.templates[domain]
+        pages, counts = self.observations.pop(domain, (0, Counter()))
+        if pages < self.min_pages:
+            logger.warning(f"Only {pages} pages seen for {domain}; not learning a template")
+            return set()
+
+        template = {fingerprint for fingerprint, count in counts.items() if count / pages >= self.threshold}
+        self.templates[domain] = template
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self._cache_file(domain), 'w', encoding='utf-8') as f:
+            json.dump({'domain': domain, 'pages': pages, 'blocks': sorted(template)}, f, indent=2)
+        logger.info(f"Learned template for {domain}: {len(template)} repeated blocks from {pages} pages")
+        return template
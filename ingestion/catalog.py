@@ -0,0 +1,96 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(path) -> str:
+    return os.path.normpath(str(path))
+
+
+class DocumentCatalog:
+    """SQLite catalog of downloaded pages, indexed by URL, local path and content hash
+
+    Replaces ``url_mapping.json``: the crawler appends one row per saved page
+    instead of rewriting the whole mapping, and the ingester looks pages up
+    by path without loading or scanning every entry. An existing
+    ``url_mapping.json`` next to the database is imported when the catalog
+    is first created.
+    """
+
+    def __init__(self, db_path: str = "html_downloads/catalog.db"):
+        self.lock = threading.Lock()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.con = sqlite3.connect(db_path, check_same_thread=False)
+        self.con.row_factory = sqlite3.Row
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("PRAGMA synchronous=NORMAL")
+        with self.con:
+            exists = self.con.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='pages'"
+            ).fetchone()
+            self.con.execute(
+                "CREATE TABLE IF NOT EXISTS pages("
+                "url TEXT PRIMARY KEY, local_file_path TEXT NOT NULL, filename TEXT NOT NULL, "
+                "title TEXT NOT NULL DEFAULT '', timestamp TEXT NOT NULL, size_bytes INTEGER NOT NULL, "
+                "content_hash TEXT)"
+            )
+            self.con.execute("CREATE INDEX IF NOT EXISTS pages_path ON pages(local_file_path)")
+            self.con.execute("CREATE INDEX IF NOT EXISTS pages_hash ON pages(content_hash)")
+        if not exists:
+            self.import_mapping(Path(db_path).parent / "url_mapping.json")
+
+    def import_mapping(self, mapping_file: Path) -> int:
+        """Load entries from a legacy ``url_mapping.json``"""
+        if not mapping_file.exists():
+            return 0
+        with open(mapping_file, 'r', encoding='utf-8') as f:
+            mapping = json.load(f)
+        with self.lock, self.con:
+            self.con.executemany(
+                "INSERT OR IGNORE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(url, _normalize(info['local_file_path']), info.get('filename', ''), info.get('title', ''),
+                  info.get('timestamp', ''), info.get('size_bytes', 0), None) for url, info in mapping.items()]
+            )
+        logger.info(f"Imported {len(mapping)} entries from {mapping_file}")
+        return len(mapping)
+
+    def add(self, url: str, local_file_path: str, title: str = "", timestamp: Optional[str] = None,
+            size_bytes: int = 0, content_hash: Optional[str] = None):
+        with self.lock, self.con:
+            self.con.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, _normalize(local_file_path), Path(local_file_path).name, title or '',
+                 timestamp or datetime.now().isoformat(), size_bytes, content_hash)
+            )
+
+    def _one(self, column: str, value: str) -> Optional[dict]:
+        with self.lock:
+            row = self.con.execute(f"SELECT * FROM pages WHERE {column}=? LIMIT 1", (value,)).fetchone()
+        return dict(row) if row else None
+
+    def by_url(self, url: str) -> Optional[dict]:
+        return self._one('url', url)
+
+    def by_path(self, path) -> Optional[dict]:
+        return self._one('local_file_path', _normalize(path))
+
+    def by_hash(self, content_hash: str) -> list[dict]:
+        """Every page saved with this exact content"""
+        with self.lock:
+            rows = self.con.execute("SELECT * FROM pages WHERE content_hash=?", (content_hash,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.con.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.con.close()
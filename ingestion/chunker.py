@@ -0,0 +1,202 @@
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Hugging Face tokenizers matching the Ollama embedding and generation models we use
+TOKENIZERS = {
+    'nomic-embed-text': 'nomic-ai/nomic-embed-text-v1.5',
+    'qwen3': 'Qwen/Qwen3-8B',
+}
+
+_HEADING = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+_FENCE = re.compile(r'^\s*(```|~~~)')
+_LIST_ITEM = re.compile(r'^\s*([-*+]|\d+[.)])\s+')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+_TOKEN_ESTIMATE = re.compile(r'\w+|[^\w\s]')
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate WordPiece token count: words and punctuation plus a margin for sub-words"""
+    return int(len(_TOKEN_ESTIMATE.findall(text)) * 1.2) + 1
+
+
+def tokenizer_name(model: str) -> Optional[str]:
+    """The Hugging Face tokenizer configured for a model, if any"""
+    return TOKENIZERS.get(model.split(':')[0])
+
+
+def load_token_counter(model: str) -> Callable[[str], int]:
+    """Return a token counter for an embedding model, falling back to an estimate"""
+    name = tokenizer_name(model)
+    if name:
+        try:
+            from tokenizers import Tokenizer
+            tokenizer = Tokenizer.from_pretrained(name)
+            return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+        except Exception as e:
+            logger.warning(f"Could not load tokenizer {name} ({e}); estimating token counts")
+    return estimate_tokens
+
+
+@dataclass
+class Chunk:
+    text: str
+    headings: list[str] = field(default_factory=list)
+    tokens: int = 0
+
+    @property
+    def breadcrumb(self) -> str:
+        return ' > '.join(self.headings)
+
+
+def _blocks(lines: Iterable[str]) -> Iterator[tuple[str, str]]:
+    """Group markdown lines into ('heading' | 'table' | 'code' | 'list' | 'text', block) pairs"""
+    kind, buffer = None, []
+
+    def flush():
+        nonlocal kind, buffer
+        if buffer and any(line.strip() for line in buffer):
+            yield kind, '\n'.join(buffer).strip('\n')
+        kind, buffer = None, []
+
+    for line in lines:
+        line = line.rstrip('\n')
+        if kind == 'code':
+            buffer.append(line)
+            if _FENCE.match(line):
+                yield from flush()
+            continue
+        if _FENCE.match(line):
+            yield from flush()
+            kind, buffer = 'code', [line]
+            continue
+        if _HEADING.match(line):
+            yield from flush()
+            yield 'heading', line
+            continue
+        if not line.strip():
+            yield from flush()
+            continue
+
+        line_kind = 'table' if line.lstrip().startswith('|') else 'list' if _LIST_ITEM.match(line) else 'text'
+        if kind == 'list' and line_kind == 'text' and line.startswith((' ', '\t')):
+            line_kind = 'list'  # continuation of a list item
+        if kind is not None and line_kind != kind:
+            yield from flush()
+        kind = line_kind
+        buffer.append(line)
+    yield from flush()
+
+
+class MarkdownChunker:
+    """Splits markdown into token-sized chunks along its structure
+
+    Chunks never cross a heading, so each one belongs to a single section and
+    starts with that section's heading breadcrumb. Paragraphs, lists, tables
+    and code blocks are packed whole up to ``max_tokens``; a block too large on
+    its own is split by rows (tables keep their header row), lines, sentences
+    and finally words. Consecutive chunks of the same section share up to
+    ``overlap_tokens`` of trailing text. Input is consumed line by line.
+    ``tokenizer`` names the configured tokenizer for the index settings,
+    whether or not ``count_tokens`` could load it.
+    """
+
+    def __init__(self, max_tokens: int = 384, overlap_tokens: int = 48,
+                 count_tokens: Callable[[str], int] = estimate_tokens, tokenizer: Optional[str] = None):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.count_tokens = count_tokens
+        self.tokenizer = tokenizer
+
+    def chunk(self, markdown: str) -> list[Chunk]:
+        return list(self.iter_chunks(markdown.splitlines()))
+
+    def iter_chunks(self, lines: Iterable[str]) -> Iterator[Chunk]:
+        headings = []
+        pieces, tokens = [], 0
+
+        def emit(carry_overlap: bool):
+            nonlocal pieces, tokens
+            if not pieces:
+                return
+            prefix = f"{' > '.join(headings)}\n\n" if headings else ""
+            text = prefix + '\n\n'.join(pieces)
+            yield Chunk(text=text, headings=list(headings), tokens=self.count_tokens(text))
+            pieces, tokens = (self._overlap(pieces) if carry_overlap else []), 0
+            tokens = sum(self.count_tokens(piece) for piece in pieces)
+
+        for kind, block in _blocks(lines):
+            if kind == 'heading':
+                yield from emit(carry_overlap=False)
+                match = _HEADING.match(block)
+                level = len(match.group(1))
+                headings = headings[:level - 1] + [match.group(2)]
+                continue
+
+            budget = self.max_tokens - self.count_tokens(' > '.join(headings)) - 2
+            for piece in self._split(kind, block, max(budget, self.max_tokens // 4)):
+                piece_tokens = self.count_tokens(piece)
+                if pieces and tokens + piece_tokens > budget:
+                    yield from emit(carry_overlap=True)
+                    if pieces and tokens + piece_tokens > budget:
+                        pieces, tokens = [], 0
+                pieces.append(piece)
+                tokens += piece_tokens
+        yield from emit(carry_overlap=False)
+
+    def _overlap(self, pieces: list[str]) -> list[str]:
+        """Trailing sentences of the previous chunk, up to the overlap budget"""
+        if self.overlap_tokens <= 0:
+            return []
+        sentences = _SENTENCE_END.split(pieces[-1])
+        carried, tokens = [], 0
+        for sentence in reversed(sentences):
+            sentence_tokens = self.count_tokens(sentence)
+            if tokens + sentence_tokens > self.overlap_tokens:
+                break
+            carried.insert(0, sentence)
+            tokens += sentence_tokens
+        return [' '.join(carried)] if carried else []
+
+    def _split(self, kind: str, block: str, budget: int) -> Iterator[str]:
+        if self.count_tokens(block) <= budget:
+            yield block
+            return
+
+        if kind == 'table':
+            rows = block.split('\n')
+            header = rows[:2] if len(rows) > 1 and set(rows[1].replace('|', '').strip()) <= set('-: ') else rows[:1]
+            yield from self._pack(rows[len(header):], budget, '\n', prefix='\n'.join(header))
+        elif '\n' in block:
+            yield from self._pack(block.split('\n'), budget, '\n')
+        else:
+            sentences = _SENTENCE_END.split(block)
+            yield from self._pack(sentences if len(sentences) > 1 else block.split(' '), budget, ' ')
+
+    def _pack(self, parts: list[str], budget: int, separator: str, prefix: str = "") -> Iterator[str]:
+        current, tokens = [], self.count_tokens(prefix) if prefix else 0
+        base = tokens
+        for part in parts:
+            part_tokens = self.count_tokens(part)
+            if part_tokens > budget - base:
+                # Still too large: recurse on the finer-grained pieces of this part
+                if current:
+                    yield separator.join(([prefix] if prefix else []) + current)
+                    current, tokens = [], base
+                if ' ' in part.strip():
+                    yield from self._split('text', part, budget)
+                else:
+                    yield part
+                continue
+            if current and tokens + part_tokens > budget:
+                yield separator.join(([prefix] if prefix else []) + current)
+                current, tokens = [], base
+            current.append(part)
+            tokens += part_tokens
+        if current:
+            yield separator.join(([prefix] if prefix else []) + current)
@@ -0,0 +1,125 @@
+import hashlib
+import re
+
+import numpy as np
+
+from ingestion.manifest import Manifest
+
+BANDS = 4
+BAND_BITS = 64 // BANDS
+
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """64-bit SimHash of the word shingles in ``text``
+
+    Texts that share most of their shingles get fingerprints that differ in
+    only a few bits, so near-duplicates can be found by Hamming distance.
+    """
+    words = re.findall(r'\w+', text.lower())
+    if len(words) > shingle_size:
+        features = [' '.join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)]
+    else:
+        features = [' '.join(words)]
+
+    digests = b''.join(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest() for feature in features)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(len(features), 64)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(features)
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), 'big')
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _bands(value: int) -> list[int]:
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (i * BAND_BITS)) & mask for i in range(BANDS)]
+
+
+class NearDuplicateIndex:
+    """Streaming SimHash LSH index that maps near-duplicate chunks to one canonical ID
+
+    Each fingerprint is split into four 16-bit bands stored in indexed
+    columns of the manifest database. Any two fingerprints within Hamming
+    distance 3 agree on at least one band, so a lookup only needs to compare
+    the rows sharing a band with the new chunk. Chunk IDs are derived from the
+    fingerprint of the first chunk seen with that content, so an ID always
+    refers to the same text no matter which page produced it.
+    """
+
+    def __init__(self, manifest: Manifest, max_distance: int = 3):
+        if max_distance >= BANDS:
+            raise ValueError(f"max_distance must be below {BANDS} for banded lookups to find every match")
+        self.manifest = manifest
+        self.max_distance = max_distance
+        self.duplicates = 0
+        # IDs queued for writing whose files are not recorded in the manifest yet
+        self.claimed = set()
+        with manifest.lock, manifest.con:
+            manifest.con.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints("
+                "chunk_id TEXT PRIMARY KEY, simhash INTEGER NOT NULL, "
+                "b0 INTEGER NOT NULL, b1 INTEGER NOT NULL, b2 INTEGER NOT NULL, b3 INTEGER NOT NULL)"
+            )
+            for band in range(BANDS):
+                manifest.con.execute(f"CREATE INDEX IF NOT EXISTS fingerprints_b{band} ON fingerprints(b{band})")
+
+    def assign(self, chunks: list[str]) -> list[tuple[str, bool]]:
+        """Return ``(chunk_id, needs_write)`` for each chunk
+
+        A chunk matching an indexed fingerprint reuses its ID. It only needs
+        to be written when no indexed file references that ID and no write
+        for it is already in flight, which also covers a canonical chunk
+        whose write failed in an earlier run.
+        """
+        results = []
+        with self.manifest.lock:
+            for chunk in chunks:
+                fingerprint = simhash(chunk)
+                chunk_id = self._match(fingerprint)
+                if chunk_id is None:
+                    chunk_id = f"chunk_{fingerprint:016x}"
+                    with self.manifest.con:
+                        self.manifest.con.execute(
+                            "INSERT OR IGNORE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?)",
+                            (chunk_id, _signed(fingerprint), *_bands(fingerprint))
+                        )
+                    self.claimed.add(chunk_id)
+                    results.append((chunk_id, True))
+                    continue
+
+                needs_write = chunk_id not in self.claimed and self.manifest.con.execute(
+                    "SELECT 1 FROM chunk_refs WHERE chunk_id=? LIMIT 1", (chunk_id,)
+                ).fetchone() is None
+                if needs_write:
+                    self.claimed.add(chunk_id)
+                else:
+                    self.duplicates += 1
+                results.append((chunk_id, needs_write))
+        return results
+
+    def release(self, chunk_ids: list[str]):
+        """Forget in-flight claims once the chunks are written and referenced"""
+        with self.manifest.lock:
+            self.claimed.difference_update(chunk_ids)
+
+    def _match(self, fingerprint: int):
+        bands = _bands(fingerprint)
+        rows = self.manifest.con.execute(
+            "SELECT chunk_id, simhash FROM fingerprints WHERE b0=? OR b1=? OR b2=? OR b3=?", bands
+        )
+        best, best_distance = None, self.max_distance + 1
+        for chunk_id, other in rows:
+            distance = hamming(fingerprint, other & ((1 << 64) - 1))
+            if distance < best_distance:
+                best, best_distance = chunk_id, distance
+        return best
+
+    def remove(self, chunk_ids: list[str]):
+        with self.manifest.lock, self.manifest.con:
+            self.manifest.con.executemany("DELETE FROM fingerprints WHERE chunk_id=?", [(i,) for i in chunk_ids])
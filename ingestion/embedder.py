@@ -0,0 +1,142 @@
+import logging
+import threading
+import time
+from typing import Optional
+
+import httpx
+import ollama
+
+logger = logging.getLogger(__name__)
+
+# Server responses worth retrying as they are; anything else is taken as a problem with the batch
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class EmbeddingError(Exception):
+    """Raised when a text cannot be embedded after splitting and retries"""
+
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code in TRANSIENT_STATUS
+    return isinstance(error, (ConnectionError, TimeoutError, httpx.TransportError))
+
+
+class BatchEmbedder:
+    """Embeds many texts per Ollama request with an adaptively sized batch
+
+    The batch size grows while requests finish under ``target_latency`` and
+    shrinks when they run over it, so throughput tracks whatever the embedding
+    server can sustain. Batches are also capped by total characters so a few
+    long chunks cannot produce an oversized payload. Transient failures
+    (timeouts, lost connections, 429 and 5xx responses) are retried with
+    exponential backoff. A batch the server rejects, or keeps failing with an
+    error response, is split in half and each half retried, isolating a bad
+    input instead of failing every chunk sent alongside it; only rejections
+    shrink later batches. Once retries run out on an unreachable server the
+    batch fails rather than being split into more requests.
+    """
+
+    def __init__(
+        self,
+        model: str = "nomic-embed-text:latest",
+        client: Optional[ollama.Client] = None,
+        initial_batch_size: int = 32,
+        min_batch_size: int = 1,
+        max_batch_size: int = 512,
+        max_batch_chars: int = 200_000,
+        target_latency: float = 1.0,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+    ):
+        self.model = model
+        self.client = client or ollama.Client()
+        self.batch_size = initial_batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_batch_chars = max_batch_chars
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.texts = 0
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        """Embed ``texts`` and return one vector per text, in order"""
+        embeddings = []
+        for batch in self._batches(texts):
+            embeddings.extend(self._embed_batch(batch))
+        return embeddings
+
+    def embed_one(self, text: str) -> list[float]:
+        return self.embed([text])[0]
+
+    def _batches(self, texts: list[str]):
+        start = 0
+        while start < len(texts):
+            limit = self.batch_size
+            end, chars = start, 0
+            while end < len(texts) and end - start < limit:
+                if end > start and chars + len(texts[end]) > self.max_batch_chars:
+                    break
+                chars += len(texts[end])
+                end += 1
+            yield texts[start:end]
+            start = end
+
+    def _embed_batch(self, batch: list[str]) -> list[list[float]]:
+        attempt = 0
+        while True:
+            try:
+                return self._request(batch)
+            except Exception as e:
+                transient = _is_transient(e)
+                attempt += 1
+                if transient and attempt < self.max_retries:
+                    delay = self.retry_backoff * (2 ** (attempt - 1))
+                    logger.warning(f"Embedding attempt {attempt}/{self.max_retries} failed ({e}); retrying in {delay:.1f}s")
+                    time.sleep(delay)
+                    continue
+                if len(batch) > 1 and (not transient or isinstance(e, ollama.ResponseError)):
+                    if not transient:
+                        # Oversized or poisoned batch: shrink future batches
+                        self._resize(len(batch) // 2)
+                    mid = len(batch) // 2
+                    logger.warning(f"Embedding batch of {len(batch)} failed ({e}); splitting")
+                    return self._embed_batch(batch[:mid]) + self._embed_batch(batch[mid:])
+                raise EmbeddingError(f"Failed to embed {len(batch)} texts after {attempt} attempts: {e}") from e
+
+    def _request(self, batch: list[str]) -> list[list[float]]:
+        started = time.perf_counter()
+        response = self.client.embed(model=self.model, input=batch)
+        elapsed = time.perf_counter() - started
+
+        embeddings = response['embeddings']
+        if len(embeddings) != len(batch):
+            raise EmbeddingError(f"Expected {len(batch)} embeddings, got {len(embeddings)}")
+
+        with self.lock:
+            self.requests += 1
+            self.texts += len(batch)
+        self._adapt(len(batch), elapsed)
+        return embeddings
+
+    def _adapt(self, size: int, elapsed: float):
+        """Grow the batch while under the latency target, shrink when over it"""
+        if size < self.batch_size:
+            # A short tail batch says nothing about whether larger ones are safe
+            if elapsed > self.target_latency:
+                self._resize(int(self.batch_size * 0.75))
+            return
+        if elapsed < self.target_latency / 2:
+            self._resize(int(self.batch_size * 1.5) + 1)
+        elif elapsed > self.target_latency:
+            self._resize(int(self.batch_size * 0.75))
+
+    def _resize(self, size: int):
+        with self.lock:
+            size = max(self.min_batch_size, min(self.max_batch_size, size))
+            if size != self.batch_size:
+                logger.debug(f"Embedding batch size {self.batch_size} -> {size}")
+                self.batch_size = size
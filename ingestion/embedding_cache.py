@@ -0,0 +1,184 @@
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different copies of a chunk share a key"""
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """Content-addressed on-disk cache of embeddings for a single model
+
+    Vectors live in a fixed-capacity memory-mapped float32 array
+    (``vectors.f32``) and a SQLite index (``index.db``) maps the hash of each
+    normalized text to its row. The capacity is derived from ``max_bytes`` once
+    the vector dimension is known; when it is full the least recently used
+    rows are evicted and reused.
+    """
+
+    def __init__(self, cache_dir: str, model: str, max_bytes: int = 1 << 30, evict_fraction: float = 0.1):
+        self.model = model
+        self.max_bytes = max_bytes
+        self.evict_fraction = evict_fraction
+        self.directory = Path(cache_dir) / re.sub(r'[^A-Za-z0-9_.-]', '_', model)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.directory / "vectors.f32"
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.con = sqlite3.connect(self.directory / "index.db", check_same_thread=False)
+        with self.con:
+            self.con.execute("CREATE TABLE IF NOT EXISTS meta(name TEXT PRIMARY KEY, value INTEGER)")
+            self.con.execute(
+                "CREATE TABLE IF NOT EXISTS entries(key TEXT PRIMARY KEY, slot INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self.con.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used)")
+
+        meta = dict(self.con.execute("SELECT name, value FROM meta"))
+        self.dim = meta.get('dim')
+        self.capacity = meta.get('capacity')
+        self.next_slot = meta.get('next_slot', 0)
+        self.vectors = None
+        self.free_slots = []
+        if self.dim:
+            self._open_vectors()
+            used = {slot for (slot,) in self.con.execute("SELECT slot FROM entries")}
+            self.free_slots = [slot for slot in range(self.next_slot) if slot not in used]
+
+    def _open_vectors(self):
+        mode = 'r+' if self.vectors_path.exists() else 'w+'
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode=mode, shape=(self.capacity, self.dim))
+
+    def _initialize(self, dim: int):
+        self.dim = dim
+        self.capacity = max(1, self.max_bytes // (dim * 4))
+        with self.con:
+            self.con.executemany(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                [('dim', self.dim), ('capacity', self.capacity), ('next_slot', 0)]
+            )
+        self._open_vectors()
+        logger.info(f"Created embedding cache for {self.model}: {self.capacity} vectors of dim {dim}")
+
+    def get_many(self, texts: list[str]) -> list[Optional[list[float]]]:
+        """Return the cached vector for each text, or None where missing"""
+        keys = [text_key(text) for text in texts]
+        with self.lock:
+            if self.vectors is None:
+                self.misses += len(texts)
+                return [None] * len(texts)
+
+            slots = self._slots(list(set(keys)))
+            if slots:
+                now = time.time()
+                with self.con:
+                    self.con.executemany("UPDATE entries SET last_used=? WHERE key=?", [(now, key) for key in slots])
+
+            results = [self.vectors[slots[key]].tolist() if key in slots else None for key in keys]
+            hits = sum(result is not None for result in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+            return results
+
+    def put_many(self, texts: list[str], vectors: list[list[float]]):
+        """Store vectors for texts, evicting least recently used rows when full"""
+        if not texts:
+            return
+        with self.lock:
+            if self.vectors is None:
+                self._initialize(len(vectors[0]))
+
+            batch = dict(zip((text_key(text) for text in texts), vectors))
+            slots = self._slots(list(batch))
+            new = [key for key in batch if key not in slots]
+            # Make room before assigning any slot, so an eviction cannot free a slot this batch already uses
+            shortfall = len(new) - len(self.free_slots) - (self.capacity - self.next_slot)
+            if shortfall > 0:
+                self._evict(shortfall, keep=set(slots))
+            for key in new:
+                slot = self._allocate()
+                if slot is None:
+                    break
+                slots[key] = slot
+
+            now = time.time()
+            for key, slot in slots.items():
+                self.vectors[slot] = batch[key]
+            self.vectors.flush()
+            with self.con:
+                self.con.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                                     [(key, slot, now) for key, slot in slots.items()])
+                self.con.execute("INSERT OR REPLACE INTO meta VALUES ('next_slot', ?)", (self.next_slot,))
+
+    def _slots(self, keys: list[str]) -> dict[str, int]:
+        slots = {}
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            placeholders = ','.join('?' * len(part))
+            slots.update(self.con.execute(f"SELECT key, slot FROM entries WHERE key IN ({placeholders})", part))
+        return slots
+
+    def _allocate(self) -> Optional[int]:
+        if self.free_slots:
+            return self.free_slots.pop()
+        if self.next_slot < self.capacity:
+            self.next_slot += 1
+            return self.next_slot - 1
+        return None
+
+    def _evict(self, needed: int, keep: set[str]):
+        """Free at least ``needed`` slots, never those of the ``keep`` keys"""
+        count = max(needed, int(self.capacity * self.evict_fraction))
+        rows = self.con.execute(
+            "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (count + len(keep),)
+        ).fetchall()
+        victims = [(key, slot) for key, slot in rows if key not in keep][:count]
+        with self.con:
+            self.con.executemany("DELETE FROM entries WHERE key=?", [(key,) for key, _ in victims])
+        self.free_slots.extend(slot for _, slot in victims)
+        logger.info(f"Evicted {len(victims)} vectors from embedding cache for {self.model}")
+
+    def close(self):
+        with self.lock:
+            if self.vectors is not None:
+                self.vectors.flush()
+            self.con.close()
+
+
+class CachedEmbedder:
+    """Wraps a batch embedding function so only cache misses are embedded"""
+
+    def __init__(self, embed_fn: Callable[[list[str]], list[list[float]]], cache: EmbeddingCache):
+        self.embed_fn = embed_fn
+        self.cache = cache
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        results = self.cache.get_many(texts)
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            # Embed each distinct missing text once, even if it repeats in this call
+            unique = {}
+            for i in missing:
+                unique.setdefault(text_key(texts[i]), texts[i])
+            vectors = self.embed_fn(list(unique.values()))
+            self.cache.put_many(list(unique.values()), vectors)
+            embedded = dict(zip(unique, vectors))
+            for i in missing:
+                results[i] = embedded[text_key(texts[i])]
+        return results
@@ -0,0 +1,236 @@
+import hashlib
+import json
+import logging
+import threading
+from functools import partial
+from pathlib import Path
+from typing import Optional
+
+from ingestion.chunker import MarkdownChunker
+from ingestion.dedupe import NearDuplicateIndex
+from ingestion.manifest import Manifest
+from ingestion.writer import BulkWriter
+from retrieval.backend import bump_version
+from retrieval.lexical import LexicalIndex
+
+logger = logging.getLogger(__name__)
+
+
+def chunk_records(path: Path, chunks: list[str], ids: Optional[list[str]] = None,
+                  chunk_metadata: Optional[list[dict]] = None) -> tuple[list[str], list[dict]]:
+    """Build the Chroma IDs and metadata for the chunks of one source file"""
+    total = len(chunks)
+    if ids is None:
+        ids = [f"{path.stem}_chunk_{i}" for i in range(total)]
+    metadatas = [{
+        'filename': path.name,
+        'chunk_index': i,
+        'total_chunks': total,
+        'chunk_size': len(chunk)
+    } for i, chunk in enumerate(chunks)]
+    if chunk_metadata:
+        for metadata, extra in zip(metadatas, chunk_metadata):
+            metadata.update(extra)
+    return ids, metadatas
+
+
+def config_fingerprint(chunker: MarkdownChunker, dedupe: Optional[NearDuplicateIndex] = None,
+                       template: Optional[set[str]] = None) -> str:
+    """Short hash of the settings that decide a file's chunks
+
+    Stored with each file's content hash, so changing the chunk size, the
+    tokenizer, near-duplicate collapsing or the domain template re-indexes
+    the file even though its content is unchanged.
+    """
+    settings = {
+        'chunk_tokens': chunker.max_tokens,
+        'chunk_overlap': chunker.overlap_tokens,
+        'tokenizer': chunker.tokenizer,
+        'dedupe': dedupe.max_distance if dedupe is not None else None,
+        'template': sorted(template or ()),
+    }
+    return hashlib.sha256(json.dumps(settings).encode('utf-8')).hexdigest()[:16]
+
+
+class ChunkIndexer:
+    """Writes the chunks of each source file and keeps the manifest consistent
+
+    Used by both the batch ingestion pipeline and the crawler's indexing
+    pipeline. With a ``dedupe`` index, near-duplicate chunks map to one
+    canonical ID and only the first copy is embedded and stored. Chunks that
+    a file no longer produces are collected while writes are in flight and
+    deleted by ``finish`` once no file in the manifest references them. With
+    a ``lexical`` index, stored chunks are also indexed for BM25 search.
+
+    A collapsed chunk keeps the filename, position, URL and title of the
+    page it was first stored for. Its ``sources`` metadata lists every file
+    it was found in and is updated as each file is written, so a search
+    during ingestion already sees a shared chunk as shared. ``finish``
+    rewrites the lists from the manifest, which also drops files that no
+    longer produce the chunk.
+    """
+
+    def __init__(self, collection, writer: BulkWriter, manifest: Optional[Manifest] = None,
+                 dedupe: Optional[NearDuplicateIndex] = None, lexical: Optional[LexicalIndex] = None):
+        if dedupe is not None and manifest is None:
+            raise ValueError("Near-duplicate elimination needs a manifest to track shared chunks")
+        self.collection = collection
+        self.writer = writer
+        self.manifest = manifest
+        self.dedupe = dedupe
+        self.lexical = lexical
+        self.lock = threading.Lock()
+        self.stale = set()
+        self.shared = set()
+        # Chunks claimed by files that were never written and not stored since
+        self.abandoned = set()
+        # Sources of chunks with writes in flight: chunk ID -> [file names, writes in flight]
+        self.sources = {}
+
+    def assign(self, path: Path, chunks: list[str]) -> tuple[list[str], list[bool]]:
+        """Return the chunk IDs for a file and which of those chunks must be embedded and stored"""
+        if self.dedupe is None:
+            ids, _ = chunk_records(path, chunks)
+            return ids, [True] * len(ids)
+        assigned = self.dedupe.assign(chunks)
+        return [chunk_id for chunk_id, _ in assigned], [needs_write for _, needs_write in assigned]
+
+    def write(self, path: Path, digest: str, chunks: list[str], ids: list[str], needs_write: list[bool],
+              embeddings: list[list[float]], extra_metadata: Optional[dict] = None,
+              chunk_metadata: Optional[list[dict]] = None) -> int:
+        """Queue the chunks flagged in ``needs_write``; ``embeddings`` holds one vector per such chunk"""
+        _, metadatas = chunk_records(path, chunks, ids, chunk_metadata)
+        if extra_metadata:
+            for metadata in metadatas:
+                metadata.update(extra_metadata)
+
+        rows = [row for row, write in zip(zip(ids, chunks, metadatas), needs_write) if write]
+        previous = set(self.manifest.get_chunk_ids(str(path))) if self.manifest is not None else set()
+        with self.lock:
+            self.stale.update(previous - set(ids))
+            updates = {}
+            if self.dedupe is not None:
+                self.shared.update(chunk_id for chunk_id, write in zip(ids, needs_write) if not write)
+                sources = self._add_sources(path.name, ids)
+                for chunk_id, _, metadata in rows:
+                    metadata.update(sources[chunk_id])
+                updates = {chunk_id: sources[chunk_id] for chunk_id, write in zip(ids, needs_write) if not write}
+        on_written = None
+        if self.manifest is not None or self.lexical is not None:
+            # Only mark the file indexed once its chunks are actually stored
+            on_written = partial(self._written, str(path), digest, ids, rows, updates)
+
+        self.writer.add(
+            ids=[chunk_id for chunk_id, _, _ in rows],
+            documents=[chunk for _, chunk, _ in rows],
+            embeddings=embeddings,
+            metadatas=[metadata for _, _, metadata in rows],
+            on_written=on_written,
+            updates=updates
+        )
+        return len(rows)
+
+    def abandon(self, ids: list[str], needs_write: list[bool]):
+        """Give up on a file that was assigned chunk IDs but will not be written
+
+        Releases the chunks it claimed, so the next file producing them stores
+        them, and has ``finish`` invalidate files that referenced them meanwhile.
+        """
+        if self.dedupe is None:
+            return
+        claimed = [chunk_id for chunk_id, write in zip(ids, needs_write) if write]
+        with self.lock:
+            self.abandoned.update(claimed)
+        self.dedupe.release(claimed)
+
+    def _add_sources(self, name: str, ids: list[str]) -> dict[str, dict]:
+        """Add a file to the sources of its chunks, returning each chunk's sources metadata"""
+        # Caller holds self.lock
+        metadata = {}
+        for chunk_id in dict.fromkeys(ids):
+            entry = self.sources.get(chunk_id)
+            if entry is None:
+                names = {Path(path).name for path in self.manifest.referencing_paths(chunk_id)}
+                entry = self.sources[chunk_id] = [names, 0]
+            entry[0].add(name)
+            entry[1] += 1
+            metadata[chunk_id] = {'sources': json.dumps(sorted(entry[0])), 'source_count': len(entry[0])}
+        return metadata
+
+    def _written(self, key: str, digest: str, ids: list[str], rows: list[tuple], updates: dict[str, dict]):
+        if self.dedupe is not None and rows:
+            with self.lock:
+                self.abandoned.difference_update(row[0] for row in rows)
+        if self.lexical is not None:
+            if rows:
+                self.lexical.add([row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows])
+            if updates:
+                self.lexical.update_metadata(list(updates), list(updates.values()))
+        if self.manifest is None:
+            return
+        self.manifest.record(key, digest, ids)
+        if self.dedupe is not None:
+            self.dedupe.release(ids)
+            with self.lock:
+                # Once no write is in flight the manifest has every source
+                for chunk_id in dict.fromkeys(ids):
+                    entry = self.sources.get(chunk_id)
+                    if entry is not None:
+                        entry[1] -= 1
+                        if entry[1] <= 0:
+                            del self.sources[chunk_id]
+
+    def remove(self, path: str) -> int:
+        """Drop a file from the manifest; its chunks are deleted by ``finish`` if unused"""
+        chunk_ids = self.manifest.get_chunk_ids(path)
+        self.manifest.remove(path)
+        with self.lock:
+            self.stale.update(chunk_ids)
+        return len(chunk_ids)
+
+    def finish(self) -> int:
+        """Delete unreferenced chunks and refresh the sources of shared ones
+
+        Call only after the writer has been flushed, so every successful write
+        has been recorded in the manifest. Also bumps the collection version,
+        which invalidates cached query results.
+        """
+        if self.manifest is None:
+            bump_version(self.collection)
+            return 0
+        with self.lock:
+            stale, self.stale = self.stale, set()
+            shared, self.shared = self.shared, set()
+            abandoned, self.abandoned = self.abandoned, set()
+
+        failed = set(self.writer.failed_ids) | abandoned
+        if failed and self.dedupe is not None:
+            # Files that reference a shared chunk that was never stored must be redone
+            for chunk_id in failed:
+                self.manifest.invalidate_chunk(chunk_id)
+            self.dedupe.release(sorted(failed))
+
+        garbage = self.manifest.unreferenced(sorted(stale))
+        for start in range(0, len(garbage), 1000):
+            self.collection.delete(ids=garbage[start:start + 1000])
+        if self.lexical is not None:
+            self.lexical.remove(garbage)
+        if self.dedupe is not None:
+            self.dedupe.remove(garbage)
+            self._update_sources(sorted((shared | stale) - set(garbage) - failed))
+        if garbage:
+            logger.info(f"Deleted {len(garbage)} chunks no longer referenced by any file")
+        bump_version(self.collection)
+        return len(garbage)
+
+    def _update_sources(self, chunk_ids: list[str]):
+        """Record every page a shared chunk was found on in its metadata"""
+        for start in range(0, len(chunk_ids), 1000):
+            batch = chunk_ids[start:start + 1000]
+            metadatas = []
+            for chunk_id in batch:
+                sources = [Path(path).name for path in self.manifest.referencing_paths(chunk_id)]
+                metadatas.append({'sources': json.dumps(sources), 'source_count': len(sources)})
+            self.collection.update(ids=batch, metadatas=metadatas)
+            if self.lexical is not None:
+                self.lexical.update_metadata(batch, metadatas)
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Optional
+
+
+def content_hash(content: str, fingerprint: str = '') -> str:
+    """Hash of a file's content, suffixed with the fingerprint of the settings it was indexed with"""
+    digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    return f"{digest}:{fingerprint}" if fingerprint else digest
+
+
+class Manifest:
+    """Records what has been indexed: a content hash and chunk IDs per source file
+
+    The manifest lets an ingestion run skip files whose content has not
+    changed and find the chunks that must be deleted when a file shrinks,
+    changes or disappears. ``chunk_refs`` indexes which files use each chunk
+    ID, so a chunk shared by several files is only deleted once none of them
+    produce it any more.
+    """
+
+    def __init__(self, db_path: str = "ingest_manifest.db"):
+        self.lock = threading.Lock()
+        self.con = sqlite3.connect(db_path, check_same_thread=False)
+        with self.con:
+            self.con.execute(
+                "CREATE TABLE IF NOT EXISTS documents("
+                "path TEXT PRIMARY KEY, content_hash TEXT NOT NULL, chunk_ids TEXT NOT NULL, indexed_at TEXT NOT NULL)"
+            )
+            has_refs = self.con.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='chunk_refs'"
+            ).fetchone()
+            self.con.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_refs(chunk_id TEXT NOT NULL, path TEXT NOT NULL, PRIMARY KEY(chunk_id, path))"
+            )
+            self.con.execute("CREATE INDEX IF NOT EXISTS chunk_refs_path ON chunk_refs(path)")
+            if not has_refs:
+                # Manifests written before chunk_refs existed
+                for path, chunk_ids in self.con.execute("SELECT path, chunk_ids FROM documents").fetchall():
+                    self.con.executemany(
+                        "INSERT OR IGNORE INTO chunk_refs VALUES (?, ?)", [(i, path) for i in json.loads(chunk_ids)]
+                    )
+
+    def get_hash(self, path: str) -> Optional[str]:
+        with self.lock:
+            row = self.con.execute("SELECT content_hash FROM documents WHERE path=?", (path,)).fetchone()
+        return row[0] if row else None
+
+    def get_chunk_ids(self, path: str) -> list[str]:
+        with self.lock:
+            row = self.con.execute("SELECT chunk_ids FROM documents WHERE path=?", (path,)).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def record(self, path: str, digest: str, chunk_ids: list[str]):
+        with self.lock, self.con:
+            self.con.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)",
+                (path, digest, json.dumps(chunk_ids), datetime.now().isoformat())
+            )
+            self.con.execute("DELETE FROM chunk_refs WHERE path=?", (path,))
+            self.con.executemany("INSERT OR IGNORE INTO chunk_refs VALUES (?, ?)", [(i, path) for i in chunk_ids])
+
+    def invalidate_chunk(self, chunk_id: str):
+        """Re-index every file using a chunk that was never stored, and stop counting it as referenced"""
+        with self.lock, self.con:
+            self.con.execute(
+                "UPDATE documents SET content_hash='' WHERE path IN (SELECT path FROM chunk_refs WHERE chunk_id=?)",
+                (chunk_id,)
+            )
+            self.con.execute("DELETE FROM chunk_refs WHERE chunk_id=?", (chunk_id,))
+
+    def remove(self, path: str):
+        with self.lock, self.con:
+            self.con.execute("DELETE FROM documents WHERE path=?", (path,))
+            self.con.execute("DELETE FROM chunk_refs WHERE path=?", (path,))
+
+    def unreferenced(self, chunk_ids: list[str]) -> list[str]:
+        """Return the chunk IDs that no recorded file uses"""
+        with self.lock:
+            return [
+                chunk_id for chunk_id in chunk_ids
+                if self.con.execute("SELECT 1 FROM chunk_refs WHERE chunk_id=? LIMIT 1", (chunk_id,)).fetchone() is None
+            ]
+
+    def referencing_paths(self, chunk_id: str) -> list[str]:
+        with self.lock:
+            rows = self.con.execute("SELECT path FROM chunk_refs WHERE chunk_id=? ORDER BY path", (chunk_id,))
+            return [path for (path,) in rows]
+
+    def paths(self, prefix: str = "") -> list[str]:
+        with self.lock:
+            rows = self.con.execute(
+                "SELECT path FROM documents WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)
+            ).fetchall()
+        return [path for (path,) in rows]
+
+    def close(self):
+        with self.lock:
+            self.con.close()
@@ -0,0 +1,379 @@
+import io
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+
+from ingestion.boilerplate import strip_template
+from ingestion.catalog import DocumentCatalog
+from ingestion.chunker import MarkdownChunker
+from ingestion.dedupe import NearDuplicateIndex
+from ingestion.indexer import ChunkIndexer, config_fingerprint
+from ingestion.manifest import Manifest, content_hash
+from ingestion.writer import BulkWriter
+from retrieval.lexical import LexicalIndex
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stage's input; each stage forwards exactly one downstream
+_DONE = object()
+
+# MarkItDown instance and domain templates owned by each conversion worker process
+_worker_converter = None
+_worker_templates = {}
+
+
+def _init_converter(templates: Optional[dict[str, set[str]]] = None):
+    """Create the per-process MarkItDown converter"""
+    global _worker_converter, _worker_templates
+    from markitdown import MarkItDown
+    _worker_converter = MarkItDown()
+    _worker_templates = templates or {}
+
+
+def html_to_markdown(converter, html: str) -> str:
+    """Convert an HTML string to markdown with a MarkItDown instance"""
+    from markitdown import StreamInfo
+
+    stream = io.BytesIO(html.encode('utf-8'))
+    result = converter.convert_stream(stream, stream_info=StreamInfo(extension='.html', charset='utf-8'))
+    return result.text_content
+
+
+def convert_html(html: str, domain: str = "") -> str:
+    """Strip the domain template and convert to markdown inside a conversion worker process"""
+    template = _worker_templates.get(domain)
+    if template:
+        html = strip_template(html, template)
+    return html_to_markdown(_worker_converter, html)
+
+
+@dataclass
+class PipelineConfig:
+    """Concurrency and buffering settings for each ingestion stage"""
+    read_workers: int = 4
+    convert_processes: int = os.cpu_count() or 1
+    chunk_workers: int = 2
+    embed_workers: int = 4
+    embed_batch_chunks: int = 256
+    embed_batch_wait: float = 0.2
+    write_workers: int = 2
+    queue_size: int = 64
+    write_batch_size: int = 1000
+    write_pending_batches: int = 4
+    chunk_tokens: int = 384
+    chunk_overlap: int = 48
+
+
+@dataclass
+class Document:
+    """A single HTML file as it moves through the pipeline"""
+    path: Path
+    content_hash: str = ""
+    html: str = ""
+    markdown: str = ""
+    chunks: list[str] = field(default_factory=list)
+    chunk_metadata: list[dict] = field(default_factory=list)
+    chunk_ids: list[str] = field(default_factory=list)
+    needs_write: list[bool] = field(default_factory=list)
+    embeddings: list[list[float]] = field(default_factory=list)
+
+
+@dataclass
+class PipelineStats:
+    files: int = 0
+    chunks: int = 0
+    skipped: int = 0
+    duplicate_chunks: int = 0
+    deleted_chunks: int = 0
+    errors: int = 0            # files that failed a stage
+    failed_chunks: int = 0     # chunks the writer gave up storing or deleting
+    elapsed: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+
+class _Stage:
+    """A pool of threads pulling from one bounded queue and pushing to the next"""
+
+    def __init__(self, name: str, fn: Callable, workers: int, inbox: queue.Queue,
+                 outbox: Optional[queue.Queue], stats: PipelineStats):
+        self.name = name
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stats = stats
+        self.remaining = workers
+        self.lock = threading.Lock()
+        self.threads = [
+            threading.Thread(target=self._run, name=f"ingest-{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+    def _run(self):
+        while True:
+            item = self.inbox.get()
+            if item is _DONE:
+                # Hand the sentinel on to sibling workers of this stage
+                self.inbox.put(_DONE)
+                break
+            try:
+                for result in self.fn(item):
+                    if self.outbox is not None:
+                        self.outbox.put(result)
+            except Exception as e:
+                logger.error(f"{self.name} stage failed for {getattr(item, 'path', item)}: {e}")
+                self.stats.add(errors=1)
+
+        with self.lock:
+            self.remaining -= 1
+            last = self.remaining == 0
+        if last and self.outbox is not None:
+            self.outbox.put(_DONE)
+
+
+class _Batcher:
+    """Groups documents from one queue into lists for the next, so small documents share an embedding call
+
+    A group is handed on once its documents have ``size`` chunks to embed
+    between them, or ``wait`` seconds after its first document arrived, so
+    a slow trickle of documents is not held back for a full group.
+    """
+
+    def __init__(self, inbox: queue.Queue, outbox: queue.Queue, size: int, wait: float):
+        self.inbox = inbox
+        self.outbox = outbox
+        self.size = size
+        self.wait = wait
+        self.thread = threading.Thread(target=self._run, name="ingest-batch", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def join(self):
+        self.thread.join()
+
+    def _run(self):
+        group, chunks, deadline = [], 0, None
+        while True:
+            try:
+                item = self.inbox.get(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is _DONE:
+                break
+            if item is not None:
+                if not group:
+                    deadline = time.monotonic() + self.wait
+                group.append(item)
+                chunks += item.needs_write.count(True)
+                if chunks < self.size and time.monotonic() < deadline:
+                    continue
+            self.outbox.put(group)
+            group, chunks, deadline = [], 0, None
+        if group:
+            self.outbox.put(group)
+        self.outbox.put(_DONE)
+
+
+class IngestionPipeline:
+    """Streams HTML files through read -> convert -> chunk -> dedupe -> embed -> write
+
+    Every stage runs concurrently and stages are connected by bounded queues,
+    so memory stays flat regardless of corpus size and a slow stage applies
+    backpressure to the ones before it. Markdown conversion is CPU bound and
+    runs in a process pool; the remaining stages are I/O bound and use threads.
+
+    With a ``manifest`` the run is incremental: files whose content hash is
+    unchanged are dropped right after they are read, changed files have their
+    chunks upserted and any chunk IDs they no longer produce deleted. The
+    stored hash includes the chunking, dedupe and template settings, so
+    changing those re-indexes unchanged files. A
+    ``dedupe`` index additionally collapses near-duplicate chunks, such as
+    shared headers and footers, into one stored chunk. ``templates`` maps a
+    domain (the file's parent directory) to its learned boilerplate blocks,
+    which are stripped before conversion. Markdown is split by ``chunker``,
+    which defaults to a ``MarkdownChunker`` sized from the config. Pages found
+    in the crawler's ``catalog`` get their URL and title added to every chunk.
+    Stored chunks are also added to the BM25 ``lexical`` index when given.
+    Documents are grouped before embedding so the chunks of many small pages
+    go to ``embed_fn`` in one call of about ``embed_batch_chunks`` texts.
+    """
+
+    def __init__(self, collection, embed_fn: Callable[[list[str]], list[list[float]]],
+                 config: Optional[PipelineConfig] = None, manifest: Optional[Manifest] = None,
+                 force: bool = False, dedupe: Optional[NearDuplicateIndex] = None,
+                 templates: Optional[dict[str, set[str]]] = None, chunker: Optional[MarkdownChunker] = None,
+                 catalog: Optional[DocumentCatalog] = None, lexical: Optional[LexicalIndex] = None):
+        self.collection = collection
+        self.embed_fn = embed_fn
+        self.config = config or PipelineConfig()
+        self.manifest = manifest
+        self.force = force
+        self.dedupe = dedupe
+        self.templates = templates or {}
+        self.catalog = catalog
+        self.lexical = lexical
+        self.chunker = chunker or MarkdownChunker(self.config.chunk_tokens, self.config.chunk_overlap)
+        self.stats = PipelineStats()
+        self.seen = set()
+        self.fingerprints = {}
+
+    def run(self, paths: Iterable[Path]) -> PipelineStats:
+        """Ingest every path and block until all stages have drained"""
+        config = self.config
+        self.stats = PipelineStats()
+        self.seen = set()
+        self.writer = BulkWriter(self.collection, batch_size=config.write_batch_size,
+                                 max_pending=config.write_pending_batches)
+        self.indexer = ChunkIndexer(self.collection, self.writer, self.manifest, self.dedupe, self.lexical)
+        started = time.perf_counter()
+
+        with ProcessPoolExecutor(max_workers=config.convert_processes, initializer=_init_converter,
+                                 initargs=(self.templates,)) as pool:
+            queues = [queue.Queue(maxsize=config.queue_size) for _ in range(7)]
+            stages = [
+                _Stage("read", self._read, config.read_workers, queues[0], queues[1], self.stats),
+                _Stage("convert", partial(self._convert, pool), config.convert_processes, queues[1], queues[2], self.stats),
+                _Stage("chunk", self._chunk, config.chunk_workers, queues[2], queues[3], self.stats),
+                _Stage("dedupe", self._dedupe, 1, queues[3], queues[4], self.stats),
+                _Batcher(queues[4], queues[5], config.embed_batch_chunks, config.embed_batch_wait),
+                _Stage("embed", self._embed, config.embed_workers, queues[5], queues[6], self.stats),
+                _Stage("write", self._write, config.write_workers, queues[6], None, self.stats),
+            ]
+            for stage in stages:
+                stage.start()
+
+            for path in paths:
+                queues[0].put(Document(path=path))
+            queues[0].put(_DONE)
+
+            for stage in stages:
+                stage.join()
+
+        self.writer.close()
+        self.stats.add(failed_chunks=self.writer.failed, deleted_chunks=self.indexer.finish())
+        self.stats.elapsed = time.perf_counter() - started
+        logger.info(
+            f"Ingested {self.stats.files} files into {self.stats.chunks} chunks "
+            f"in {self.stats.elapsed:.1f}s ({self.stats.skipped} unchanged, {self.stats.errors} failed files, "
+            f"{self.stats.failed_chunks} failed chunks)"
+        )
+        return self.stats
+
+    def prune_missing(self, root: Path) -> int:
+        """Delete chunks of manifest files under ``root`` that the last run did not see"""
+        if self.manifest is None:
+            return 0
+        removed = 0
+        for path in self.manifest.paths(prefix=os.path.join(str(root), "")):
+            if path in self.seen:
+                continue
+            self.indexer.remove(path)
+            removed += 1
+            logger.info(f"Removed {path} from the index")
+        self.stats.add(deleted_chunks=self.indexer.finish())
+        return removed
+
+    def _fingerprint(self, domain: str) -> str:
+        fingerprint = self.fingerprints.get(domain)
+        if fingerprint is None:
+            fingerprint = config_fingerprint(self.chunker, self.dedupe, self.templates.get(domain))
+            self.fingerprints[domain] = fingerprint
+        return fingerprint
+
+    def _read(self, doc: Document) -> Iterator[Document]:
+        key = str(doc.path)
+        if self.manifest is not None:
+            # Seen even if it cannot be read, so a transient read error does not prune its chunks
+            with self.stats.lock:
+                self.seen.add(key)
+        doc.html = doc.path.read_text(encoding='utf-8')
+        if self.manifest is not None:
+            doc.content_hash = content_hash(doc.html, self._fingerprint(doc.path.parent.name))
+            if not self.force and self.manifest.get_hash(key) == doc.content_hash:
+                self.stats.add(skipped=1)
+                return
+        yield doc
+
+    def _convert(self, pool: ProcessPoolExecutor, doc: Document) -> Iterator[Document]:
+        doc.markdown = pool.submit(convert_html, doc.html, doc.path.parent.name).result()
+        doc.html = ""
+        yield doc
+
+    def _chunk(self, doc: Document) -> Iterator[Document]:
+        chunks = self.chunker.chunk(doc.markdown)
+        doc.chunks = [chunk.text for chunk in chunks]
+        doc.chunk_metadata = [{'headings': chunk.breadcrumb, 'token_count': chunk.tokens} for chunk in chunks]
+        doc.markdown = ""
+        # Documents without chunks still flow on so their old chunks get deleted
+        if doc.chunks or self.manifest is not None:
+            yield doc
+
+    def _dedupe(self, doc: Document) -> Iterator[Document]:
+        doc.chunk_ids, doc.needs_write = self.indexer.assign(doc.path, doc.chunks)
+        self.stats.add(duplicate_chunks=doc.needs_write.count(False))
+        yield doc
+
+    def _embed(self, docs: list[Document]) -> Iterator[Document]:
+        """Embed a group's chunks in one call, falling back to one call per document if it fails"""
+        pending = [[chunk for chunk, write in zip(doc.chunks, doc.needs_write) if write] for doc in docs]
+        texts = [chunk for chunks in pending for chunk in chunks]
+        try:
+            embeddings = self.embed_fn(texts) if texts else []
+        except Exception as e:
+            if len(docs) == 1:
+                self._embed_failed(docs[0], e)
+                return
+            logger.warning(f"Embedding {len(texts)} chunks from {len(docs)} files failed ({e}); retrying per file")
+            yield from self._embed_each(docs, pending)
+            return
+        start = 0
+        for doc, chunks in zip(docs, pending):
+            doc.embeddings = embeddings[start:start + len(chunks)]
+            start += len(chunks)
+            yield doc
+
+    def _embed_each(self, docs: list[Document], pending: list[list[str]]) -> Iterator[Document]:
+        for doc, chunks in zip(docs, pending):
+            try:
+                doc.embeddings = self.embed_fn(chunks) if chunks else []
+            except Exception as e:
+                self._embed_failed(doc, e)
+                continue
+            yield doc
+
+    def _embed_failed(self, doc: Document, error: Exception):
+        logger.error(f"embed stage failed for {doc.path}: {error}")
+        self.stats.add(errors=1)
+        # Its claimed chunks were never stored, so files deduplicated against them must not count on them
+        self.indexer.abandon(doc.chunk_ids, doc.needs_write)
+
+    def _write(self, doc: Document) -> Iterator[Document]:
+        page = self.catalog.by_path(doc.path) if self.catalog is not None else None
+        written = self.indexer.write(
+            doc.path, doc.content_hash, doc.chunks, doc.chunk_ids, doc.needs_write, doc.embeddings,
+            extra_metadata={'original_url': page['url'], 'title': page['title']} if page else None,
+            chunk_metadata=doc.chunk_metadata
+        )
+        self.stats.add(files=1, chunks=written)
+        logger.debug(f"Queued {doc.path.name} ({written} of {len(doc.chunks)} chunks)")
+        return iter(())
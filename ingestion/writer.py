@@ -0,0 +1,171 @@
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+@dataclass
+class _Batch:
+    ids: list[str] = field(default_factory=list)
+    documents: list[str] = field(default_factory=list)
+    embeddings: list[list[float]] = field(default_factory=list)
+    metadatas: list[dict] = field(default_factory=list)
+    callbacks: list[Callable[[], None]] = field(default_factory=list)
+    positions: dict[str, int] = field(default_factory=dict)
+    updates: dict[str, dict] = field(default_factory=dict)
+
+    def add(self, chunk_id: str, document: str, embedding: list[float], metadata: dict):
+        # Chroma rejects duplicate IDs within one request, so a re-added ID replaces the buffered row
+        position = self.positions.get(chunk_id)
+        if position is not None:
+            self.documents[position] = document
+            self.embeddings[position] = embedding
+            self.metadatas[position] = metadata
+            return
+        self.positions[chunk_id] = len(self.ids)
+        self.ids.append(chunk_id)
+        self.documents.append(document)
+        self.embeddings.append(embedding)
+        self.metadatas.append(metadata)
+
+    def update(self, chunk_id: str, metadata: dict):
+        # Folded into a buffered row, otherwise merged into the stored one
+        position = self.positions.get(chunk_id)
+        if position is not None:
+            self.metadatas[position].update(metadata)
+        else:
+            self.updates.setdefault(chunk_id, {}).update(metadata)
+
+
+class BulkWriter:
+    """Buffers chunks into large upserts that a background thread sends to Chroma
+
+    ``add`` returns as soon as rows are buffered, so callers keep embedding
+    while earlier batches are written. At most ``max_pending`` full batches
+    wait for the writer thread; past that ``add`` blocks, which keeps memory
+    bounded when Chroma falls behind. Failed writes are retried with
+    exponential backoff. Batches and deletes are applied strictly in the order
+    they were submitted, and the callbacks attached to rows run only once
+    those rows have been written. Metadata updates for chunks already stored
+    ride along with the batch they were added to.
+    """
+
+    def __init__(self, collection, batch_size: int = 1000, max_pending: int = 4,
+                 max_retries: int = 3, retry_backoff: float = 1.0):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.buffer = _Batch()
+        self.lock = threading.Lock()
+        self.written = 0
+        self.deleted = 0
+        self.failed = 0
+        self.failed_ids = set()
+        self.thread = threading.Thread(target=self._run, name="chroma-writer", daemon=True)
+        self.thread.start()
+
+    def add(self, ids: list[str], documents: list[str], embeddings: list[list[float]],
+            metadatas: list[dict], on_written: Optional[Callable[[], None]] = None,
+            updates: Optional[dict[str, dict]] = None):
+        """Buffer rows for upsert and ``updates`` to merge into stored metadata by ID
+
+        ``on_written`` runs after the last of them is stored.
+        """
+        with self.lock:
+            for row in zip(ids, documents, embeddings, metadatas):
+                self.buffer.add(*row)
+            for chunk_id, metadata in (updates or {}).items():
+                self.buffer.update(chunk_id, metadata)
+            if on_written is not None:
+                self.buffer.callbacks.append(on_written)
+            if len(self.buffer.ids) >= self.batch_size:
+                self._submit_buffer()
+
+    def delete(self, ids: list[str]):
+        """Queue a delete after everything added so far"""
+        with self.lock:
+            self._submit_buffer()
+            self.pending.put(('delete', ids))
+
+    def flush(self):
+        """Send any buffered rows and wait until every queued write has finished"""
+        with self.lock:
+            self._submit_buffer()
+        self.pending.join()
+
+    def close(self):
+        self.flush()
+        self.pending.put(_STOP)
+        self.thread.join()
+        logger.info(f"Chroma writer finished: {self.written} upserted, {self.deleted} deleted, {self.failed} failed")
+
+    def _submit_buffer(self):
+        # Caller holds self.lock; blocking here is the backpressure on producers
+        if self.buffer.ids or self.buffer.callbacks or self.buffer.updates:
+            batch, self.buffer = self.buffer, _Batch()
+            self.pending.put(('upsert', batch))
+
+    def _run(self):
+        while True:
+            item = self.pending.get()
+            if item is _STOP:
+                self.pending.task_done()
+                break
+            op, payload = item
+            try:
+                if op == 'upsert':
+                    self._write(payload)
+                else:
+                    self._delete(payload)
+            finally:
+                self.pending.task_done()
+
+    def _write(self, batch: _Batch):
+        if batch.updates:
+            self._retry(lambda: self.collection.update(ids=list(batch.updates), metadatas=list(batch.updates.values())),
+                        f"metadata update of {len(batch.updates)} chunks")
+        if batch.ids and not self._retry(
+            lambda: self.collection.upsert(
+                ids=batch.ids,
+                documents=batch.documents,
+                embeddings=batch.embeddings,
+                metadatas=batch.metadatas
+            ),
+            f"upsert of {len(batch.ids)} chunks"
+        ):
+            self.failed += len(batch.ids)
+            self.failed_ids.update(batch.ids)
+            return
+
+        self.written += len(batch.ids)
+        for callback in batch.callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Write callback failed: {e}")
+
+    def _delete(self, ids: list[str]):
+        if self._retry(lambda: self.collection.delete(ids=ids), f"delete of {len(ids)} chunks"):
+            self.deleted += len(ids)
+        else:
+            self.failed += len(ids)
+
+    def _retry(self, operation: Callable[[], None], description: str) -> bool:
+        for attempt in range(self.max_retries):
+            try:
+                operation()
+                return True
+            except Exception as e:
+                logger.warning(f"Chroma {description} failed (attempt {attempt + 1}/{self.max_retries}): {e}")
+                if attempt + 1 < self.max_retries:
+                    time.sleep(self.retry_backoff * (2 ** attempt))
+        logger.error(f"Giving up on Chroma {description}")
+        return False
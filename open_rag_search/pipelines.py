@@ -2,10 +2,28 @@ import json
 import csv
 import os
 import re
+import threading
 from datetime import datetime
 from urllib.parse import urlparse
 from pathlib import Path
 from itemadapter import ItemAdapter
+from scrapy.exceptions import NotConfigured
+from twisted.internet.defer import DeferredSemaphore
+from twisted.internet.threads import deferToThread, deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+from ingestion.boilerplate import BoilerplateStripper
+from ingestion.catalog import DocumentCatalog
+from ingestion.chunker import MarkdownChunker, load_token_counter, tokenizer_name
+from ingestion.dedupe import NearDuplicateIndex
+from ingestion.embedder import BatchEmbedder
+from ingestion.embedding_cache import CachedEmbedder, EmbeddingCache
+from ingestion.indexer import ChunkIndexer, config_fingerprint
+from ingestion.manifest import Manifest, content_hash
+from ingestion.pipeline import html_to_markdown
+from ingestion.writer import BulkWriter
+from retrieval.backend import close_collection, open_collection
+from retrieval.lexical import open_lexical_index
 
 
 class ProcessPagePipeline:
@@ -188,15 +206,16 @@ class StatsPipeline:
 class HtmlDownloadPipeline:
     """Pipeline to download and save HTML content to files"""
     
-    def __init__(self, download_folder='html_downloads'):
+    def __init__(self, download_folder='html_downloads', catalog_path=None):
         self.download_folder = download_folder
-        self.url_mapping = {}
-        self.file_counter = {}  # Track filename conflicts
+        self.catalog_path = catalog_path or str(Path(download_folder) / "catalog.db")
+        self.saved = 0
         
     @classmethod
     def from_crawler(cls, crawler):
         return cls(
-            download_folder=crawler.settings.get("HTML_DOWNLOAD_FOLDER", "html_downloads")
+            download_folder=crawler.settings.get("HTML_DOWNLOAD_FOLDER", "html_downloads"),
+            catalog_path=crawler.settings.get("DOCUMENT_CATALOG")
         )
     
     def open_spider(self, spider):
@@ -208,17 +227,15 @@ class HtmlDownloadPipeline:
         domain_folder = self.base_path / spider.allowed_domains[0] if spider.allowed_domains else self.base_path / "unknown"
         domain_folder.mkdir(exist_ok=True)
         self.domain_path = domain_folder
+        self.catalog = DocumentCatalog(self.catalog_path)
         
         spider.logger.info(f"HTML files will be saved to: {self.domain_path}")
     
     def close_spider(self, spider):
-        """Save URL mapping index"""
-        index_file = self.base_path / "url_mapping.json"
-        with open(index_file, 'w', encoding='utf-8') as f:
-            json.dump(self.url_mapping, f, indent=2, ensure_ascii=False)
-        
-        spider.logger.info(f"Saved {len(self.url_mapping)} HTML files")
-        spider.logger.info(f"URL mapping saved to: {index_file}")
+        """Close the document catalog"""
+        spider.logger.info(f"Saved {self.saved} HTML files")
+        spider.logger.info(f"Document catalog: {self.catalog_path} ({len(self.catalog)} pages)")
+        self.catalog.close()
     
     def process_item(self, item, spider):
         adapter = ItemAdapter(item)
@@ -230,19 +247,12 @@ class HtmlDownloadPipeline:
         
         url = adapter.get('url', '')
         
-        # Generate safe filename from URL
-        filename = self.generate_filename(url)
-        
-        # Handle filename conflicts
-        if filename in self.file_counter:
-            self.file_counter[filename] += 1
-            name, ext = filename.rsplit('.', 1)
-            filename = f"{name}_{self.file_counter[filename]}.{ext}"
+        # Re-crawled URLs overwrite their previous file
+        existing = self.catalog.by_url(url)
+        if existing:
+            file_path = Path(existing['local_file_path'])
         else:
-            self.file_counter[filename] = 0
-        
-        # Create full file path
-        file_path = self.domain_path / filename
+            file_path = self.unique_path(self.generate_filename(url))
         
         # Save HTML content
         try:
@@ -252,14 +262,16 @@ class HtmlDownloadPipeline:
             # Store local file path in item
             adapter['local_file_path'] = str(file_path)
             
-            # Update URL mapping
-            self.url_mapping[url] = {
-                'local_file_path': str(file_path),
-                'filename': filename,
-                'title': adapter.get('title', ''),
-                'timestamp': adapter.get('timestamp', datetime.now().isoformat()),
-                'size_bytes': len(html_content.encode('utf-8'))
-            }
+            # Record the page in the catalog
+            self.catalog.add(
+                url,
+                str(file_path),
+                title=adapter.get('title', ''),
+                timestamp=adapter.get('timestamp', datetime.now().isoformat()),
+                size_bytes=len(html_content.encode('utf-8')),
+                content_hash=content_hash(html_content)
+            )
+            self.saved += 1
             
             spider.logger.debug(f"Saved HTML: {url} -> {file_path}")
             
@@ -268,6 +280,16 @@ class HtmlDownloadPipeline:
         
         return item
     
+    def unique_path(self, filename):
+        """Return a path in the domain folder not yet used by another URL"""
+        file_path = self.domain_path / filename
+        name, ext = filename.rsplit('.', 1)
+        counter = 0
+        while self.catalog.by_path(file_path) is not None:
+            counter += 1
+            file_path = self.domain_path / f"{name}_{counter}.{ext}"
+        return file_path
+    
     def generate_filename(self, url):
         """Generate a safe filename from URL"""
         parsed = urlparse(url)
@@ -305,4 +327,202 @@ class HtmlDownloadPipeline:
             filename = 'index'
         
         # Add .html extension
-        return f"{filename}.html"
\ No newline at end of file
+        return f"{filename}.html"
+
+
+class VectorIndexPipeline:
+    """Pipeline to convert, chunk, embed and upsert pages into the vector store as they are crawled
+
+    Indexing runs in a dedicated thread pool so the Twisted reactor thread
+    never blocks on MarkItDown, Ollama or the vector store. At most ``max_in_flight``
+    pages are being indexed at once; further items wait on a semaphore,
+    which in turn throttles the scraper through Scrapy's item concurrency.
+    Chunk IDs and the manifest match generate_embeddings.py, so a later batch
+    run skips every page indexed here.
+    """
+
+    def __init__(self, backend='chroma', chroma_host='localhost', chroma_port=8000, store_dir='.vector_store',
+                 vector_storage=None, vector_dims=None,
+                 collection_name='html_documents',
+                 embedding_model='nomic-embed-text:latest', ollama_url='http://localhost:11434',
+                 workers=4, max_in_flight=16, chunk_tokens=384, chunk_overlap=48, cache_dir='.embedding_cache',
+                 manifest_path='ingest_manifest.db', dedupe=True, template_cache_dir='.template_cache',
+                 lexical_dir='.lexical_index'):
+        self.backend = backend
+        self.chroma_host = chroma_host
+        self.chroma_port = chroma_port
+        self.store_dir = store_dir
+        self.vector_storage = vector_storage
+        self.vector_dims = vector_dims
+        self.collection_name = collection_name
+        self.embedding_model = embedding_model
+        self.ollama_url = ollama_url
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        self.cache_dir = cache_dir
+        self.manifest_path = manifest_path
+        self.dedupe = dedupe
+        self.lexical_dir = lexical_dir
+        self.stripper = BoilerplateStripper(cache_dir=template_cache_dir) if template_cache_dir else None
+        self.local = threading.local()
+        self.indexed = 0
+        self.failed = 0
+        self.indexed_lock = threading.Lock()
+        # Pages indexed unstripped while their domain's template was learned, by domain
+        self.samples = {}
+        self.sample_lock = threading.Lock()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("VECTOR_INDEX_ENABLED"):
+            raise NotConfigured("VECTOR_INDEX_ENABLED is off")
+        return cls(
+            backend=settings.get("RETRIEVAL_BACKEND", "chroma"),
+            chroma_host=settings.get("CHROMA_HOST", "localhost"),
+            chroma_port=settings.getint("CHROMA_PORT", 8000),
+            store_dir=settings.get("VECTOR_STORE_DIR", ".vector_store"),
+            vector_storage=settings.get("VECTOR_STORAGE"),
+            vector_dims=settings.getint("VECTOR_DIMS") or None,
+            collection_name=settings.get("VECTOR_INDEX_COLLECTION", "html_documents"),
+            embedding_model=settings.get("EMBEDDING_MODEL", "nomic-embed-text:latest"),
+            ollama_url=settings.get("OLLAMA_URL", "http://localhost:11434"),
+            workers=settings.getint("VECTOR_INDEX_WORKERS", 4),
+            max_in_flight=settings.getint("VECTOR_INDEX_MAX_IN_FLIGHT", 16),
+            chunk_tokens=settings.getint("VECTOR_INDEX_CHUNK_TOKENS", 384),
+            chunk_overlap=settings.getint("VECTOR_INDEX_CHUNK_OVERLAP", 48),
+            cache_dir=settings.get("EMBEDDING_CACHE_DIR", ".embedding_cache"),
+            manifest_path=settings.get("INGEST_MANIFEST", "ingest_manifest.db"),
+            dedupe=settings.getbool("VECTOR_INDEX_DEDUPE", True),
+            template_cache_dir=settings.get("TEMPLATE_CACHE_DIR", ".template_cache")
+            if settings.getbool("VECTOR_INDEX_STRIP_TEMPLATES", True) else None,
+            lexical_dir=settings.get("LEXICAL_INDEX_DIR", ".lexical_index")
+            if settings.getbool("LEXICAL_INDEX_ENABLED", True) else None
+        )
+
+    def open_spider(self, spider):
+        """Open the collection, connect to Ollama and start the indexing workers"""
+        import ollama
+
+        self.collection = open_collection(
+            self.collection_name, backend=self.backend, chroma_host=self.chroma_host, chroma_port=self.chroma_port,
+            store_dir=self.store_dir, storage=self.vector_storage, dims=self.vector_dims, embedding_model=self.embedding_model, ollama_url=self.ollama_url
+        )
+        collection = self.collection
+        embedder = BatchEmbedder(model=self.embedding_model, client=ollama.Client(host=self.ollama_url))
+        self.embedder = CachedEmbedder(embedder.embed, EmbeddingCache(self.cache_dir, self.embedding_model))
+        self.writer = BulkWriter(collection)
+        self.manifest = Manifest(self.manifest_path)
+        self.chunker = MarkdownChunker(self.chunk_tokens, self.chunk_overlap, load_token_counter(self.embedding_model),
+                                       tokenizer_name(self.embedding_model))
+        dedupe = NearDuplicateIndex(self.manifest) if self.dedupe else None
+        self.lexical = open_lexical_index(self.collection_name, self.lexical_dir) if self.lexical_dir else None
+        self.indexer = ChunkIndexer(collection, self.writer, self.manifest, dedupe, self.lexical)
+
+        self.semaphore = DeferredSemaphore(self.max_in_flight)
+        self.threadpool = ThreadPool(minthreads=1, maxthreads=self.workers, name="vector-index")
+        self.threadpool.start()
+        spider.logger.info(f"Indexing crawled pages into {self.backend} collection: {self.collection_name}")
+
+    def close_spider(self, spider):
+        """Flush pending writes and stop the workers"""
+        # Re-indexing samples and flushing the store block, so they run off the reactor thread
+        return deferToThread(self._close, spider)
+
+    def _close(self, spider):
+        self.threadpool.stop()
+        if self.stripper is not None:
+            reindexed = sum(self._reindex_samples(domain) for domain in self.stripper.finish())
+            if reindexed:
+                spider.logger.info(f"Re-indexed {reindexed} pages with templates learned at the end of the crawl")
+        self.writer.close()
+        self.indexer.finish()
+        self.embedder.cache.close()
+        self.manifest.close()
+        if self.lexical is not None:
+            self.lexical.close()
+        close_collection(self.collection)
+        spider.logger.info(f"Indexed {self.indexed} pages into {self.collection_name} ({self.failed} failed)")
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        if not adapter.get('html_content'):
+            return item
+
+        from twisted.internet import reactor
+
+        d = self.semaphore.run(deferToThreadPool, reactor, self.threadpool, self.index_page, adapter)
+        d.addErrback(self._index_failed, adapter.get('url', ''), spider)
+        d.addBoth(lambda _: item)
+        return d
+
+    def index_page(self, adapter):
+        """Convert, chunk, embed and queue a page for upsert (runs in a worker thread)"""
+        source = self._source(adapter)
+        digest = self._digest(adapter, source)
+        if self.manifest.get_hash(str(source)) == digest:
+            return
+        if not self._index(adapter, source, digest):
+            self._sampled(source.parent.name, adapter)
+        with self.indexed_lock:
+            self.indexed += 1
+
+    @staticmethod
+    def _source(adapter) -> Path:
+        return Path(adapter.get('local_file_path') or f"{urlparse(adapter['url']).netloc}/{content_hash(adapter['url'])[:16]}.html")
+
+    def _digest(self, adapter, source: Path) -> str:
+        """Content hash with the settings the page is indexed with, matching generate_embeddings.py"""
+        template = self.stripper.template(source.parent.name) if self.stripper is not None else None
+        return content_hash(adapter['html_content'], config_fingerprint(self.chunker, self.indexer.dedupe, template))
+
+    def _index(self, adapter, source: Path, digest: str) -> bool:
+        """Index one page, returning whether its domain's template was known"""
+        html_content = adapter['html_content']
+        if not hasattr(self.local, 'converter'):
+            from markitdown import MarkItDown
+            self.local.converter = MarkItDown()
+        stripped = True
+        if self.stripper is not None:
+            stripped = self.stripper.template(source.parent.name) is not None
+            html_content = self.stripper.strip(source.parent.name, html_content)
+        parsed = self.chunker.chunk(html_to_markdown(self.local.converter, html_content))
+        chunks = [chunk.text for chunk in parsed]
+        ids, needs_write = self.indexer.assign(source, chunks)
+        pending = [chunk for chunk, write in zip(chunks, needs_write) if write]
+        try:
+            embeddings = self.embedder.embed(pending) if pending else []
+        except Exception:
+            self.indexer.abandon(ids, needs_write)
+            raise
+        # An unstripped page is recorded without its hash, so the next crawl redoes it if this one does not
+        self.indexer.write(source, digest if stripped else '', chunks, ids, needs_write, embeddings,
+                           extra_metadata={'original_url': adapter['url'], 'title': adapter.get('title') or ''},
+                           chunk_metadata=[{'headings': chunk.breadcrumb, 'token_count': chunk.tokens} for chunk in parsed])
+        return stripped
+
+    def _sampled(self, domain: str, adapter):
+        """Keep a page indexed before its domain's template existed, and redo the domain's pages once it does"""
+        page = {key: adapter.get(key) for key in ('url', 'title', 'html_content', 'local_file_path')}
+        with self.sample_lock:
+            self.samples.setdefault(domain, []).append(page)
+        if self.stripper.template(domain) is not None:
+            self._reindex_samples(domain)
+
+    def _reindex_samples(self, domain: str) -> int:
+        with self.sample_lock:
+            pages = self.samples.pop(domain, [])
+        if not pages:
+            return 0
+        # Their first writes must be in the manifest, so the chunks they no longer produce are found
+        self.writer.flush()
+        for page in pages:
+            source = self._source(page)
+            self._index(page, source, self._digest(page, source))
+        return len(pages)
+
+    def _index_failed(self, failure, url, spider):
+        self.failed += 1
+        spider.logger.error(f"Failed to index {url}: {failure.getErrorMessage()}")
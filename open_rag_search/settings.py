@@ -11,6 +11,7 @@ ITEM_PIPELINES = {
     'open_rag_search.pipelines.DuplicatesPipeline': 200,
     'open_rag_search.pipelines.ProcessPagePipeline': 300,
     'open_rag_search.pipelines.HtmlDownloadPipeline': 350,  # Save HTML before other processing
+    'open_rag_search.pipelines.VectorIndexPipeline': 375,  # Index pages as they are crawled
     'open_rag_search.pipelines.JsonPipeline': 400,
     'open_rag_search.pipelines.StatsPipeline': 500,
 }
@@ -64,6 +65,30 @@ CSV_OUTPUT_FILE = 'crawl_results.csv'
 
 # HTML download settings
 HTML_DOWNLOAD_FOLDER = 'html_downloads'
+DOCUMENT_CATALOG = 'html_downloads/catalog.db'
+
+# Vector indexing settings
+VECTOR_INDEX_ENABLED = False  # needs the Chroma and Ollama services; enable with -s VECTOR_INDEX_ENABLED=True
+VECTOR_INDEX_COLLECTION = 'html_documents'
+VECTOR_INDEX_WORKERS = 4
+VECTOR_INDEX_MAX_IN_FLIGHT = 16
+VECTOR_INDEX_CHUNK_TOKENS = 384
+VECTOR_INDEX_CHUNK_OVERLAP = 48
+VECTOR_INDEX_DEDUPE = True
+VECTOR_INDEX_STRIP_TEMPLATES = True
+TEMPLATE_CACHE_DIR = '.template_cache'
+RETRIEVAL_BACKEND = 'chroma'  # 'chroma' server or in-process 'embedded' store
+VECTOR_STORE_DIR = '.vector_store'
+LEXICAL_INDEX_ENABLED = True
+LEXICAL_INDEX_DIR = '.lexical_index'
+VECTOR_STORAGE = None  # float32 (default), float16 or int8 for new embedded collections
+VECTOR_DIMS = 0  # keep only the leading Matryoshka dimensions; 0 keeps all
+CHROMA_HOST = 'localhost'
+CHROMA_PORT = 8000
+OLLAMA_URL = 'http://localhost:11434'
+EMBEDDING_MODEL = 'nomic-embed-text:latest'
+EMBEDDING_CACHE_DIR = '.embedding_cache'
+INGEST_MANIFEST = 'ingest_manifest.db'
 
 # Memory usage optimization
 MEMUSAGE_ENABLED = True
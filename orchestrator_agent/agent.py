@@ -1,9 +1,16 @@
 from strands import Agent
-from customer_agent.agent import customer_assisstant
-from content_agent.agent import generate_content
+from customer_agent.agent import customer_assisstant, import_customers
+from content_agent.agent import generate_content, stream_content
+from agent_pool.pool import AgentPool
 from local_model.model import model as qwen
+from orchestrator_agent.executor import BoundedToolExecutor
+from orchestrator_agent.router import CONTENT, CUSTOMER, IntentRouter, customer_name
+from retrieval.backend import ollama_embedding_function
+from retrieval.service import get_service
 
+import asyncio
 import logging
+from typing import AsyncIterator
 
 # Configure the root strands logger
 logging.getLogger("strands").setLevel(logging.DEBUG)
@@ -18,19 +25,114 @@ logging.basicConfig(
 MAIN_SYSTEM_PROMPT = """
 You are an assistant that routes queries to specialized agents:
 - For customer queries → Use the customer_agent tool
+- For loading many customers from a CSV or JSONL file → Use the import_customers tool once with the file path
 - For experience operations → Use the experience agent
 - For content operations → the content agent
 - Ignore any request or operations for which you do not have an appropriate tool for. Only focus on things you can answer
 
 Always select the most appropriate tools based on the user's query.
 
+When a request needs several operations that do not depend on each other's results, call all of
+their tools in the same response so they run at the same time. Generating content only needs the
+customer's name and the prompt, so request it together with creating or updating the customer.
+
 your objective is to create and devlier personalized content to customers
 """
 
-# Strands Agents SDK allows easy integration of agent tools
-orchestrator = Agent(
-    model=qwen,
-    system_prompt=MAIN_SYSTEM_PROMPT,
-    callback_handler=None,
-    tools=[customer_assisstant, generate_content]
-)
\ No newline at end of file
+def create_orchestrator() -> Agent:
+    # Strands Agents SDK allows easy integration of agent tools
+    return Agent(
+        model=qwen,
+        system_prompt=MAIN_SYSTEM_PROMPT,
+        callback_handler=None,
+        tools=[customer_assisstant, import_customers, generate_content],
+        # Content generation reads only the knowledge base, so several calls can overlap
+        tool_executor=BoundedToolExecutor(max_concurrency=4, parallel_safe={generate_content.tool_name})
+    )
+
+
+orchestrator = create_orchestrator()
+orchestrators = AgentPool(create_orchestrator)
+
+logger = logging.getLogger(__name__)
+
+
+def embed_query(prompt: str):
+    """Embed through the retriever's query cache, so generate_content's search reuses the embedding"""
+    cache = get_service().retriever("html_documents").cache
+    return cache.embed(prompt) if cache is not None else None
+
+
+# Keyword rules need no embeddings; the retriever is only opened for centroid matching
+router = IntentRouter(ollama_embedding_function(), embed=embed_query)
+
+
+async def stream_conversation(prompt: str) -> AsyncIterator[dict]:
+    """Handle one conversation, yielding events as they happen
+
+    Events are dicts with a ``type``: ``token`` (``data`` is generated text,
+    from the orchestrator or, with a ``tool`` name, from a sub-agent),
+    ``tool_start`` and ``tool_end`` (``tool``, plus ``status`` at the end),
+    and finally ``done`` with the full ``text``.
+
+    Requests the intent router classifies confidently go straight to their
+    tool, skipping the orchestrator's routing call. The rest borrow an
+    orchestrator of their own, since an Agent serves one invocation at a
+    time, so many conversations can be in flight in one process.
+    """
+    try:
+        route = await asyncio.to_thread(router.route, prompt)
+    except Exception as e:
+        logger.warning(f"Intent routing failed, using the orchestrator: {e}")
+        route = None
+    if route is not None:
+        logger.info(f"Routed request to {route.intent} by {route.source} ({route.confidence:.2f})")
+        if route.intent == CUSTOMER:
+            yield {'type': 'tool_start', 'tool': customer_assisstant.tool_name}
+            text = await customer_assisstant(query=prompt)
+            yield {'type': 'tool_end', 'tool': customer_assisstant.tool_name, 'status': 'success'}
+            yield {'type': 'done', 'text': text}
+            return
+        if route.intent == CONTENT:
+            fname, lname = customer_name(prompt)
+            yield {'type': 'tool_start', 'tool': generate_content.tool_name}
+            async for event in stream_content(fname, lname, prompt):
+                if isinstance(event, dict):
+                    yield {**event, 'tool': generate_content.tool_name}
+                else:
+                    text = event
+            yield {'type': 'tool_end', 'tool': generate_content.tool_name, 'status': 'success'}
+            yield {'type': 'done', 'text': text}
+            return
+
+    with orchestrators.acquire() as agent:
+        tools = {}
+        async for event in agent.stream_async(prompt):
+            if 'data' in event:
+                yield {'type': 'token', 'data': event['data']}
+            elif 'current_tool_use' in event:
+                tool_use = event['current_tool_use']
+                if tool_use.get('toolUseId') and tool_use['toolUseId'] not in tools:
+                    tools[tool_use['toolUseId']] = tool_use.get('name')
+                    yield {'type': 'tool_start', 'tool': tool_use.get('name')}
+            elif 'tool_stream_event' in event:
+                stream_event = event['tool_stream_event']
+                # The tool's last value is its result, reported with the tool result message instead
+                if isinstance(stream_event['data'], dict):
+                    yield {**stream_event['data'], 'tool': stream_event['tool_use']['name']}
+            elif 'message' in event:
+                for block in event['message'].get('content', []):
+                    if 'toolResult' in block:
+                        result = block['toolResult']
+                        yield {'type': 'tool_end', 'tool': tools.get(result['toolUseId']), 'status': result.get('status')}
+            elif 'result' in event:
+                yield {'type': 'done', 'text': str(event['result'])}
+
+
+async def run_conversation(prompt: str) -> str:
+    """Handle one conversation and return its final text"""
+    text = None
+    async for event in stream_conversation(prompt):
+        if event['type'] == 'done':
+            text = event['text']
+    return text
@@ -0,0 +1,324 @@
+"""Batch campaign runner
+
+    python -m orchestrator_agent.campaign campaign.jsonl --output results.jsonl --concurrency 8
+
+Each input line is one content request: ``{"id": ..., "prompt": ...,
+"fname": ..., "lname": ..., "ccid": ..., "segment": ...}``. Only ``prompt``
+is required; ``id`` defaults to the line number, and a request with a
+``ccid`` but no name takes the name from the customer store. Requests go
+straight to content generation, the path the orchestrator's router takes
+for content requests, without an orchestrator model call per message.
+
+Results are appended to the output file as JSON lines as they finish, in
+completion order. The output file is also the checkpoint: a rerun skips
+requests that already have an ``ok`` result and retries the failed ones,
+so read the last line per ``id``.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional
+
+from content_agent.agent import CONTENT_RESULTS, get_responses, stream_content
+from customer_agent.agent import customers, run_db
+from ingestion.embedding_cache import text_key
+from retrieval.service import get_service
+
+logger = logging.getLogger(__name__)
+
+CAMPAIGN_CONCURRENCY = int(os.environ.get("CAMPAIGN_CONCURRENCY", 8))
+
+
+@dataclass
+class Request:
+    id: str
+    prompt: str
+    fname: str = ''
+    lname: str = ''
+    ccid: Optional[str] = None
+    segment: Optional[str] = None
+
+
+@dataclass
+class Segment:
+    """Requests with the same segment label and prompt, which share retrieval and generated content"""
+    key: tuple[str, str]
+    prompt: str
+    # Requests waiting for the first one to fill the response cache
+    requests: list[Request] = field(default_factory=list)
+    results: Optional[dict] = None
+    led: bool = False
+    pending: int = 0
+
+
+@dataclass
+class CampaignStats:
+    requests: int = 0
+    resumed: int = 0
+    segments: int = 0
+    ok: int = 0
+    errors: int = 0
+    elapsed: float = 0.0
+
+
+def read_requests(path: str) -> Iterator[Request]:
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"Skipping line {number}: not valid JSON ({e})")
+                continue
+            if not record.get('prompt'):
+                logger.warning(f"Skipping line {number}: no prompt")
+                continue
+            yield Request(str(record.get('id', number)), record['prompt'], record.get('fname') or '',
+                          record.get('lname') or '', record.get('ccid'), record.get('segment'))
+
+
+def completed_ids(output_path: str) -> set[str]:
+    """Ids with an ``ok`` result in an earlier run's output, after dropping a partly written last line"""
+    path = Path(output_path)
+    if not path.exists():
+        return set()
+    done, offset = set(), 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            offset += len(line)
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get('status') == 'ok':
+                done.add(str(record.get('id')))
+    if offset < path.stat().st_size:
+        logger.warning(f"Dropping a partly written result at the end of {output_path}")
+        os.truncate(path, offset)
+    return done
+
+
+class ResultLog:
+    """Append-only JSONL output, flushed per result and synced to disk every ``sync_every`` results"""
+
+    def __init__(self, path: str, sync_every: int = 100):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.f = open(path, 'a', encoding='utf-8')
+        self.sync_every = sync_every
+        self.unsynced = 0
+
+    def write(self, record: dict):
+        self.f.write(json.dumps(record) + '\n')
+        self.f.flush()
+        self.unsynced += 1
+        if self.unsynced >= self.sync_every:
+            os.fsync(self.f.fileno())
+            self.unsynced = 0
+
+    def close(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+
+
+class CampaignRunner:
+    """Generates content for a campaign's requests with bounded concurrency
+
+    The input is streamed, and requests are grouped into segments of the
+    same prompt as they are read. New segments are taken
+    ``retrieval_batch`` at a time, and their prompts are searched in one
+    multi-query call while the next batch is read. Searched segments go on a
+    queue served by ``concurrency`` workers, so one slow generation never
+    holds up the others. In a segment the first request is generated alone.
+    That fills the response cache, so the rest of the segment reuses it with
+    their own names. At most ``concurrency + 2 * retrieval_batch`` requests
+    are held in memory at once.
+    """
+
+    def __init__(self, concurrency: int = CAMPAIGN_CONCURRENCY, retrieval_batch: int = 32,
+                 collection: str = "html_documents", progress_every: int = 500):
+        self.concurrency = concurrency
+        self.retrieval_batch = retrieval_batch
+        self.collection = collection
+        self.progress_every = progress_every
+        self.stats = CampaignStats()
+
+    async def run(self, input_path: str, output_path: str) -> CampaignStats:
+        start = time.perf_counter()
+        self.stats = CampaignStats()
+        done = completed_ids(output_path)
+        if done:
+            logger.info(f"Resuming: {len(done)} requests already done")
+
+        self.queue = asyncio.Queue()
+        self.admitted = asyncio.Semaphore(self.concurrency + 2 * self.retrieval_batch)
+        # Segments with requests not yet generated, by segment label and normalized prompt
+        self.segments = {}
+        self.log = ResultLog(output_path)
+        self.started = time.perf_counter()
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        try:
+            await self._feed(input_path, done)
+            await self.queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            self.log.close()
+        self.stats.elapsed = time.perf_counter() - start
+        return self.stats
+
+    async def _feed(self, input_path: str, done: set[str]):
+        """Read requests into segments, searching each batch of new segments before queueing it"""
+        batch, search = [], None
+        for request in read_requests(input_path):
+            self.stats.requests += 1
+            if request.id in done:
+                self.stats.resumed += 1
+                continue
+            if batch and self.admitted.locked():
+                # Nothing more is admitted until queued requests finish, so search what has been read
+                search = await self._dispatch(search, batch)
+                batch = []
+            await self.admitted.acquire()
+
+            key = (request.segment or '', text_key(request.prompt))
+            segment = self.segments.get(key)
+            if segment is None:
+                segment = self.segments[key] = Segment(key, request.prompt)
+                self.stats.segments += 1
+                batch.append(segment)
+                if len(batch) >= self.retrieval_batch:
+                    search = await self._dispatch(search, batch)
+                    batch = []
+            segment.pending += 1
+            if segment.led:
+                self.queue.put_nowait((segment, request))
+            else:
+                segment.requests.append(request)
+        search = await self._dispatch(search, batch)
+        if search is not None:
+            await search
+
+    async def _dispatch(self, search: Optional[asyncio.Task], batch: list[Segment]) -> Optional[asyncio.Task]:
+        """Wait for the previous batch's search, then start searching this one"""
+        if search is not None:
+            await search
+        if not batch:
+            return None
+        return asyncio.create_task(self._search_batch(batch))
+
+    async def _search_batch(self, batch: list[Segment]):
+        found = await self._search(batch)
+        for segment in batch:
+            segment.results = found.get(segment.prompt)
+            self.queue.put_nowait((segment, segment.requests.pop(0)))
+
+    async def _search(self, segments: list[Segment]) -> dict:
+        """Search results by prompt for a batch of segments, or none if the search fails"""
+        prompts = list(dict.fromkeys(segment.prompt for segment in segments))
+        try:
+            found = await asyncio.to_thread(get_service().search_many, prompts, self.collection, CONTENT_RESULTS)
+            return dict(zip(prompts, found))
+        except Exception as e:
+            logger.warning(f"Batch search failed, searching per request: {e}")
+            return {}
+
+    async def _worker(self):
+        while True:
+            segment, request = await self.queue.get()
+            try:
+                await self._run(request, segment.results)
+            finally:
+                self._finished(segment)
+                self.queue.task_done()
+
+    def _finished(self, segment: Segment):
+        self.admitted.release()
+        if not segment.led:
+            # The first request has filled the response cache; the rest of the segment can run side by side
+            segment.led = True
+            for request in segment.requests:
+                self.queue.put_nowait((segment, request))
+            segment.requests = []
+        segment.pending -= 1
+        if not segment.pending and self.segments.get(segment.key) is segment:
+            del self.segments[segment.key]
+
+    async def _run(self, request: Request, results: Optional[dict]):
+        record = {'id': request.id, 'ccid': request.ccid, 'segment': request.segment}
+        try:
+            record.update(status='ok', content=await self._generate(request, results))
+            self.stats.ok += 1
+        except Exception as e:
+            logger.warning(f"Request {request.id} failed: {e}")
+            record.update(status='error', error=str(e))
+            self.stats.errors += 1
+        self.log.write(record)
+        finished = self.stats.ok + self.stats.errors
+        if finished % self.progress_every == 0:
+            rate = finished / max(time.perf_counter() - self.started, 1e-9)
+            logger.info(f"{finished} done, {self.stats.errors} failed, {rate:.1f}/s")
+
+    async def _generate(self, request: Request, results: Optional[dict]) -> str:
+        fname, lname = request.fname, request.lname
+        if not (fname or lname) and request.ccid:
+            customer = await run_db(customers.get, request.ccid)
+            if customer is None:
+                raise ValueError(f"No customer found with ccid {request.ccid}")
+            fname, lname = customer['fname'] or '', customer['lname'] or ''
+        text = None
+        async for event in stream_content(fname, lname, request.prompt, results, request.ccid):
+            if isinstance(event, str):
+                text = event
+        return text
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate content for a JSONL campaign of customers and prompts")
+    parser.add_argument("input", help="JSONL file of requests")
+    parser.add_argument("--output", help="JSONL results file, also used to resume; default <input>.results.jsonl")
+    parser.add_argument("--concurrency", type=int, default=CAMPAIGN_CONCURRENCY,
+                        help="Generations running at once")
+    parser.add_argument("--retrieval-batch", type=int, default=32,
+                        help="Segment prompts searched per multi-query call")
+    parser.add_argument("--restart", action="store_true", help="Discard earlier results instead of resuming")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    output = args.output or str(Path(args.input).with_suffix('.results.jsonl'))
+    if args.restart and Path(output).exists():
+        Path(output).unlink()
+
+    health = get_service().health()
+    if not health['ok']:
+        print(f"Retrieval is unavailable, content will not be grounded: {health['error']}", file=sys.stderr)
+
+    runner = CampaignRunner(args.concurrency, args.retrieval_batch)
+    try:
+        stats = asyncio.run(runner.run(args.input, output))
+    finally:
+        get_service().close()
+
+    print("\nSummary:")
+    print(f"- {stats.requests} requests in {stats.segments} segments, {stats.resumed} done in an earlier run")
+    print(f"- Generated {stats.ok}, failed {stats.errors}, in {stats.elapsed:.1f}s")
+    responses = get_responses()
+    if responses is not None:
+        print(f"- Response cache: {responses.stats}")
+    print(f"- Results: {output}")
+
+
+if __name__ == "__main__":
+    main()
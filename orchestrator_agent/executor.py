@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from typing import Any, Iterable
+
+from strands.tools.executors import ConcurrentToolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedToolExecutor(ConcurrentToolExecutor):
+    """Runs independent tool calls from one model turn concurrently, at most ``max_concurrency`` at a time
+
+    Calls to the same tool are treated as dependent and run one after
+    another in the order the model asked for them (a customer lookup then an
+    update must not race), unless the tool is listed in ``parallel_safe``.
+    Calls to different tools run side by side. Results are returned in the
+    order of the original calls, whichever finishes first.
+    """
+
+    def __init__(self, max_concurrency: int = 4, parallel_safe: Iterable[str] = ()):
+        super().__init__()
+        self.max_concurrency = max_concurrency
+        self.parallel_safe = set(parallel_safe)
+
+    def _lanes(self, tool_uses: list) -> list[list[int]]:
+        """Group call positions into lanes that run sequentially; lanes run concurrently"""
+        lanes = {}
+        for position, tool_use in enumerate(tool_uses):
+            name = tool_use['name']
+            key = (name, position) if name in self.parallel_safe else name
+            lanes.setdefault(key, []).append(position)
+        return list(lanes.values())
+
+    async def _execute(self, agent, tool_uses, tool_results, cycle_trace, cycle_span, invocation_state,
+                       structured_output_context=None):
+        # Same event protocol as ConcurrentToolExecutor: each task reports its
+        # events through the queue and waits until the event has been yielded
+        task_queue: asyncio.Queue[tuple[int, Any]] = asyncio.Queue()
+        task_events = [asyncio.Event() for _ in tool_uses]
+        task_results = [[] for _ in tool_uses]
+        stop_event = object()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        lanes = self._lanes(tool_uses)
+        if len(lanes) > 1:
+            logger.info(f"Running {len(tool_uses)} tool calls in {len(lanes)} concurrent lanes")
+
+        async def run_lane(lane: list[int]):
+            for task_id in lane:
+                async with semaphore:
+                    await self._task(agent, tool_uses[task_id], task_results[task_id], cycle_trace, cycle_span,
+                                     invocation_state, task_id, task_queue, task_events[task_id], stop_event,
+                                     structured_output_context)
+
+        tasks = [asyncio.create_task(run_lane(lane)) for lane in lanes]
+        try:
+            task_count = len(tool_uses)
+            while task_count:
+                task_id, event = await task_queue.get()
+                if event is stop_event:
+                    task_count -= 1
+                    continue
+
+                if isinstance(event, Exception):
+                    raise event
+
+                yield event
+                task_events[task_id].set()
+            for results in task_results:
+                tool_results.extend(results)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
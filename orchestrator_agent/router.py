@@ -0,0 +1,140 @@
+import logging
+import re
+import threading
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CUSTOMER, CONTENT = 'customer', 'content'
+
+# Articles and adjectives allowed between a verb and its object
+_MODIFIERS = r'(?:(?:a|an|the|this|that|new|existing|some|short|personalized|their|his|her)\s+)*'
+
+# Phrases that only make sense for one intent
+KEYWORD_RULES = {
+    CUSTOMER: re.compile(
+        r'\b(?:create|add|register|update|change|modify|look ?up|find|get|retrieve|delete)\s+' + _MODIFIERS +
+        r'(?:customers?|records?|profiles?|accounts?)\b'
+        r'|\bccid\b|\bcustomer id\b|\bphone number\b',
+        re.IGNORECASE
+    ),
+    CONTENT: re.compile(
+        r'\b(?:create|write|generate|draft|compose|make|produce)\s+' + _MODIFIERS +
+        r'(?:content|messages?|copy|emails?|sms|texts?|posts?|articles?|summary|explanation)\b',
+        re.IGNORECASE
+    ),
+}
+
+# Bulk operations have their own tool, which only the orchestrator holds
+BULK_RULE = re.compile(r'\b(?:import|export|bulk|upload)\b|\.(?:csv|jsonl|ndjson)\b', re.IGNORECASE)
+
+# Examples whose embeddings form each intent's centroid
+INTENT_EXAMPLES = {
+    CUSTOMER: [
+        "create a new customer with id 1234 first name Jane last name Smith",
+        "update the phone number for customer 0042",
+        "look up the customer record for ccid 7781",
+        "change the last name on this customer's profile",
+        "add John Doe 215-555-0100 as a customer",
+        "does customer 0001 exist",
+    ],
+    CONTENT: [
+        "create content for a young adult getting their first health insurance policy",
+        "write a message explaining dental coverage options to a family",
+        "explain what a deductible is for someone new to insurance",
+        "draft an email about Medicare Advantage plans for a retiree",
+        "what healthcare plans are available for a small business owner",
+        "generate a short text about preventive care benefits",
+    ],
+}
+
+_FIRST_NAME = re.compile(r'first name:?\s*([A-Z][\w\'-]*)', re.IGNORECASE)
+_LAST_NAME = re.compile(r'last name:?\s*([A-Z][\w\'-]*)', re.IGNORECASE)
+_FOR_NAME = re.compile(r'\bfor (?:customer\s+)?([A-Z][a-z\'-]+) ([A-Z][a-z\'-]+)\b')
+
+
+@dataclass
+class Route:
+    intent: str
+    confidence: float
+    source: str           # 'rules' or 'centroid'
+
+
+def customer_name(prompt: str) -> tuple[str, str]:
+    """First and last name mentioned in a request, or empty strings"""
+    first, last = _FIRST_NAME.search(prompt), _LAST_NAME.search(prompt)
+    if first or last:
+        return first.group(1) if first else '', last.group(1) if last else ''
+    match = _FOR_NAME.search(prompt)
+    return (match.group(1), match.group(2)) if match else ('', '')
+
+
+class IntentRouter:
+    """Classifies requests as customer or content operations without a model call
+
+    Keyword rules decide first: a request that matches exactly one intent's
+    rules goes to that intent. A request matching neither is compared with
+    each intent's centroid, the mean embedding of ``INTENT_EXAMPLES``, and is
+    routed when its best similarity is at least ``min_similarity`` and beats
+    the runner-up by ``margin``. Requests matching both intents, close to
+    neither centroid, or asking for a bulk import or export return ``None``
+    and are left to the LLM orchestrator.
+
+    ``embed`` embeds a single query, or returns ``None`` to use ``embed_fn``;
+    pass the retriever's query cache so the embedding is reused when the
+    content tool searches with the same prompt.
+    """
+
+    def __init__(self, embed_fn: Callable[[list[str]], list[list[float]]],
+                 embed: Optional[Callable[[str], np.ndarray]] = None, examples: dict = INTENT_EXAMPLES,
+                 min_similarity: float = 0.6, margin: float = 0.05):
+        self.embed_fn = embed_fn
+        self.embed = embed
+        self.examples = examples
+        self.min_similarity = min_similarity
+        self.margin = margin
+        self.lock = threading.Lock()
+        self.intents = list(examples)
+        self.centroids = None
+
+    def route(self, prompt: str) -> Optional[Route]:
+        if BULK_RULE.search(prompt):
+            logger.debug("Bulk customer request; leaving it to the orchestrator")
+            return None
+        matched = [intent for intent, rule in KEYWORD_RULES.items() if rule.search(prompt)]
+        if len(matched) == 1:
+            return Route(matched[0], 1.0, 'rules')
+        if matched:
+            logger.debug(f"Request matches several intents {matched}; leaving it to the orchestrator")
+            return None
+
+        scores = self._centroids() @ self._embed(prompt)
+        ranked = np.argsort(-scores)
+        best, runner_up = float(scores[ranked[0]]), float(scores[ranked[1]]) if len(ranked) > 1 else -1.0
+        if best < self.min_similarity or best - runner_up < self.margin:
+            logger.debug(f"No confident intent for request (best {best:.3f}, runner-up {runner_up:.3f})")
+            return None
+        return Route(self.intents[ranked[0]], best, 'centroid')
+
+    def _embed(self, prompt: str) -> np.ndarray:
+        embedding = self.embed(prompt) if self.embed is not None else None
+        if embedding is not None:
+            return embedding
+        return _unit(np.asarray(self.embed_fn([prompt])[0], dtype=np.float32))
+
+    def _centroids(self) -> np.ndarray:
+        with self.lock:
+            if self.centroids is None:
+                centroids = []
+                for intent in self.intents:
+                    vectors = np.asarray(self.embed_fn(self.examples[intent]), dtype=np.float32)
+                    centroids.append(_unit(np.mean([_unit(vector) for vector in vectors], axis=0)))
+                self.centroids = np.stack(centroids)
+            return self.centroids
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
@@ -0,0 +1,127 @@
+"""Local streaming endpoint for the orchestrator
+
+``GET /events?prompt=...`` streams conversation events as server-sent events.
+``/event/realtime`` is a WebSocket speaking the part of the AppSync Events
+protocol that ``websocket-client.js`` uses; publishing an event with a
+``prompt`` streams that conversation to the channel's subscribers.
+"""
+import asyncio
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from orchestrator_agent.agent import stream_conversation
+from retrieval.service import get_service
+
+logger = logging.getLogger(__name__)
+
+STREAM_HOST = os.environ.get("STREAM_HOST", "127.0.0.1")
+STREAM_PORT = int(os.environ.get("STREAM_PORT", 8080))
+SUBPROTOCOL = 'aws-appsync-event-ws'
+
+# channel -> {websocket: subscription id}
+subscribers: dict[str, dict[WebSocket, str]] = {}
+
+
+async def _events(prompt: str) -> AsyncIterator[dict]:
+    try:
+        async for event in stream_conversation(prompt):
+            yield event
+    except Exception as e:
+        logger.exception(f"Conversation failed: {e}")
+        yield {'type': 'error', 'message': str(e)}
+
+
+async def sse(request) -> StreamingResponse:
+    prompt = request.query_params.get('prompt')
+    if not prompt:
+        return JSONResponse({'error': 'prompt is required'}, status_code=400)
+
+    async def body():
+        async for event in _events(prompt):
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(body(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+async def health(request) -> JSONResponse:
+    status = await asyncio.to_thread(get_service().health)
+    return JSONResponse(status, status_code=200 if status['ok'] else 503)
+
+
+async def _broadcast(channel: str, event: dict):
+    for websocket, subscription in list(subscribers.get(channel, {}).items()):
+        try:
+            await websocket.send_json({'type': 'data', 'id': subscription, 'events': [json.dumps(event)]})
+        except Exception:
+            subscribers.get(channel, {}).pop(websocket, None)
+
+
+async def _converse(channel: str, prompt: str):
+    async for event in _events(prompt):
+        await _broadcast(channel, event)
+
+
+async def realtime(websocket: WebSocket):
+    requested = websocket.headers.get('sec-websocket-protocol', '')
+    await websocket.accept(subprotocol=SUBPROTOCOL if SUBPROTOCOL in requested else None)
+    conversations = set()
+    try:
+        while True:
+            message = await websocket.receive_json()
+            kind = message.get('type')
+            if kind == 'connection_init':
+                await websocket.send_json({'type': 'connection_ack', 'connectionTimeoutMs': 300000})
+            elif kind == 'subscribe':
+                subscribers.setdefault(message['channel'], {})[websocket] = message['id']
+                await websocket.send_json({'type': 'subscribe_success', 'id': message['id']})
+            elif kind == 'unsubscribe':
+                for channel in subscribers.values():
+                    if channel.get(websocket) == message.get('id'):
+                        channel.pop(websocket)
+                await websocket.send_json({'type': 'unsubscribe_success', 'id': message.get('id')})
+            elif kind == 'publish':
+                await websocket.send_json({'type': 'publish_success', 'id': message['id']})
+                for raw in message.get('events', []):
+                    event = json.loads(raw)
+                    if isinstance(event, dict) and event.get('prompt'):
+                        task = asyncio.create_task(_converse(message['channel'], event['prompt']))
+                        conversations.add(task)
+                        task.add_done_callback(conversations.discard)
+                    else:
+                        await _broadcast(message['channel'], event)
+            else:
+                await websocket.send_json({'type': 'error', 'id': message.get('id'),
+                                           'errors': [{'errorType': 'UnsupportedOperation',
+                                                       'message': f"Unknown message type {kind}"}]})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for channel in subscribers.values():
+            channel.pop(websocket, None)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    get_service().close()
+
+
+app = Starlette(routes=[
+    Route('/events', sse),
+    Route('/health', health),
+    WebSocketRoute('/event/realtime', realtime),
+], lifespan=lifespan)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, host=STREAM_HOST, port=STREAM_PORT)
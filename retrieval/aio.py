@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+from retrieval.backend import (CHROMA_HOST, CHROMA_PORT, EMBEDDING_MODEL, OLLAMA_URL, ollama_async_embedding_function,
+                               open_async_chroma_collection)
+from retrieval.hybrid import HybridRetriever
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRetriever:
+    """asyncio front end to a ``HybridRetriever``
+
+    Query embedding and, on the Chroma backend, the vector query are awaited
+    on asyncio clients, so many searches can wait on the network from one
+    thread. The remaining work is local and short (BM25 lookups in SQLite,
+    the embedded store's NumPy scans, cache lookups) and runs on the event
+    loop's default executor. Without ``collection`` or ``embed_fn`` the
+    retriever's own blocking ones are used on the executor too.
+    """
+
+    def __init__(self, retriever: HybridRetriever, collection=None,
+                 embed_fn: Optional[Callable[[list[str]], Awaitable[list[list[float]]]]] = None):
+        self.retriever = retriever
+        self.collection = collection
+        self.embed_fn = embed_fn
+
+    async def search(self, query: str, n_results: int = 5, mode: str = 'auto') -> dict:
+        retriever, cache = self.retriever, self.retriever.cache
+        mode, result = await asyncio.to_thread(retriever.route, query, n_results, mode)
+        if result is not None:
+            return result
+        if cache is None:
+            return await asyncio.to_thread(retriever.search, query, n_results, mode)
+
+        embedding = cache.cached_embedding(query)
+        if embedding is None:
+            if self.embed_fn is not None:
+                embeddings = await self.embed_fn([query])
+            else:
+                embeddings = await asyncio.to_thread(cache.embed_fn, [query])
+            embedding = cache.add_embedding(query, embeddings[0])
+        key = retriever.cache_key(n_results, mode)
+        # May check the collection version over the network
+        result = await asyncio.to_thread(cache.get, embedding, key)
+        if result is not None:
+            return result
+
+        options = retriever.vector_options(n_results, mode)
+        if self.collection is not None:
+            vector = await self.collection.query(query_embeddings=[embedding.tolist()], **options)
+        else:
+            vector = await asyncio.to_thread(retriever.collection.query, query_embeddings=[embedding.tolist()],
+                                             **options)
+        result = await asyncio.to_thread(retriever.fuse, query, vector, n_results, mode)
+        cache.put(embedding, key, result)
+        return result
+
+
+async def open_async_retriever(retriever: HybridRetriever, name: str = "html_documents", backend: str = 'chroma',
+                               chroma_host: str = CHROMA_HOST, chroma_port: int = CHROMA_PORT,
+                               embedding_function: Optional[Callable] = None, embedding_model: str = EMBEDDING_MODEL,
+                               ollama_url: str = OLLAMA_URL, **_) -> AsyncRetriever:
+    """Wrap an open retriever, adding asyncio clients for the network calls it makes
+
+    Takes the options the retriever was opened with. A custom blocking
+    ``embedding_function`` is kept and run on the executor.
+    """
+    collection = await open_async_chroma_collection(name, chroma_host, chroma_port) if backend == 'chroma' else None
+    embed_fn = ollama_async_embedding_function(embedding_model, ollama_url) if embedding_function is None else None
+    return AsyncRetriever(retriever, collection, embed_fn)
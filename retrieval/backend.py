@@ -0,0 +1,197 @@
+import logging
+import os
+import threading
+from functools import lru_cache
+from typing import Callable, Optional, Protocol
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_BACKEND = os.environ.get("RETRIEVAL_BACKEND", "chroma")
+CHROMA_HOST = os.environ.get("CHROMA_HOST", "localhost")
+CHROMA_PORT = int(os.environ.get("CHROMA_PORT", 8000))
+VECTOR_STORE_DIR = os.environ.get("VECTOR_STORE_DIR", ".vector_store")
+VECTOR_INDEX = os.environ.get("VECTOR_INDEX", "auto")
+VECTOR_STORAGE = os.environ.get("VECTOR_STORAGE") or None
+LEXICAL_INDEX_DIR = os.environ.get("LEXICAL_INDEX_DIR", ".lexical_index")
+VECTOR_DIMS = int(os.environ["VECTOR_DIMS"]) if os.environ.get("VECTOR_DIMS") else None
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "nomic-embed-text:latest")
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
+CHROMA_MAX_CONNECTIONS = int(os.environ.get("CHROMA_MAX_CONNECTIONS", 32))
+CHROMA_KEEPALIVE_SECS = float(os.environ.get("CHROMA_KEEPALIVE_SECS", 60))
+
+BACKENDS = ('chroma', 'embedded')
+
+# Collection metadata key that ingestion bumps after changing a Chroma collection
+VERSION_KEY = "index_version"
+
+# Shared Chroma clients by (host, port), and the client that opened each collection by collection ID
+_chroma_clients = {}
+_collection_clients = {}
+_client_lock = threading.Lock()
+
+
+class Collection(Protocol):
+    """The collection operations ingestion and retrieval rely on
+
+    Satisfied by a Chroma collection and by ``retrieval.store.VectorStore``.
+    """
+
+    def upsert(self, ids, embeddings=None, documents=None, metadatas=None): ...
+
+    def update(self, ids, embeddings=None, documents=None, metadatas=None): ...
+
+    def delete(self, ids): ...
+
+    def get(self, ids=None, include=...) -> dict: ...
+
+    def query(self, query_embeddings=None, query_texts=None, n_results: int = 10, include=...) -> dict: ...
+
+    def count(self) -> int: ...
+
+
+@lru_cache(maxsize=None)
+def ollama_embedding_function(model: str = EMBEDDING_MODEL, url: str = OLLAMA_URL) -> Callable[[list[str]], list[list[float]]]:
+    """Embed query texts with the same Ollama model used at ingest time
+
+    One embedder, and so one pool of HTTP connections, is shared per model and server.
+    """
+    import ollama
+    from ingestion.embedder import BatchEmbedder
+
+    return BatchEmbedder(model=model, client=ollama.Client(host=url)).embed
+
+
+def chroma_client(host: str = CHROMA_HOST, port: int = CHROMA_PORT):
+    """The process-wide Chroma client for a server, created on first use
+
+    Chroma clients keep a pool of keep-alive HTTP connections, so sharing one
+    per server avoids a connection setup per request.
+    """
+    import chromadb
+    from chromadb.config import Settings
+
+    key = (host, port)
+    with _client_lock:
+        client = _chroma_clients.get(key)
+        if client is None:
+            client = chromadb.HttpClient(host=host, port=port, settings=Settings(
+                chroma_http_max_connections=CHROMA_MAX_CONNECTIONS,
+                chroma_http_max_keepalive_connections=CHROMA_MAX_CONNECTIONS,
+                chroma_http_keepalive_secs=CHROMA_KEEPALIVE_SECS,
+            ))
+            _chroma_clients[key] = client
+            logger.info(f"Connected to Chroma at {host}:{port}")
+        return client
+
+
+def ollama_async_embedding_function(model: str = EMBEDDING_MODEL, url: str = OLLAMA_URL):
+    """Coroutine function that embeds query texts without blocking the event loop"""
+    import ollama
+
+    client = ollama.AsyncClient(host=url)
+
+    async def embed(texts: list[str]) -> list[list[float]]:
+        response = await client.embed(model=model, input=texts)
+        return response['embeddings']
+
+    return embed
+
+
+async def open_async_chroma_collection(name: str = "html_documents", chroma_host: str = CHROMA_HOST,
+                                       chroma_port: int = CHROMA_PORT):
+    """Open an existing Chroma collection with the asyncio client
+
+    Async clients are bound to the event loop that created them, so they are
+    not shared like ``chroma_client``.
+    """
+    import chromadb
+    from chromadb.config import Settings
+
+    client = await chromadb.AsyncHttpClient(host=chroma_host, port=chroma_port, settings=Settings(
+        chroma_http_max_connections=CHROMA_MAX_CONNECTIONS,
+        chroma_http_max_keepalive_connections=CHROMA_MAX_CONNECTIONS,
+        chroma_http_keepalive_secs=CHROMA_KEEPALIVE_SECS,
+    ))
+    return await client.get_collection(name=name)
+
+
+def open_collection(name: str = "html_documents", backend: Optional[str] = None, create: bool = True,
+                    embedding_function: Optional[Callable] = None, chroma_host: str = CHROMA_HOST,
+                    chroma_port: int = CHROMA_PORT, store_dir: str = VECTOR_STORE_DIR,
+                    index: str = VECTOR_INDEX, storage: Optional[str] = VECTOR_STORAGE,
+                    dims: Optional[int] = VECTOR_DIMS, embedding_model: str = EMBEDDING_MODEL,
+                    ollama_url: str = OLLAMA_URL) -> Collection:
+    """Open a collection on the configured retrieval backend
+
+    ``chroma`` talks to a Chroma server over HTTP; ``embedded`` searches a
+    local ``VectorStore`` in this process. The backend defaults to the
+    ``RETRIEVAL_BACKEND`` environment variable. ``storage`` (float32, float16
+    or int8) and ``dims`` only apply when an embedded collection is created.
+    An embedded collection opened without ``create`` is read-only and picks
+    up writes made by the ingesting process.
+    """
+    backend = backend or RETRIEVAL_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown retrieval backend {backend!r}; expected one of {BACKENDS}")
+
+    if backend == 'embedded':
+        from retrieval.store import VectorStore
+
+        if not create and not os.path.isdir(os.path.join(store_dir, name)):
+            raise ValueError(f"Collection {name} does not exist in {store_dir}")
+        # Searching processes follow the ingesting one's writes instead of writing themselves
+        collection = VectorStore(store_dir, name, embedding_function or ollama_embedding_function(embedding_model, ollama_url),
+                                 index=index, storage=storage, dims=dims, read_only=not create)
+        logger.info(f"Opened embedded collection {name} ({collection.count()} vectors, index={index}, "
+                    f"storage={collection.storage}, dims={collection.dims or 'all'})")
+        return collection
+
+    from chromadb.utils.embedding_functions import OllamaEmbeddingFunction
+
+    client = chroma_client(chroma_host, chroma_port)
+    if not create:
+        collection = client.get_collection(name=name)
+    else:
+        # The embedding function is persisted with the collection so query_texts
+        # are embedded with the same model as the precomputed chunk embeddings.
+        collection = client.get_or_create_collection(
+            name=name,
+            embedding_function=embedding_function or OllamaEmbeddingFunction(url=ollama_url, model_name=embedding_model)
+        )
+    _collection_clients[collection.id] = client
+    return collection
+
+
+def collection_version(collection):
+    """A value that changes whenever the collection's contents change
+
+    Embedded collections count their own writes. For Chroma this is the
+    ``VERSION_KEY`` that ingestion stamps into the collection metadata,
+    together with the chunk count to catch writers that do not stamp it.
+    """
+    version = getattr(collection, 'version', None)
+    if callable(version):
+        return version()
+    client = _collection_clients.get(collection.id)
+    current = client.get_collection(name=collection.name) if client is not None else collection
+    return (current.metadata or {}).get(VERSION_KEY, 0), current.count()
+
+
+def bump_version(collection):
+    """Mark a Chroma collection as changed so cached query results are dropped"""
+    if callable(getattr(collection, 'version', None)):
+        return
+    # hnsw:* keys are fixed at creation and cannot be passed to modify
+    metadata = {key: value for key, value in (collection.metadata or {}).items() if not key.startswith('hnsw:')}
+    metadata[VERSION_KEY] = int(metadata.get(VERSION_KEY, 0)) + 1
+    try:
+        collection.modify(metadata=metadata)
+    except Exception as e:
+        logger.warning(f"Could not update the version of collection {collection.name}: {e}")
+
+
+def close_collection(collection):
+    """Flush and release an embedded collection; Chroma collections need no cleanup"""
+    close = getattr(collection, 'close', None)
+    if close is not None:
+        close()
@@ -0,0 +1,190 @@
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from ingestion.chunker import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 1500))
+
+_WORD = re.compile(r'\w+')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+@dataclass
+class Passage:
+    text: str
+    metadata: dict
+    relevance: float
+    chunk_indices: list[int] = field(default_factory=list)
+    shingles: frozenset = frozenset()
+
+    @property
+    def page(self):
+        return self.metadata.get('filename')
+
+
+def _shingles(text: str, size: int = 3) -> frozenset:
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return frozenset([' '.join(words)])
+    return frozenset(' '.join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def _containment(a: frozenset, b: frozenset) -> float:
+    """Share of the smaller set found in the larger"""
+    return len(a & b) / min(len(a), len(b)) if a and b else 0.0
+
+
+class ContextPacker:
+    """Turns retrieval results into a prompt context that fits a token budget
+
+    Results are taken in rank order. Chunks that duplicate a better-ranked
+    one (``duplicate_threshold`` of their word 3-grams contained in it) are
+    dropped. The rest are reordered by maximal marginal relevance, trading
+    rank against 3-gram similarity to passages already chosen (``mmr_lambda``
+    weights rank). Consecutive chunks of the same page are then merged into
+    one passage, without their repeated heading breadcrumb and overlap, at
+    the position of the best of them; chunks shared by several pages stay
+    on their own. Passages are added until
+    ``budget`` tokens, as counted by ``count_tokens`` for the generating
+    model, and the passage that crosses the budget is cut at a sentence, or
+    at a word when not even its first sentence fits.
+    """
+
+    def __init__(self, count_tokens: Callable[[str], int] = estimate_tokens, budget: int = CONTEXT_TOKEN_BUDGET,
+                 mmr_lambda: float = 0.7, duplicate_threshold: float = 0.8, min_passage_tokens: int = 48):
+        self.count_tokens = count_tokens
+        self.budget = budget
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_threshold = duplicate_threshold
+        self.min_passage_tokens = min_passage_tokens
+
+    def pack(self, results: dict) -> str:
+        """Context text for a Chroma-format query result (first query only)"""
+        passages = self._dedupe(self._passages(results))
+        passages = self._merge_adjacent(self._mmr(passages))
+        return self._fit(passages)
+
+    def _passages(self, results: dict) -> list[Passage]:
+        ids, documents = results['ids'][0], results['documents'][0]
+        metadatas = (results.get('metadatas') or [[None] * len(ids)])[0]
+        seen, passages = set(), []
+        for rank, (chunk_id, document, metadata) in enumerate(zip(ids, documents, metadatas)):
+            if chunk_id in seen or not document:
+                continue
+            seen.add(chunk_id)
+            metadata = metadata or {}
+            # A chunk collapsed from several pages only has its first page's position, so it is never merged
+            index = metadata.get('chunk_index') if int(metadata.get('source_count') or 1) <= 1 else None
+            passages.append(Passage(document, metadata, 1.0 - rank / len(ids),
+                                    [index] if index is not None else [], _shingles(document)))
+        return passages
+
+    def _dedupe(self, passages: list[Passage]) -> list[Passage]:
+        kept = []
+        for passage in passages:
+            if any(_containment(passage.shingles, other.shingles) >= self.duplicate_threshold for other in kept):
+                continue
+            kept.append(passage)
+        if len(kept) < len(passages):
+            logger.debug(f"Dropped {len(passages) - len(kept)} duplicate chunks")
+        return kept
+
+    def _mmr(self, passages: list[Passage]) -> list[Passage]:
+        remaining, chosen = list(passages), []
+        while remaining:
+            best = max(remaining, key=lambda passage: self.mmr_lambda * passage.relevance - (1 - self.mmr_lambda) * max(
+                (_jaccard(passage.shingles, other.shingles) for other in chosen), default=0.0))
+            remaining.remove(best)
+            chosen.append(best)
+        return chosen
+
+    def _merge_adjacent(self, passages: list[Passage]) -> list[Passage]:
+        """Merge runs of consecutive chunks from one page into the best-placed chunk of the run"""
+        merged = []
+        by_page = {}
+        for passage in passages:
+            if passage.page is None or not passage.chunk_indices:
+                merged.append(passage)
+                continue
+            for other in by_page.get(passage.page, []):
+                if passage.chunk_indices[0] == other.chunk_indices[-1] + 1:
+                    other.text = _join(other.text, passage.text, other.metadata.get('headings'))
+                    other.chunk_indices += passage.chunk_indices
+                    break
+                if passage.chunk_indices[-1] + 1 == other.chunk_indices[0]:
+                    other.text = _join(passage.text, other.text, other.metadata.get('headings'))
+                    other.chunk_indices[:0] = passage.chunk_indices
+                    break
+            else:
+                merged.append(passage)
+                by_page.setdefault(passage.page, []).append(passage)
+        return merged
+
+    def _fit(self, passages: list[Passage]) -> str:
+        sections, used = [], 0
+        for passage in passages:
+            header = _header(len(sections) + 1, passage.metadata)
+            text = f"{header}\n{passage.text}"
+            tokens = self.count_tokens(text)
+            if used + tokens > self.budget:
+                remaining = self.budget - used - self.count_tokens(header)
+                truncated = self._truncate(passage.text, remaining) if remaining >= self.min_passage_tokens else ''
+                if truncated:
+                    sections.append(f"{header}\n{truncated}")
+                break
+            sections.append(text)
+            used += tokens + 1
+        return '\n\n'.join(sections)
+
+    def _truncate(self, text: str, budget: int) -> str:
+        kept, used = [], 0
+        for sentence in _SENTENCE_END.split(text):
+            tokens = self.count_tokens(sentence)
+            if used + tokens > budget:
+                break
+            kept.append(sentence)
+            used += tokens
+        # Counts of sentences need not add up exactly once joined, so check the result
+        if kept and self.count_tokens(' '.join(kept)) <= budget:
+            return ' '.join(kept)
+        # Otherwise keep the longest run of words that fits
+        words = text.split()
+        low, high = 0, len(words)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count_tokens(' '.join(words[:middle])) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        return ' '.join(words[:low])
+
+
+def _join(first: str, second: str, headings: Optional[str] = None) -> str:
+    """Concatenate consecutive chunks, dropping the breadcrumb and overlap the second repeats"""
+    if headings and second.startswith(f"{headings}\n\n"):
+        second = second[len(headings) + 2:]
+    lead = second.split('\n\n', 1)
+    # The chunker carries whole trailing sentences of one chunk into the next
+    if len(lead) == 2 and lead[0].strip() and first.rstrip().endswith(lead[0].strip()):
+        second = lead[1]
+    return f"{first.rstrip()}\n\n{second.lstrip()}"
+
+
+def _header(number: int, metadata: dict) -> str:
+    title = metadata.get('title') or metadata.get('filename') or 'Source'
+    url = metadata.get('original_url')
+    return f"[{number}] {title} ({url})" if url else f"[{number}] {title}"
+
+
+def pack_context(results: dict, count_tokens: Callable[[str], int] = estimate_tokens,
+                 budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    return ContextPacker(count_tokens, budget).pack(results)
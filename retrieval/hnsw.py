@@ -0,0 +1,223 @@
+import heapq
+import logging
+import math
+import pickle
+import random
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_EMPTY = np.empty(0, dtype=np.int32)
+
+
+class HNSWIndex:
+    """Hierarchical navigable small world graph over the slots of a vector store
+
+    Vectors are read through ``vectors``, which returns the store's current
+    memory-mapped array of (possibly quantized) vectors, so the graph only
+    holds neighbour lists. Queries must be float32 in the same space.
+    Level 0 lists are a memory-mapped ``int32`` array with ``2 * m``
+    columns; the sparse upper levels are kept in memory and pickled on
+    ``save``. Nodes are never removed: callers filter dead slots from the
+    results and rebuild the graph once too many accumulate.
+
+    ``name`` prefixes the graph's files, so a new graph can be built next
+    to the one in use. A ``read_only`` graph maps the level 0 file without
+    writing to it, so another process can keep adding nodes; links to slots
+    beyond the vectors this process has mapped are skipped.
+    """
+
+    def __init__(self, path: Path, vectors: Callable[[], np.ndarray], m: int = 16,
+                 ef_construction: int = 100, ef_search: int = 64, seed: Optional[int] = None,
+                 read_only: bool = False, name: str = 'hnsw'):
+        self.path = Path(path)
+        self.read_only = read_only
+        self.vectors = vectors
+        self.m = m
+        self.m0 = 2 * m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.level_mult = 1 / math.log(m)
+        self.rng = random.Random(seed)
+        self.graph_file = self.path / f"{name}_level0.i32"
+        self.state_file = self.path / f"{name}.pkl"
+
+        self.levels = np.zeros(0, dtype=np.int8)
+        self.upper = {}
+        self.entry = None
+        self.max_level = -1
+        self.graph0 = None
+        self.links = None
+        if self.state_file.exists():
+            with open(self.state_file, 'rb') as f:
+                state = pickle.load(f)
+            self.levels, self.upper = state['levels'], state['upper']
+            self.entry, self.max_level = state['entry'], state['max_level']
+            rows = self.graph_file.stat().st_size // (self.m0 * 4)
+            if rows:
+                self.graph0 = np.memmap(self.graph_file, dtype=np.int32, mode='r' if read_only else 'r+',
+                                        shape=(rows, self.m0))
+                self.links = np.asarray(self.graph0)
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.levels >= 0))
+
+    def exists(self) -> bool:
+        return self.state_file.exists()
+
+    def reset(self):
+        self.levels = np.zeros(0, dtype=np.int8)
+        self.upper = {}
+        self.entry = None
+        self.max_level = -1
+        self.graph0 = None
+        self.links = None
+        self.graph_file.unlink(missing_ok=True)
+        self.state_file.unlink(missing_ok=True)
+
+    def resize(self, capacity: int):
+        """Make room for ``capacity`` slots"""
+        rows = 0 if self.graph0 is None else self.graph0.shape[0]
+        if not self.read_only and capacity > rows:
+            if self.graph0 is not None:
+                self.graph0.flush()
+            with open(self.graph_file, 'ab') as f:
+                f.write(np.full((capacity - rows, self.m0), -1, dtype=np.int32).tobytes())
+            self.graph0 = np.memmap(self.graph_file, dtype=np.int32, mode='r+', shape=(capacity, self.m0))
+            self.links = np.asarray(self.graph0)
+        # After a crash the level 0 file can be larger than the levels saved with it
+        if capacity > len(self.levels):
+            levels = np.full(capacity, -1, dtype=np.int8)
+            levels[:len(self.levels)] = self.levels
+            self.levels = levels
+
+    def save(self):
+        if self.graph0 is not None:
+            self.graph0.flush()
+        else:
+            # An empty graph is saved too, so a store swapped to it finds it on reopening
+            self.graph_file.touch()
+        tmp = self.state_file.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            pickle.dump({'levels': self.levels, 'upper': self.upper,
+                         'entry': self.entry, 'max_level': self.max_level}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp.replace(self.state_file)
+
+    def _array(self) -> np.ndarray:
+        # Plain ndarray view: fancy indexing a memmap subclass is noticeably slower
+        return np.asarray(self.vectors())
+
+    def _neighbors(self, node: int, level: int) -> list[int]:
+        if level == 0:
+            if node >= len(self.links):
+                return []
+            return [n for n in self.links[node].tolist() if n >= 0]
+        return self.upper[level].get(node, _EMPTY).tolist()
+
+    def _set_neighbors(self, node: int, level: int, neighbors: list[int]):
+        if level == 0:
+            row = np.full(self.m0, -1, dtype=np.int32)
+            row[:len(neighbors)] = neighbors
+            self.links[node] = row
+        else:
+            self.upper.setdefault(level, {})[node] = np.asarray(neighbors, dtype=np.int32)
+
+    def _search_layer(self, query: np.ndarray, entries: list[tuple[float, int]], ef: int,
+                      level: int) -> list[tuple[float, int]]:
+        """Best-first search of one layer; returns up to ``ef`` (similarity, node) pairs, best first"""
+        vectors = self._array()
+        limit = len(vectors)
+        visited = {node for _, node in entries}
+        candidates = [(-sim, node) for sim, node in entries]
+        heapq.heapify(candidates)
+        results = list(entries)
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            negative, node = heapq.heappop(candidates)
+            if len(results) >= ef and -negative < results[0][0]:
+                break
+            fresh = [n for n in self._neighbors(node, level) if n not in visited and n < limit]
+            if not fresh:
+                continue
+            visited.update(fresh)
+            sims = (vectors[fresh] @ query).tolist()
+            for sim, neighbor in zip(sims, fresh):
+                if len(results) < ef or sim > results[0][0]:
+                    heapq.heappush(candidates, (-sim, neighbor))
+                    heapq.heappush(results, (sim, neighbor))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        return sorted(results, reverse=True)
+
+    def _select(self, candidates: list[tuple[float, int]], m: int) -> list[int]:
+        """Neighbour selection heuristic: prefer candidates not already covered by a closer neighbour"""
+        if len(candidates) <= m:
+            return [node for _, node in candidates]
+        nodes = [node for _, node in candidates]
+        block = self._array()[nodes].astype(np.float32)
+        pairwise = block @ block.T
+        # Highest similarity of each candidate to any neighbour selected so far
+        covered = np.full(len(nodes), -np.inf, dtype=np.float32)
+        selected, pruned = [], []
+        for position, (sim, _) in enumerate(candidates):
+            if len(selected) >= m:
+                break
+            if covered[position] > sim:
+                pruned.append(position)
+                continue
+            selected.append(position)
+            np.maximum(covered, pairwise[position], out=covered)
+        return [nodes[i] for i in selected + pruned[:m - len(selected)]]
+
+    def add(self, slot: int):
+        vectors = self._array()
+        query = np.asarray(vectors[slot], dtype=np.float32)
+        level = int(-math.log(1.0 - self.rng.random()) * self.level_mult)
+        self.levels[slot] = level
+        for lvl in range(1, level + 1):
+            self.upper.setdefault(lvl, {})[slot] = _EMPTY
+        if self.entry is None:
+            self.entry, self.max_level = slot, level
+            return
+
+        entries = [(float(vectors[self.entry] @ query), self.entry)]
+        for lvl in range(self.max_level, level, -1):
+            entries = self._search_layer(query, entries, 1, lvl)[:1]
+        for lvl in range(min(level, self.max_level), -1, -1):
+            found = [(sim, node) for sim, node in self._search_layer(query, entries, self.ef_construction, lvl)
+                     if node != slot]
+            neighbors = self._select(found, self.m)
+            self._set_neighbors(slot, lvl, neighbors)
+            cap = self.m0 if lvl == 0 else self.m
+            for neighbor in neighbors:
+                existing = self._neighbors(neighbor, lvl)
+                if slot in existing:
+                    continue
+                existing.append(slot)
+                if len(existing) > cap:
+                    sims = (vectors[existing].astype(np.float32) @ vectors[neighbor].astype(np.float32)).tolist()
+                    existing = self._select(sorted(zip(sims, existing), reverse=True), cap)
+                self._set_neighbors(neighbor, lvl, existing)
+            entries = found or entries
+        if level > self.max_level:
+            self.entry, self.max_level = slot, level
+
+    def search(self, query: np.ndarray, k: int, live: np.ndarray,
+               ef: Optional[int] = None) -> tuple[np.ndarray, np.ndarray]:
+        """Return the slots and similarities of the ``k`` live nodes closest to ``query``"""
+        vectors = self._array()
+        if self.entry is None or self.entry >= len(vectors):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        entries = [(float(vectors[self.entry] @ query), self.entry)]
+        for lvl in range(self.max_level, 0, -1):
+            entries = self._search_layer(query, entries, 1, lvl)
+        found = self._search_layer(query, entries, max(ef or self.ef_search, k), 0)
+        found = [(sim, node) for sim, node in found if live[node]][:k]
+        return (np.array([node for _, node in found], dtype=np.int64),
+                np.array([sim for sim, _ in found], dtype=np.float32))
@@ -0,0 +1,191 @@
+import logging
+import re
+from functools import partial
+from typing import Optional
+
+from retrieval.backend import (EMBEDDING_MODEL, OLLAMA_URL, collection_version, ollama_embedding_function,
+                               open_collection)
+from retrieval.lexical import LexicalIndex, exact_terms, open_lexical_index
+from retrieval.query_cache import QueryCache
+
+logger = logging.getLogger(__name__)
+
+SEARCH_MODES = ('auto', 'hybrid', 'vector', 'lexical')
+
+# Queries with an exact term and at most this many other words take the lexical-only path
+MAX_EXACT_QUERY_WORDS = 4
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[tuple[str, float]]:
+    """Fuse ranked ID lists: each list contributes ``1 / (k + rank)`` per ID"""
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def is_exact_query(query: str) -> bool:
+    """Whether a query is mainly an identifier, code, phone number or quoted phrase"""
+    terms = exact_terms(query)
+    if not terms:
+        return False
+    rest = re.sub(r'"[^"]*"', ' ', query)
+    for term in terms:
+        rest = rest.replace(term, ' ')
+    return len(re.findall(r'\w+', rest)) <= MAX_EXACT_QUERY_WORDS
+
+
+class HybridRetriever:
+    """Combines BM25 and vector search over the same chunks
+
+    ``hybrid`` runs both searches for ``candidates`` results each and merges
+    them with reciprocal rank fusion. In ``auto`` mode, queries that are
+    mostly exact terms (plan codes, CPT codes, phone numbers, quoted phrases)
+    are answered from the lexical index alone, skipping the embedding call,
+    and fall back to hybrid search when nothing matches. Results use Chroma's
+    query format for a single query.
+
+    With a ``cache``, queries are embedded through it and vector and hybrid
+    results are reused for repeated or near-identical queries.
+    """
+
+    def __init__(self, collection, lexical: Optional[LexicalIndex], candidates: int = 20, rrf_k: int = 60,
+                 cache: Optional[QueryCache] = None):
+        self.collection = collection
+        self.lexical = lexical
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.cache = cache
+
+    def search(self, query: str, n_results: int = 5, mode: str = 'auto') -> dict:
+        mode, result = self.route(query, n_results, mode)
+        if result is not None:
+            return result
+        if self.cache is None:
+            return self.fuse(query, self.collection.query(query_texts=[query], **self.vector_options(n_results, mode)),
+                             n_results, mode)
+        embedding = self.cache.embed(query)
+        key = self.cache_key(n_results, mode)
+        result = self.cache.get(embedding, key)
+        if result is None:
+            vector = self.collection.query(query_embeddings=[embedding.tolist()], **self.vector_options(n_results, mode))
+            result = self.fuse(query, vector, n_results, mode)
+            self.cache.put(embedding, key, result)
+        return result
+
+    def search_many(self, queries: list[str], n_results: int = 5, mode: str = 'auto') -> list[dict]:
+        """Results for several queries, sharing one embedding call and one vector query per search mode
+
+        Returns one single-query result per query, in order.
+        """
+        results = [None] * len(queries)
+        pending = {}   # resolved mode -> positions still needing a vector query
+        for position, query in enumerate(queries):
+            resolved, results[position] = self.route(query, n_results, mode)
+            if results[position] is None:
+                pending.setdefault(resolved, []).append(position)
+        if not pending:
+            return results
+
+        embeddings = {}
+        if self.cache is not None:
+            positions = [position for group in pending.values() for position in group]
+            for position in positions:
+                embeddings[position] = self.cache.cached_embedding(queries[position])
+            missing = list(dict.fromkeys(queries[position] for position in positions if embeddings[position] is None))
+            if missing:
+                added = {query: self.cache.add_embedding(query, vector)
+                         for query, vector in zip(missing, self.cache.embed_fn(missing))}
+                for position in positions:
+                    if embeddings[position] is None:
+                        embeddings[position] = added[queries[position]]
+
+        for resolved, positions in pending.items():
+            key = self.cache_key(n_results, resolved)
+            if self.cache is not None:
+                for position in positions:
+                    results[position] = self.cache.get(embeddings[position], key)
+                positions = [position for position in positions if results[position] is None]
+                if not positions:
+                    continue
+                vector = self.collection.query(
+                    query_embeddings=[embeddings[position].tolist() for position in positions],
+                    **self.vector_options(n_results, resolved))
+            else:
+                vector = self.collection.query(query_texts=[queries[position] for position in positions],
+                                               **self.vector_options(n_results, resolved))
+            for index, position in enumerate(positions):
+                single = {field: [vector[field][index]] for field in ('ids', 'documents', 'metadatas')}
+                results[position] = self.fuse(queries[position], single, n_results, resolved)
+                if self.cache is not None:
+                    self.cache.put(embeddings[position], key, results[position])
+        return results
+
+    def route(self, query: str, n_results: int, mode: str) -> tuple[str, Optional[dict]]:
+        """Resolve the search mode and answer lexical-only queries
+
+        Returns the mode to search in and, when the lexical index alone
+        answered the query, its result.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"mode must be one of {SEARCH_MODES}")
+        if self.lexical is None:
+            mode = 'vector'
+
+        if mode == 'auto' and is_exact_query(query):
+            hits = self.lexical.search(query, n_results, exact=True)
+            if hits:
+                logger.debug(f"Lexical fast path answered {query!r}")
+                return mode, self._result([(hit['id'], hit['document'], hit['metadata']) for hit in hits])
+        if mode == 'lexical':
+            hits = self.lexical.search(query, n_results)
+            return mode, self._result([(hit['id'], hit['document'], hit['metadata']) for hit in hits])
+        return mode, None
+
+    @staticmethod
+    def cache_key(n_results: int, mode: str) -> tuple:
+        # auto falls through to hybrid once routed, so both share cached results
+        return n_results, 'vector' if mode == 'vector' else 'hybrid'
+
+    def vector_options(self, n_results: int, mode: str) -> dict:
+        """Arguments besides the query for the collection's ``query`` call"""
+        return {'n_results': self.candidates if mode != 'vector' else n_results, 'include': ["documents", "metadatas"]}
+
+    def fuse(self, query: str, vector: dict, n_results: int, mode: str) -> dict:
+        """Final results from a vector query result, merged with BM25 results unless in vector mode"""
+        rows = {chunk_id: (chunk_id, document, metadata) for chunk_id, document, metadata
+                in zip(vector['ids'][0], vector['documents'][0], vector['metadatas'][0])}
+        if mode == 'vector':
+            return self._result(list(rows.values())[:n_results])
+
+        lexical = self.lexical.search(query, self.candidates)
+        for hit in lexical:
+            rows.setdefault(hit['id'], (hit['id'], hit['document'], hit['metadata']))
+        fused = reciprocal_rank_fusion([vector['ids'][0], [hit['id'] for hit in lexical]], k=self.rrf_k)
+        return self._result([rows[chunk_id] for chunk_id, _ in fused[:n_results]])
+
+    @staticmethod
+    def _result(rows: list[tuple]) -> dict:
+        return {
+            'ids': [[chunk_id for chunk_id, _, _ in rows]],
+            'documents': [[document for _, document, _ in rows]],
+            'metadatas': [[metadata for _, _, metadata in rows]],
+        }
+
+
+def open_retriever(name: str = "html_documents", backend: Optional[str] = None, cache: bool = True,
+                   **options) -> HybridRetriever:
+    """Open a collection and its lexical index for hybrid search, with a query cache unless ``cache`` is off"""
+    lexical = open_lexical_index(name)
+    if not lexical.count():
+        logger.warning(f"Lexical index for {name} is empty; searching vectors only")
+        lexical.close()
+        lexical = None
+    collection = open_collection(name, backend=backend, create=False, **options)
+    query_cache = None
+    if cache:
+        embed_fn = getattr(collection, 'embedding_function', None) or ollama_embedding_function(
+            options.get('embedding_model', EMBEDDING_MODEL), options.get('ollama_url', OLLAMA_URL))
+        query_cache = QueryCache(embed_fn, version_fn=partial(collection_version, collection))
+    return HybridRetriever(collection, lexical, cache=query_cache)
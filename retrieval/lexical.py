@@ -0,0 +1,147 @@
+import json
+import logging
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+
+from retrieval.backend import LEXICAL_INDEX_DIR
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r'\w+')
+_QUOTED = re.compile(r'"([^"]+)"')
+# Phone numbers, CPT/HCPCS style codes and other identifiers that must match exactly
+_EXACT = re.compile(
+    r'\b\d{3}[-.\s]\d{3}[-.\s]\d{4}\b'      # 100-111-1111
+    r'|\b(?!(?:19|20)\d{2}\b)[A-Za-z]?\d{4,5}[A-Za-z]?\b'   # 99213, J1100, 0001U, but not years
+    r'|\b[A-Z][A-Z0-9]*\d[A-Z0-9]*\b'        # HMO2, PPO500
+)
+
+
+def _phrase(text: str) -> Optional[str]:
+    tokens = _TOKEN.findall(text.lower())
+    return f'"{" ".join(tokens)}"' if tokens else None
+
+
+def exact_terms(query: str) -> list[str]:
+    """Quoted phrases and code- or number-like terms that the query must contain verbatim"""
+    terms = _QUOTED.findall(query)
+    unquoted = _QUOTED.sub(' ', query)
+    terms.extend(match.group(0) for match in _EXACT.finditer(unquoted))
+    return terms
+
+
+class LexicalIndex:
+    """BM25 inverted index over chunk text, kept beside the vector collection
+
+    Backed by an SQLite FTS5 table whose content lives in ``documents``, so a
+    lexical hit carries the chunk text and metadata and needs no trip to the
+    vector backend. Chunks are added as the ingestion writer stores them and
+    removed when their vectors are garbage collected.
+    """
+
+    def __init__(self, db_path: str):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.con = sqlite3.connect(db_path, check_same_thread=False)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        with self.con:
+            self.con.executescript("""
+                CREATE TABLE IF NOT EXISTS documents(
+                    rowid INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL UNIQUE, document TEXT NOT NULL, metadata TEXT);
+                CREATE VIRTUAL TABLE IF NOT EXISTS postings USING fts5(
+                    document, content='documents', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2');
+                CREATE TRIGGER IF NOT EXISTS documents_insert AFTER INSERT ON documents BEGIN
+                    INSERT INTO postings(rowid, document) VALUES (new.rowid, new.document);
+                END;
+                CREATE TRIGGER IF NOT EXISTS documents_delete AFTER DELETE ON documents BEGIN
+                    INSERT INTO postings(postings, rowid, document) VALUES ('delete', old.rowid, old.document);
+                END;
+                CREATE TRIGGER IF NOT EXISTS documents_update AFTER UPDATE OF document ON documents BEGIN
+                    INSERT INTO postings(postings, rowid, document) VALUES ('delete', old.rowid, old.document);
+                    INSERT INTO postings(rowid, document) VALUES (new.rowid, new.document);
+                END;
+            """)
+
+    def add(self, ids: list[str], documents: list[str], metadatas: Optional[list[dict]] = None):
+        metadatas = metadatas or [None] * len(ids)
+        rows = [(chunk_id, document, json.dumps(metadata) if metadata is not None else None)
+                for chunk_id, document, metadata in zip(ids, documents, metadatas)]
+        with self.lock, self.con:
+            self.con.executemany(
+                "INSERT INTO documents(chunk_id, document, metadata) VALUES (?, ?, ?) "
+                "ON CONFLICT(chunk_id) DO UPDATE SET document=excluded.document, metadata=excluded.metadata",
+                rows
+            )
+
+    def update_metadata(self, ids: list[str], metadatas: list[dict]):
+        """Merge metadata into indexed chunks, as Chroma's ``update`` does"""
+        with self.lock, self.con:
+            for chunk_id, metadata in zip(ids, metadatas):
+                row = self.con.execute("SELECT metadata FROM documents WHERE chunk_id=?", (chunk_id,)).fetchone()
+                if row is None:
+                    continue
+                merged = json.loads(row[0]) if row[0] else {}
+                merged.update(metadata)
+                self.con.execute("UPDATE documents SET metadata=? WHERE chunk_id=?", (json.dumps(merged), chunk_id))
+
+    def remove(self, ids: list[str]):
+        with self.lock, self.con:
+            self.con.executemany("DELETE FROM documents WHERE chunk_id=?", [(i,) for i in ids])
+
+    def count(self) -> int:
+        with self.lock:
+            return self.con.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def search(self, query: str, n_results: int = 10, exact: bool = False) -> list[dict]:
+        """Rank chunks by BM25
+
+        By default any query term may match. With ``exact`` every quoted
+        phrase and code-like term from ``exact_terms`` must also appear
+        verbatim.
+        """
+        expression = ' OR '.join(f'"{token}"' for token in dict.fromkeys(_TOKEN.findall(query.lower())))
+        if not expression:
+            return []
+        if exact:
+            phrases = [phrase for phrase in map(_phrase, exact_terms(query)) if phrase]
+            if not phrases:
+                return []
+            # Exact terms filter; the whole query still drives the BM25 ranking
+            expression = f"{' AND '.join(phrases)} AND ({expression})"
+        with self.lock:
+            rows = self.con.execute(
+                "SELECT d.chunk_id, d.document, d.metadata, bm25(postings) FROM postings "
+                "JOIN documents d ON d.rowid = postings.rowid "
+                "WHERE postings MATCH ? ORDER BY rank LIMIT ?",
+                (expression, n_results)
+            ).fetchall()
+        # FTS5 reports BM25 as a negative number so that ascending order ranks best first
+        return [{'id': chunk_id, 'document': document, 'metadata': json.loads(metadata) if metadata else None,
+                 'score': -score} for chunk_id, document, metadata, score in rows]
+
+    def rebuild_from(self, collection, batch_size: int = 1000) -> int:
+        """Re-index every chunk stored in a vector collection"""
+        with self.lock, self.con:
+            self.con.execute("DELETE FROM documents")
+            self.con.execute("INSERT INTO postings(postings) VALUES ('rebuild')")
+        total, offset = 0, 0
+        while True:
+            batch = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            if not batch['ids']:
+                break
+            self.add(batch['ids'], [document or '' for document in batch['documents']], batch['metadatas'])
+            total += len(batch['ids'])
+            offset += batch_size
+        logger.info(f"Rebuilt lexical index with {total} chunks")
+        return total
+
+    def close(self):
+        with self.lock:
+            self.con.close()
+
+
+def open_lexical_index(name: str = "html_documents", index_dir: str = LEXICAL_INDEX_DIR) -> LexicalIndex:
+    return LexicalIndex(str(Path(index_dir) / f"{name}.db"))
@@ -0,0 +1,142 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+import numpy as np
+
+from ingestion.embedding_cache import text_key
+
+logger = logging.getLogger(__name__)
+
+QUERY_CACHE_TTL = float(os.environ.get("QUERY_CACHE_TTL", 3600))
+QUERY_CACHE_THRESHOLD = float(os.environ.get("QUERY_CACHE_THRESHOLD", 0.97))
+
+
+class QueryCache:
+    """Two-level in-memory cache in front of query embedding and search
+
+    The first level maps a normalized prompt to its unit embedding, so a
+    repeated prompt costs no embedding call. The second maps query embeddings
+    to search results: a query whose cosine similarity to a cached query is
+    at least ``threshold``, with the same ``key`` (result count and search
+    mode), reuses that query's results. Both levels evict the least recently
+    used entry when full and expire entries after ``ttl`` seconds.
+
+    Cached results are dropped when ``version_fn`` returns a new collection
+    version. It is called at most once per ``version_interval`` seconds, so
+    results can be that much older than the collection.
+    """
+
+    def __init__(self, embed_fn: Callable[[list[str]], list[list[float]]], max_prompts: int = 4096,
+                 max_results: int = 1024, ttl: float = QUERY_CACHE_TTL, threshold: float = QUERY_CACHE_THRESHOLD,
+                 version_fn: Optional[Callable[[], Hashable]] = None, version_interval: float = 5.0):
+        self.embed_fn = embed_fn
+        self.max_prompts = max_prompts
+        self.max_results = max_results
+        self.ttl = ttl
+        self.threshold = threshold
+        self.version_fn = version_fn
+        self.version_interval = version_interval
+        self.lock = threading.Lock()
+        self.embeddings = OrderedDict()   # prompt key -> (expires, embedding)
+        self.results = OrderedDict()      # slot -> (expires, key, result), least recently used first
+        self.matrix = None                # query embeddings of the result entries, by slot
+        self.version = None
+        self.checked = float('-inf')
+        self.stats = {'embedding_hits': 0, 'embedding_misses': 0, 'result_hits': 0, 'result_misses': 0}
+
+    def embed(self, prompt: str) -> np.ndarray:
+        """Unit embedding of a prompt, computed once per normalized text"""
+        embedding = self.cached_embedding(prompt)
+        if embedding is None:
+            embedding = self.add_embedding(prompt, self.embed_fn([prompt])[0])
+        return embedding
+
+    def cached_embedding(self, prompt: str) -> Optional[np.ndarray]:
+        key = text_key(prompt)
+        with self.lock:
+            entry = self.embeddings.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.embeddings.move_to_end(key)
+                self.stats['embedding_hits'] += 1
+                return entry[1]
+            self.stats['embedding_misses'] += 1
+        return None
+
+    def add_embedding(self, prompt: str, embedding) -> np.ndarray:
+        """Cache a prompt's embedding, returning it unit-normalized"""
+        embedding = np.asarray(embedding, dtype=np.float32)
+        embedding = embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+        key = text_key(prompt)
+        with self.lock:
+            self.embeddings[key] = (time.monotonic() + self.ttl, embedding)
+            self.embeddings.move_to_end(key)
+            while len(self.embeddings) > self.max_prompts:
+                self.embeddings.popitem(last=False)
+        return embedding
+
+    def get(self, embedding: np.ndarray, key: Hashable) -> Optional[dict]:
+        """Results of the most similar cached query with the same key, if similar enough"""
+        self._check_version()
+        now = time.monotonic()
+        with self.lock:
+            if self.results and self.matrix.shape[1] == embedding.shape[0]:
+                slots = np.fromiter(self.results, dtype=np.int64, count=len(self.results))
+                scores = self.matrix[slots] @ embedding
+                for position in np.argsort(-scores):
+                    if scores[position] < self.threshold:
+                        break
+                    slot = int(slots[position])
+                    expires, cached_key, result = self.results[slot]
+                    if cached_key == key and expires > now:
+                        self.results.move_to_end(slot)
+                        self.stats['result_hits'] += 1
+                        return result
+            self.stats['result_misses'] += 1
+        return None
+
+    def put(self, embedding: np.ndarray, key: Hashable, result: dict):
+        with self.lock:
+            if self.matrix is None or self.matrix.shape[1] != embedding.shape[0]:
+                self.matrix = np.zeros((self.max_results, embedding.shape[0]), dtype=np.float32)
+                self.results.clear()
+            now = time.monotonic()
+            # Reuse an expired slot, else the least recently used one once full
+            expired = next((slot for slot, (expires, _, _) in self.results.items() if expires <= now), None)
+            if expired is not None:
+                slot = expired
+                del self.results[slot]
+            elif len(self.results) < self.max_results:
+                used = set(self.results)
+                slot = next(slot for slot in range(self.max_results) if slot not in used)
+            else:
+                slot, _ = self.results.popitem(last=False)
+            self.matrix[slot] = embedding
+            self.results[slot] = (now + self.ttl, key, result)
+
+    def clear(self):
+        """Drop cached results; prompt embeddings do not depend on the collection"""
+        with self.lock:
+            self.results.clear()
+
+    def _check_version(self):
+        if self.version_fn is None:
+            return
+        now = time.monotonic()
+        if now - self.checked < self.version_interval:
+            return
+        self.checked = now
+        try:
+            version = self.version_fn()
+        except Exception as e:
+            logger.warning(f"Could not read the collection version; dropping cached results: {e}")
+            self.clear()
+            return
+        if version != self.version:
+            if self.version is not None:
+                logger.info(f"Collection changed ({self.version} -> {version}); dropping cached results")
+            self.version = version
+            self.clear()
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Optional
+
+from retrieval.backend import CHROMA_HOST, CHROMA_PORT, RETRIEVAL_BACKEND, chroma_client, close_collection
+from retrieval.aio import AsyncRetriever, open_async_retriever
+from retrieval.hybrid import HybridRetriever, open_retriever
+
+logger = logging.getLogger(__name__)
+
+
+class RetrievalService:
+    """Process-wide retrieval shared by the agents
+
+    Nothing is opened until the first search. Each collection's retriever,
+    with its collection handle, lexical index and query cache, is opened
+    once and reused, and Chroma requests share pooled connections through
+    ``retrieval.backend.chroma_client``. A search that fails drops the cached
+    handle and is retried once on a freshly opened one, so a restarted
+    server or recreated collection does not need a process restart.
+
+    ``asearch`` is the asyncio counterpart of ``search``; its retrievers wrap
+    the same cached ones and are opened once per event loop.
+    """
+
+    def __init__(self, backend: Optional[str] = None, **options):
+        self.backend = backend or RETRIEVAL_BACKEND
+        self.options = options
+        self.lock = threading.Lock()
+        self.retrievers = {}
+        self.async_retrievers = {}   # name -> task opening the AsyncRetriever
+
+    def retriever(self, name: str = "html_documents") -> HybridRetriever:
+        retriever = self.retrievers.get(name)
+        if retriever is not None:
+            return retriever
+        with self.lock:
+            if name not in self.retrievers:
+                started = time.perf_counter()
+                self.retrievers[name] = open_retriever(name, backend=self.backend, **self.options)
+                logger.info(f"Opened retriever for {name} in {time.perf_counter() - started:.2f}s")
+            return self.retrievers[name]
+
+    def search(self, query: str, name: str = "html_documents", n_results: int = 5, mode: str = 'auto') -> dict:
+        try:
+            return self.retriever(name).search(query, n_results=n_results, mode=mode)
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.warning(f"Search on {name} failed, reopening the collection: {e}")
+            self.discard(name)
+            return self.retriever(name).search(query, n_results=n_results, mode=mode)
+
+    def search_many(self, queries: list[str], name: str = "html_documents", n_results: int = 5,
+                    mode: str = 'auto') -> list[dict]:
+        try:
+            return self.retriever(name).search_many(queries, n_results=n_results, mode=mode)
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.warning(f"Search on {name} failed, reopening the collection: {e}")
+            self.discard(name)
+            return self.retriever(name).search_many(queries, n_results=n_results, mode=mode)
+
+    async def aretriever(self, name: str = "html_documents") -> AsyncRetriever:
+        loop = asyncio.get_running_loop()
+        task = self.async_retrievers.get(name)
+        if task is None or task.get_loop() is not loop or (task.done() and task.exception() is not None):
+            # Concurrent first searches share one opening task
+            task = self.async_retrievers[name] = loop.create_task(self._open_async(name))
+        return await asyncio.shield(task)
+
+    async def _open_async(self, name: str) -> AsyncRetriever:
+        retriever = await asyncio.to_thread(self.retriever, name)
+        return await open_async_retriever(retriever, name, backend=self.backend, **self.options)
+
+    async def asearch(self, query: str, name: str = "html_documents", n_results: int = 5, mode: str = 'auto') -> dict:
+        try:
+            return await (await self.aretriever(name)).search(query, n_results=n_results, mode=mode)
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.warning(f"Search on {name} failed, reopening the collection: {e}")
+            await asyncio.to_thread(self.discard, name)
+            return await (await self.aretriever(name)).search(query, n_results=n_results, mode=mode)
+
+    def health(self, name: str = "html_documents") -> dict:
+        """Check that the backend answers and report chunk counts for a collection"""
+        status = {'backend': self.backend, 'collection': name, 'ok': False}
+        try:
+            if self.backend == 'chroma':
+                chroma_client(self.options.get('chroma_host', CHROMA_HOST),
+                              self.options.get('chroma_port', CHROMA_PORT)).heartbeat()
+            retriever = self.retriever(name)
+            status['vectors'] = retriever.collection.count()
+            status['lexical'] = retriever.lexical.count() if retriever.lexical is not None else 0
+            status['ok'] = True
+        except Exception as e:
+            status['error'] = str(e)
+            self.discard(name)
+        return status
+
+    def discard(self, name: str):
+        """Drop a cached retriever so the next search reopens it"""
+        with self.lock:
+            retriever = self.retrievers.pop(name, None)
+            self.async_retrievers.pop(name, None)
+        if retriever is not None:
+            _close(retriever)
+
+    def close(self):
+        with self.lock:
+            retrievers, self.retrievers = self.retrievers, {}
+            self.async_retrievers = {}
+        for retriever in retrievers.values():
+            _close(retriever)
+
+
+def _close(retriever: HybridRetriever):
+    try:
+        if retriever.lexical is not None:
+            retriever.lexical.close()
+        close_collection(retriever.collection)
+    except Exception as e:
+        logger.warning(f"Error closing retriever: {e}")
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service() -> RetrievalService:
+    """The shared retrieval service, configured from the environment"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = RetrievalService()
+    return _service
@@ -0,0 +1,637 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+from retrieval.hnsw import HNSWIndex
+
+logger = logging.getLogger(__name__)
+
+INDEX_MODES = ('auto', 'flat', 'hnsw')
+STORAGE_DTYPES = {'float32': np.float32, 'float16': np.float16, 'int8': np.int8}
+
+# Rows converted to float32 at a time when scanning compact vectors; small
+# blocks keep the converted copy in cache
+SCAN_BLOCK = 2048
+
+# Seconds between checkpoints of the HNSW graph's in-memory state while writing
+GRAPH_SAVE_INTERVAL = 30.0
+# Nodes a background build adds under the store lock before swapping the graph in
+BUILD_CATCH_UP = 256
+
+
+def _graph_name(generation: int) -> str:
+    return 'hnsw' if generation == 0 else f'hnsw_{generation}'
+
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class VectorStore:
+    """Embedded vector collection stored on local disk
+
+    Unit-normalized vectors live in a memory-mapped ``float32`` file indexed
+    by slot; IDs, documents and metadata live in SQLite. Queries rank by
+    cosine similarity, either by brute force over every slot with NumPy
+    (``flat``) or through an HNSW graph (``hnsw``). In ``auto`` mode the graph
+    is built once the collection reaches ``hnsw_threshold`` vectors. Graphs
+    are built on a background thread while searches stay flat and writes
+    only append; after that, written vectors are added to the graph as they
+    arrive. The graph is checkpointed every ``GRAPH_SAVE_INTERVAL`` seconds
+    and on ``close``, and vectors written after the last checkpoint are
+    added again when the store is next opened for writing.
+
+    ``storage`` and ``dims`` set how the searched copy of each vector is
+    kept: ``float16`` or ``int8`` quantization, optionally truncated to the
+    first ``dims`` Matryoshka dimensions and re-normalized. With a compact
+    copy, candidates are found on it and the best ``rescore`` times
+    ``n_results`` are re-ranked against the full-precision vectors, which
+    stay on disk and are only paged in for those candidates. Both are fixed
+    when the store is created.
+
+    Implements the part of Chroma's Collection API this project uses
+    (``add``, ``upsert``, ``update``, ``delete``, ``get``, ``query`` and
+    ``count``), so it can stand in for a Chroma collection anywhere. Only one
+    process may write to a store at a time. Other processes open it with
+    ``read_only``: a read-only store checks the version on disk before each
+    read and reloads when a writer has changed it. A store opened for
+    writing never looks for another process's writes, so a long-lived one
+    must be reopened to see them.
+    """
+
+    def __init__(self, path: str, name: str, embedding_function: Optional[Callable] = None,
+                 index: str = 'auto', hnsw_threshold: int = 20_000, compact_fraction: float = 0.25,
+                 storage: Optional[str] = None, dims: Optional[int] = None, rescore: int = 4,
+                 read_only: bool = False):
+        if index not in INDEX_MODES:
+            raise ValueError(f"index must be one of {INDEX_MODES}")
+        if storage is not None and storage not in STORAGE_DTYPES:
+            raise ValueError(f"storage must be one of {tuple(STORAGE_DTYPES)}")
+        self.name = name
+        self.path = Path(path) / name
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.embedding_function = embedding_function
+        self.index_mode = index
+        self.hnsw_threshold = hnsw_threshold
+        self.compact_fraction = compact_fraction
+        self.rescore = rescore
+        self.read_only = read_only
+        self.lock = threading.RLock()
+        self.vector_file = self.path / "vectors.f32"
+
+        self.con = sqlite3.connect(self.path / "records.db", check_same_thread=False)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        with self.con:
+            self.con.execute(
+                "CREATE TABLE IF NOT EXISTS records("
+                "id TEXT PRIMARY KEY, slot INTEGER NOT NULL UNIQUE, document TEXT, metadata TEXT)"
+            )
+            self.con.execute("CREATE TABLE IF NOT EXISTS info(key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.storage, self.dims = storage or 'float32', dims
+        self.builder = None
+        self.saved = time.monotonic()
+        self._load()
+        if self.dim is not None and ((storage or self.storage), (dims or self.dims)) != (self.storage, self.dims):
+            logger.warning(f"Collection {name} was created with storage={self.storage}, dims={self.dims}; "
+                           f"ignoring storage={storage}, dims={dims}")
+
+        # Slots are only reused without a graph; with one, dead slots wait for compaction
+        self.free = np.flatnonzero(~self.live[:self.size]).tolist() if self.index is None else []
+        if not read_only:
+            if index == 'flat':
+                if self.index is not None:
+                    self.index.reset()
+                    self.index = None
+            elif self.index is not None:
+                self._repair_index()
+            elif index == 'hnsw' or (index == 'auto' and self.count() >= hnsw_threshold):
+                self._start_build()
+
+    def _load(self):
+        """Read the collection's state from disk
+
+        The graph is read first, then the records, then the vector files are
+        measured. Files only grow, so every slot the graph or the records
+        refer to fits in the vectors mapped here.
+        """
+        while True:
+            generation = self._disk_state()[1]
+            try:
+                graph = HNSWIndex(self.path, lambda: self.compact, read_only=self.read_only,
+                                  name=_graph_name(generation))
+            except OSError:
+                if self._disk_state()[1] == generation:
+                    raise
+                continue    # replaced by a newer graph while opening it
+            # One read transaction, so the records match the info they were written with
+            self.con.execute("BEGIN")
+            try:
+                info = dict(self.con.execute("SELECT key, value FROM info").fetchall())
+                slots = [slot for (slot,) in self.con.execute("SELECT slot FROM records")]
+            finally:
+                self.con.execute("COMMIT")
+            if int(info.get('index_generation', 0)) == generation:
+                break
+        self.loaded_state = (int(info.get('version', 0)), generation)
+        self.generation = generation
+        self.dim = int(info['dim']) if 'dim' in info else None
+        self.size = int(info.get('size', 0))
+        self.storage = info.get('storage', self.storage)
+        self.dims = int(info['dims']) if 'dims' in info else self.dims
+        self.scale = float(info.get('scale', 1.0))
+
+        # Full-precision vectors, plus the compact copy that is searched when it differs
+        self.vectors = None
+        self.compact = None
+        self.capacity = 0
+        if self.dim is not None and self.vector_file.exists():
+            self.capacity = self.vector_file.stat().st_size // (self.dim * 4)
+            if self.read_only and self.compressed:
+                # The writer grows the compact file just after the full-precision one
+                width = np.dtype(STORAGE_DTYPES[self.storage]).itemsize * self.dims
+                compact = self.compact_file.stat().st_size // width if self.compact_file.exists() else 0
+                self.capacity = min(self.capacity, compact)
+            self.vectors = np.memmap(self.vector_file, dtype=np.float32, mode='r' if self.read_only else 'r+',
+                                     shape=(self.capacity, self.dim))
+            self.compact = self._open_compact()
+        self.live = np.zeros(self.capacity, dtype=bool)
+        self.live[[slot for slot in slots if slot < self.capacity]] = True
+
+        self.index = None
+        if graph.exists():
+            self.index = graph
+            self.index.resize(self.capacity)
+
+    def _disk_state(self) -> tuple[int, int]:
+        """Write version and graph generation on disk"""
+        info = dict(self.con.execute(
+            "SELECT key, value FROM info WHERE key IN ('version', 'index_generation')"
+        ).fetchall())
+        return int(info.get('version', 0)), int(info.get('index_generation', 0))
+
+    def _refresh(self):
+        """Follow another process's writes: reload when the version or graph on disk has changed (read-only stores)"""
+        if self.read_only and self._disk_state() != self.loaded_state:
+            logger.debug(f"Reloading collection {self.name}")
+            self._load()
+
+    def _check_writable(self):
+        if self.read_only:
+            raise ValueError(f"Collection {self.name} is open read-only")
+
+    @property
+    def compressed(self) -> bool:
+        """Whether searches run on a compact copy and need rescoring"""
+        if self.dim is None:
+            return self.storage != 'float32'
+        return self.storage != 'float32' or (self.dims is not None and self.dims < self.dim)
+
+    @property
+    def compact_file(self) -> Path:
+        suffix = {'float32': 'f32', 'float16': 'f16', 'int8': 'i8'}[self.storage]
+        return self.path / f"vectors_{self.dims}.{suffix}"
+
+    def _open_compact(self):
+        if not self.compressed:
+            return self.vectors
+        width = np.dtype(STORAGE_DTYPES[self.storage]).itemsize * self.dims
+        if self.read_only:
+            return np.memmap(self.compact_file, dtype=STORAGE_DTYPES[self.storage], mode='r',
+                             shape=(self.capacity, self.dims))
+        if not self.compact_file.exists() or self.compact_file.stat().st_size < self.capacity * width:
+            with open(self.compact_file, 'ab') as f:
+                f.truncate(self.capacity * width)
+        return np.memmap(self.compact_file, dtype=STORAGE_DTYPES[self.storage], mode='r+',
+                         shape=(self.capacity, self.dims))
+
+    def _init_storage(self, vectors: np.ndarray):
+        """Fix the dimensions and int8 scale from the first batch written"""
+        self.dim = vectors.shape[1]
+        self.dims = min(self.dims or self.dim, self.dim)
+        if self.storage == 'int8':
+            # Map the bulk of the component range onto int8; rare outliers are clipped
+            truncated = _normalize(vectors[:, :self.dims])
+            self.scale = 127.0 / max(float(np.quantile(np.abs(truncated), 0.9999)), 1e-6)
+        with self.con:
+            self.con.executemany("INSERT OR REPLACE INTO info VALUES (?, ?)", [
+                ('dim', str(self.dim)), ('storage', self.storage), ('dims', str(self.dims)), ('scale', repr(self.scale))
+            ])
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Compact representation of unit vectors: truncated, re-normalized and quantized"""
+        if self.dims < self.dim:
+            vectors = _normalize(vectors[:, :self.dims])
+        if self.storage == 'int8':
+            return np.clip(np.rint(vectors * self.scale), -127, 127).astype(np.int8)
+        return vectors.astype(STORAGE_DTYPES[self.storage])
+
+    def _encode_query(self, queries: np.ndarray) -> np.ndarray:
+        """Queries in the compact vectors' space, kept in float32 so scores are not quantized twice"""
+        if self.dims < self.dim:
+            queries = _normalize(queries[:, :self.dims])
+        return queries * self.scale if self.storage == 'int8' else queries
+
+    def _bump_version(self):
+        self.con.execute("INSERT INTO info VALUES ('version', '1') "
+                         "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+
+    def version(self) -> int:
+        """Counter bumped by every write, read from disk so writes by another process are seen"""
+        with self.lock:
+            row = self.con.execute("SELECT value FROM info WHERE key='version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def count(self) -> int:
+        with self.lock:
+            self._refresh()
+            return int(np.count_nonzero(self.live))
+
+    def _embed(self, texts: list[str]) -> list[list[float]]:
+        if self.embedding_function is None:
+            raise ValueError(f"Collection {self.name} has no embedding function; pass embeddings explicitly")
+        return self.embedding_function(texts)
+
+    def _ensure_capacity(self, needed: int):
+        if needed <= self.capacity:
+            return
+        capacity = max(needed, self.capacity * 2, 1024)
+        self._flush()
+        with open(self.vector_file, 'ab') as f:
+            f.truncate(capacity * self.dim * 4)
+        self.vectors = np.memmap(self.vector_file, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+        live = np.zeros(capacity, dtype=bool)
+        live[:self.capacity] = self.live
+        self.live, self.capacity = live, capacity
+        self.compact = self._open_compact()
+        if self.index is not None:
+            self.index.resize(capacity)
+
+    def _allocate(self, count: int) -> list[int]:
+        reused = self.free[:count]
+        del self.free[:count]
+        fresh = list(range(self.size, self.size + count - len(reused)))
+        self.size += len(fresh)
+        self._ensure_capacity(self.size)
+        return reused + fresh
+
+    def _slots(self, ids: list[str]) -> dict[str, int]:
+        found = {}
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            rows = self.con.execute(
+                f"SELECT id, slot FROM records WHERE id IN ({','.join('?' * len(batch))})", batch
+            )
+            found.update(rows)
+        return found
+
+    def add(self, ids, embeddings=None, documents=None, metadatas=None):
+        """Same as ``upsert``: existing IDs are overwritten"""
+        self.upsert(ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def upsert(self, ids, embeddings=None, documents=None, metadatas=None):
+        self._check_writable()
+        ids = list(ids)
+        if not ids:
+            return
+        if embeddings is None:
+            embeddings = self._embed(documents)
+        vectors = _normalize(embeddings)
+        documents = documents if documents is not None else [None] * len(ids)
+        metadatas = metadatas if metadatas is not None else [None] * len(ids)
+
+        with self.lock:
+            if self.dim is None:
+                self._init_storage(vectors)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional embeddings, got {vectors.shape[1]}")
+
+            existing = self._slots(ids)
+            if self.index is None and self.builder is None:
+                # Without a graph, vectors can be overwritten in place
+                new_ids = [i for i in dict.fromkeys(ids) if i not in existing]
+                slots = dict(existing, **dict(zip(new_ids, self._allocate(len(new_ids)))))
+            else:
+                # Graph nodes, including those a background build has added, are immutable:
+                # changed vectors move to a new slot
+                unique = list(dict.fromkeys(ids))
+                slots = dict(zip(unique, self._allocate(len(unique))))
+                self.live[list(existing.values())] = False
+
+            targets = [slots[chunk_id] for chunk_id in ids]
+            self.vectors[targets] = vectors
+            if self.compressed:
+                self.compact[targets] = self._encode(vectors)
+            self.live[targets] = True
+            with self.con:
+                if self.index is not None and existing:
+                    self.con.executemany("DELETE FROM records WHERE id=?", [(i,) for i in existing])
+                self.con.executemany(
+                    "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)",
+                    [(chunk_id, slots[chunk_id], document, json.dumps(metadata) if metadata is not None else None)
+                     for chunk_id, document, metadata in zip(ids, documents, metadatas)]
+                )
+                self.con.execute("INSERT OR REPLACE INTO info VALUES ('size', ?)", (str(self.size),))
+                self._bump_version()
+
+            if self.index is not None:
+                for slot in dict.fromkeys(targets):
+                    self.index.add(slot)
+            elif self.builder is None and self.index_mode == 'auto' and self.count() >= self.hnsw_threshold:
+                self._start_build()
+            self._maybe_compact()
+            self._persist()
+
+    def update(self, ids, embeddings=None, documents=None, metadatas=None):
+        """Merge new metadata into existing records and optionally replace documents or vectors"""
+        self._check_writable()
+        ids = list(ids)
+        with self.lock:
+            rows = {}
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                for chunk_id, document, metadata in self.con.execute(
+                    f"SELECT id, document, metadata FROM records WHERE id IN ({','.join('?' * len(batch))})", batch
+                ):
+                    rows[chunk_id] = (document, json.loads(metadata) if metadata else {})
+            for position, chunk_id in enumerate(ids):
+                if chunk_id not in rows:
+                    continue
+                document, metadata = rows[chunk_id]
+                if documents is not None:
+                    document = documents[position]
+                if metadatas is not None and metadatas[position]:
+                    metadata.update(metadatas[position])
+                rows[chunk_id] = (document, metadata)
+
+            if embeddings is not None or (documents is not None and self.embedding_function is not None):
+                known = [chunk_id for chunk_id in ids if chunk_id in rows]
+                positions = {chunk_id: position for position, chunk_id in enumerate(ids)}
+                self.upsert(
+                    known,
+                    embeddings=[embeddings[positions[i]] for i in known] if embeddings is not None else None,
+                    documents=[rows[i][0] for i in known],
+                    metadatas=[rows[i][1] for i in known]
+                )
+                return
+            with self.con:
+                self.con.executemany(
+                    "UPDATE records SET document=?, metadata=? WHERE id=?",
+                    [(document, json.dumps(metadata), chunk_id) for chunk_id, (document, metadata) in rows.items()]
+                )
+                self._bump_version()
+
+    def delete(self, ids):
+        self._check_writable()
+        ids = list(ids)
+        with self.lock:
+            slots = list(self._slots(ids).values())
+            with self.con:
+                self.con.executemany("DELETE FROM records WHERE id=?", [(i,) for i in ids])
+                self._bump_version()
+            self.live[slots] = False
+            if self.index is None and self.builder is None:
+                self.free.extend(slots)
+            self._maybe_compact()
+            self._persist()
+
+    def get(self, ids=None, include=("documents", "metadatas"), limit: Optional[int] = None, offset: int = 0) -> dict:
+        with self.lock:
+            self._refresh()
+            if ids is None:
+                rows = self.con.execute(
+                    "SELECT id, slot, document, metadata FROM records ORDER BY slot LIMIT ? OFFSET ?",
+                    (-1 if limit is None else limit, offset)
+                ).fetchall()
+            else:
+                ids = list(ids)
+                found = {}
+                for start in range(0, len(ids), 500):
+                    batch = ids[start:start + 500]
+                    for row in self.con.execute(
+                        f"SELECT id, slot, document, metadata FROM records WHERE id IN ({','.join('?' * len(batch))})",
+                        batch
+                    ):
+                        found[row[0]] = row
+                rows = [found[i] for i in ids if i in found]
+            result = {'ids': [row[0] for row in rows]}
+            if "documents" in include:
+                result['documents'] = [row[2] for row in rows]
+            if "metadatas" in include:
+                result['metadatas'] = [json.loads(row[3]) if row[3] else None for row in rows]
+            if "embeddings" in include:
+                result['embeddings'] = [self.vectors[row[1]].tolist() for row in rows]
+            return result
+
+    def query(self, query_embeddings=None, query_texts=None, n_results: int = 10,
+              include=("metadatas", "documents", "distances")) -> dict:
+        """Return the ``n_results`` nearest records per query, in Chroma's nested-list format
+
+        Distances are cosine distances (``1 - cosine similarity``).
+        """
+        if query_embeddings is None:
+            query_embeddings = self._embed(list(query_texts))
+        queries = _normalize(query_embeddings)
+
+        with self.lock:
+            self._refresh()
+            if self.dim is None:
+                hits = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+            else:
+                candidates = n_results * self.rescore if self.compressed else n_results
+                encoded = self._encode_query(queries)
+                if self.index is not None:
+                    hits = [self.index.search(query, candidates, self.live) for query in encoded]
+                    hits = self._with_ungraphed(hits, encoded, candidates)
+                else:
+                    hits = self._flat_search(encoded, candidates)
+                if self.compressed:
+                    hits = self._rescore(hits, queries, n_results)
+            slots = sorted({int(slot) for found, _ in hits for slot in found})
+            records = {}
+            for start in range(0, len(slots), 500):
+                batch = slots[start:start + 500]
+                for row in self.con.execute(
+                    f"SELECT slot, id, document, metadata FROM records WHERE slot IN ({','.join('?' * len(batch))})",
+                    batch
+                ):
+                    records[row[0]] = row
+
+            result = {'ids': []}
+            for key in ("documents", "metadatas", "distances", "embeddings"):
+                if key in include:
+                    result[key] = []
+            for found, sims in hits:
+                # A slot can lose its row to a concurrent delete in another process
+                kept = [position for position, slot in enumerate(found) if int(slot) in records]
+                rows = [records[int(found[position])] for position in kept]
+                sims = sims[kept]
+                result['ids'].append([row[1] for row in rows])
+                if "documents" in include:
+                    result['documents'].append([row[2] for row in rows])
+                if "metadatas" in include:
+                    result['metadatas'].append([json.loads(row[3]) if row[3] else None for row in rows])
+                if "distances" in include:
+                    result['distances'].append((1.0 - sims).tolist())
+                if "embeddings" in include:
+                    result['embeddings'].append([self.vectors[row[0]].tolist() for row in rows])
+            return result
+
+    def _flat_search(self, queries: np.ndarray, k: int) -> list[tuple[np.ndarray, np.ndarray]]:
+        if self.vectors is None or not self.size:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+        scores = np.empty((self.size, len(queries)), dtype=np.float32)
+        for start in range(0, self.size, SCAN_BLOCK):
+            end = min(start + SCAN_BLOCK, self.size)
+            scores[start:end] = np.asarray(self.compact[start:end], dtype=np.float32) @ queries.T
+        scores[~self.live[:self.size]] = -np.inf
+        k = min(k, int(np.count_nonzero(self.live)))
+        hits = []
+        for column in scores.T:
+            top = np.argpartition(-column, k - 1)[:k] if k else np.empty(0, dtype=np.int64)
+            top = top[np.argsort(-column[top])]
+            hits.append((top, column[top]))
+        return hits
+
+    def _with_ungraphed(self, hits, queries: np.ndarray, k: int) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Merge in live slots the graph does not hold yet, found by brute force
+
+        A read-only store can see records whose graph nodes the writer has
+        not saved yet; scanning them keeps every record findable.
+        """
+        graphed = np.zeros(self.size, dtype=bool)
+        known = min(self.size, len(self.index.levels))
+        graphed[:known] = self.index.levels[:known] >= 0
+        missing = np.flatnonzero(self.live[:self.size] & ~graphed)
+        if not len(missing):
+            return hits
+        scores = np.asarray(self.compact[missing], dtype=np.float32) @ queries.T
+        merged = []
+        for (slots, sims), column in zip(hits, scores.T):
+            slots, sims = np.concatenate([slots, missing]), np.concatenate([sims, column])
+            order = np.argsort(-sims)[:k]
+            merged.append((slots[order], sims[order]))
+        return merged
+
+    def _rescore(self, hits, queries: np.ndarray, k: int) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Re-rank compact-search candidates by their full-precision similarity"""
+        rescored = []
+        for (slots, _), query in zip(hits, queries):
+            sims = self.vectors[slots] @ query
+            order = np.argsort(-sims)[:k]
+            rescored.append((slots[order], sims[order]))
+        return rescored
+
+    def _start_build(self):
+        """Build the HNSW graph on a background thread; searches stay flat until it is swapped in"""
+        self.free = []
+        self.builder = threading.Thread(target=self._build, args=(self.generation + 1,),
+                                        name=f"hnsw-{self.name}", daemon=True)
+        self.builder.start()
+
+    def _build(self, generation: int):
+        started = time.perf_counter()
+        logger.info(f"Building HNSW index for {self.name} ({self.count()} vectors) in the background")
+        graph = HNSWIndex(self.path, lambda: self.compact, name=_graph_name(generation))
+        graph.reset()
+        try:
+            while True:
+                with self.lock:
+                    graph.resize(self.capacity)
+                    pending = np.flatnonzero(self.live[:self.size] & (graph.levels[:self.size] < 0)).tolist()
+                    if len(pending) <= BUILD_CATCH_UP:
+                        # The last few nodes and the swap happen under the lock, so no write slips between
+                        for slot in pending:
+                            graph.add(slot)
+                        self._swap_index(graph, generation)
+                        break
+                # Vectors written meanwhile go to new slots, picked up on the next pass
+                for slot in pending:
+                    graph.add(slot)
+            logger.info(f"HNSW index for {self.name} ready ({len(graph)} vectors, "
+                        f"{time.perf_counter() - started:.1f}s)")
+        except Exception as e:
+            logger.exception(f"Building HNSW index for {self.name} failed: {e}")
+            graph.reset()
+        finally:
+            self.builder = None
+
+    def _swap_index(self, graph: HNSWIndex, generation: int):
+        graph.save()
+        with self.con:
+            self.con.execute("INSERT OR REPLACE INTO info VALUES ('index_generation', ?)", (str(generation),))
+        HNSWIndex(self.path, lambda: self.compact, name=_graph_name(self.generation)).reset()
+        self.index, self.generation = graph, generation
+        self.saved = time.monotonic()
+
+    def _repair_index(self):
+        """Add live vectors written after the graph's last checkpoint"""
+        missing = np.flatnonzero(self.live & (self.index.levels[:self.capacity] < 0)).tolist()
+        if not missing:
+            return
+        logger.info(f"Adding {len(missing)} vectors written after the last HNSW checkpoint of {self.name}")
+        for slot in missing:
+            self.index.add(slot)
+        self.index.save()
+
+    def wait_for_index(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a background graph build; returns whether none is running"""
+        builder = self.builder
+        if builder is not None:
+            builder.join(timeout)
+        return self.builder is None
+
+    def _maybe_compact(self):
+        """Rewrite the store without dead slots once they make up ``compact_fraction`` of it"""
+        dead = self.size - self.count()
+        if self.index is None or dead < max(1000, self.size * self.compact_fraction):
+            return
+        logger.info(f"Compacting {self.name}: dropping {dead} dead slots")
+        # The graph refers to the old slots; searches scan flat until the rebuild is swapped in
+        self.index.reset()
+        self.index = None
+        self.generation += 1
+        live_slots = np.flatnonzero(self.live[:self.size])
+        self.vectors[:len(live_slots)] = np.array(self.vectors[live_slots])
+        if self.compressed:
+            self.compact[:len(live_slots)] = np.array(self.compact[live_slots])
+        with self.con:
+            # Two passes so the UNIQUE constraint on slot never sees a collision
+            self.con.executemany("UPDATE records SET slot=? WHERE slot=?",
+                                 [(-new - 1, int(old)) for new, old in enumerate(live_slots)])
+            self.con.execute("UPDATE records SET slot=-slot-1 WHERE slot < 0")
+            self.size = len(live_slots)
+            self.con.execute("INSERT OR REPLACE INTO info VALUES ('size', ?)", (str(self.size),))
+            self.con.execute("INSERT OR REPLACE INTO info VALUES ('index_generation', ?)", (str(self.generation),))
+            self._bump_version()
+        self.live[:] = False
+        self.live[:self.size] = True
+        self._start_build()
+
+    def _flush(self):
+        if self.vectors is not None:
+            self.vectors.flush()
+        if self.compressed and self.compact is not None:
+            self.compact.flush()
+
+    def _persist(self, force: bool = False):
+        self._flush()
+        if self.index is not None and (force or time.monotonic() - self.saved >= GRAPH_SAVE_INTERVAL):
+            self.index.save()
+            self.saved = time.monotonic()
+
+    def close(self):
+        if self.builder is not None:
+            logger.info(f"Waiting for the HNSW index build of {self.name} to finish")
+            self.wait_for_index()
+        with self.lock:
+            if not self.read_only:
+                self._persist(force=True)
+            self.con.close()
@@ -1,6 +1,16 @@
-from orchestrator_agent.agent import orchestrator
+import asyncio
 
-orchestrator("""
+from orchestrator_agent.agent import run_conversation
+from retrieval.service import get_service
+
+# Opens the shared retriever up front so the first tool call does not pay for it
+health = get_service().health()
+if not health['ok']:
+    print(f"Retrieval is unavailable, content will not be grounded: {health['error']}")
+
+print(asyncio.run(run_conversation("""
              create a new customer with id 0000 first name: John last name: Doe 100-111-1111 24 years old getting his first insurance plan. 
              Create content for a young adult getting their first health insurance policy
-             """)
\ No newline at end of file
+             """)))
+
+get_service().close()
@@ -0,0 +1,35 @@
+from ingestion.boilerplate import BoilerplateStripper
+
+NAV = "<nav>Home | Products | About us | Contact the sales team</nav>"
+
+
+def _page(i: int) -> str:
+    return f"<html><body>{NAV}<div><p>Page {i} covers topic number {i} in some detail.</p></div></body></html>"
+
+
+def test_finish_learns_templates_from_partial_samples(tmp_path):
+    stripper = BoilerplateStripper(cache_dir=str(tmp_path), sample_size=50, min_pages=5)
+    for i in range(6):
+        assert 'Products' in stripper.strip("small.example", _page(i))
+    for i in range(3):
+        stripper.strip("tiny.example", _page(i))
+
+    assert stripper.finish() == ["small.example"]
+    assert stripper.template("tiny.example") is None
+    stripped = stripper.strip("small.example", _page(7))
+    assert 'Products' not in stripped and 'Page 7' in stripped
+    assert BoilerplateStripper(cache_dir=str(tmp_path)).template("small.example") == stripper.template("small.example")
+
+
+def test_unreadable_samples_are_skipped_when_learning_templates(tmp_path, monkeypatch):
+    from generate_embeddings import learn_templates
+
+    monkeypatch.chdir(tmp_path)
+    domain = tmp_path / "html" / "example.com"
+    domain.mkdir(parents=True)
+    for i in range(6):
+        (domain / f"page{i}.html").write_text(_page(i), encoding='utf-8')
+    (domain / "broken.html").write_bytes(b"\xff\xfe not utf-8 \xff")
+
+    templates = learn_templates(tmp_path / "html", sample_size=7)
+    assert templates["example.com"]
@@ -0,0 +1,27 @@
+import io
+import json
+
+from customer_agent.bulk import export_customers, import_customers
+from customer_agent.repository import CustomerRepository
+
+
+def test_jsonl_import_skips_invalid_lines(tmp_path):
+    repository = CustomerRepository(str(tmp_path / "customers.db"))
+    lines = [
+        json.dumps({'ccid': 1, 'fname': 'Ada', 'lname': 'Lovelace', 'tier': 'gold'}),
+        '[1, 2]',
+        'not json',
+        '"a string"',
+        json.dumps({'fname': 'No', 'lname': 'Ccid'}),
+        json.dumps({'ccid': '2', 'fname': 'Alan', 'metadata': '{"plan": "basic"}'}),
+    ]
+    stats = import_customers(repository, io.StringIO('\n'.join(lines)), 'jsonl')
+    assert (stats.rows, stats.written, stats.invalid) == (6, 2, 4)
+    assert repository.get('1')['metadata'] == {'tier': 'gold'}
+    assert repository.get('2')['metadata'] == {'plan': 'basic'}
+
+    out = io.StringIO()
+    assert export_customers(repository, out, 'csv') == 2
+    stats = import_customers(repository, io.StringIO(out.getvalue()), 'csv')
+    assert (stats.rows, stats.written, stats.invalid) == (2, 0, 0)
+    repository.close()
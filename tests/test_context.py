@@ -0,0 +1,16 @@
+from retrieval.context import ContextPacker
+
+
+def _characters(text: str) -> int:
+    # A counter where long words cost far more than a characters-per-token guess allows
+    return len(text)
+
+
+def test_a_passage_without_a_fitting_sentence_is_cut_by_tokens():
+    packer = ContextPacker(_characters, budget=150, min_passage_tokens=10)
+    long_sentence = ' '.join(["supercalifragilistic"] * 30)
+    results = {'ids': [["a", "b"]], 'documents': [["Short first passage.", long_sentence]],
+               'metadatas': [[{'title': "A"}, {'title': "B"}]]}
+    packed = packer.pack(results)
+    assert len(packed) <= 150
+    assert "[2] B\nsupercalifragilistic" in packed
@@ -0,0 +1,45 @@
+import ollama
+import pytest
+
+from ingestion.embedder import BatchEmbedder, EmbeddingError
+
+
+class FakeClient:
+    """Fails with each queued error in turn, then embeds; texts containing ``bad`` are rejected"""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.calls = []
+
+    def embed(self, model, input):
+        self.calls.append(len(input))
+        if self.errors:
+            raise self.errors.pop(0)
+        if any('bad' in text for text in input):
+            raise ollama.ResponseError('invalid input', 400)
+        return {'embeddings': [[float(len(text))] for text in input]}
+
+
+def test_transient_errors_are_retried_without_splitting():
+    client = FakeClient([ollama.ResponseError('busy', 503), TimeoutError('timed out')])
+    embedder = BatchEmbedder(client=client, initial_batch_size=8, retry_backoff=0)
+    assert embedder.embed(['a'] * 8) == [[1.0]] * 8
+    assert client.calls == [8, 8, 8]
+    assert embedder.batch_size >= 8
+
+
+def test_rejected_batches_are_split_to_isolate_bad_inputs():
+    client = FakeClient()
+    embedder = BatchEmbedder(client=client, initial_batch_size=4, retry_backoff=0)
+    with pytest.raises(EmbeddingError):
+        embedder.embed(['a', 'bb', 'bad', 'c'])
+    assert client.calls == [4, 2, 2, 1]
+    assert embedder.batch_size == 1
+
+
+def test_unreachable_server_fails_without_splitting():
+    client = FakeClient([ConnectionError('refused')] * 3)
+    embedder = BatchEmbedder(client=client, initial_batch_size=4, retry_backoff=0)
+    with pytest.raises(EmbeddingError):
+        embedder.embed(['a'] * 4)
+    assert client.calls == [4, 4, 4]
@@ -0,0 +1,31 @@
+from ingestion.embedding_cache import EmbeddingCache
+
+DIM = 4
+
+
+def _vector(i: int) -> list[float]:
+    return [float(i)] * DIM
+
+
+def test_eviction_never_frees_a_slot_the_same_batch_uses(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", max_bytes=10 * DIM * 4)
+    for i in range(10):
+        cache.put_many([f"text {i}"], [_vector(i)])
+    assert cache.capacity == 10
+
+    # "text 0" is the least recently used entry, so it would be the first eviction victim
+    cache.put_many(["text 0", "new 1", "new 2"], [_vector(0), _vector(101), _vector(102)])
+    assert cache.get_many(["text 0", "new 1", "new 2"]) == [_vector(0), _vector(101), _vector(102)]
+    slots = [slot for (slot,) in cache.con.execute("SELECT slot FROM entries")]
+    assert len(slots) == len(set(slots)) <= cache.capacity
+    cache.close()
+
+
+def test_batches_larger_than_the_cache_store_what_fits(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", max_bytes=4 * DIM * 4)
+    texts = [f"text {i}" for i in range(6)]
+    cache.put_many(texts, [_vector(i) for i in range(6)])
+    results = cache.get_many(texts)
+    assert sum(result is not None for result in results) == 4
+    assert all(result == _vector(i) for i, result in enumerate(results) if result is not None)
+    cache.close()
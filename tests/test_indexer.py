@@ -0,0 +1,51 @@
+import json
+
+import numpy as np
+
+from ingestion.chunker import MarkdownChunker, estimate_tokens
+from ingestion.dedupe import NearDuplicateIndex
+from ingestion.indexer import ChunkIndexer, config_fingerprint
+from ingestion.manifest import Manifest
+from ingestion.writer import BulkWriter
+from retrieval.context import ContextPacker
+from retrieval.store import VectorStore
+
+SHARED = "Open an account online in minutes with no monthly fees and free transfers between accounts."
+
+
+def _write(indexer: ChunkIndexer, path, chunks: list[str]):
+    ids, needs_write = indexer.assign(path, chunks)
+    embeddings = np.random.default_rng(0).random((needs_write.count(True), 8)).tolist()
+    indexer.write(path, path.name, chunks, ids, needs_write, embeddings,
+                  extra_metadata={'original_url': f"https://example.com/{path.stem}", 'title': path.stem})
+    return ids
+
+
+def test_collapsed_chunks_list_every_source_as_they_are_written(tmp_path):
+    store = VectorStore(tmp_path, "docs", index='flat')
+    manifest = Manifest(str(tmp_path / "manifest.db"))
+    writer = BulkWriter(store)
+    indexer = ChunkIndexer(store, writer, manifest, NearDuplicateIndex(manifest))
+
+    ids = _write(indexer, tmp_path / "a.html", ["Page a introduces the savings account and its rates.", SHARED])
+    _write(indexer, tmp_path / "b.html", ["Page b explains how to apply for a mortgage today.", SHARED])
+    writer.flush()
+
+    shared = store.get(ids=[ids[1]])['metadatas'][0]
+    assert (shared['filename'], shared['source_count']) == ("a.html", 2)
+    assert json.loads(shared['sources']) == ["a.html", "b.html"]
+    assert indexer.sources == {}
+
+    # The shared chunk keeps its first page's position, so it is not merged with that page's neighbours
+    results = store.query(query_embeddings=[[1.0] * 8], n_results=3)
+    packed = ContextPacker(budget=1000).pack(results)
+    assert packed.count('[') == 3
+    writer.close()
+    store.close()
+
+
+def test_fingerprint_depends_on_the_configured_tokenizer_not_whether_it_loaded():
+    loaded = MarkdownChunker(count_tokens=lambda text: len(text.split()), tokenizer="nomic-ai/nomic-embed-text-v1.5")
+    fallback = MarkdownChunker(count_tokens=estimate_tokens, tokenizer="nomic-ai/nomic-embed-text-v1.5")
+    assert config_fingerprint(loaded) == config_fingerprint(fallback)
+    assert config_fingerprint(fallback) != config_fingerprint(MarkdownChunker())
@@ -0,0 +1,11 @@
+from retrieval.lexical import exact_terms
+
+
+def test_codes_and_phone_numbers_are_exact_terms():
+    assert exact_terms("Is 99213 or J1100 covered? Call 800-555-0142") == ["99213", "J1100", "800-555-0142"]
+    assert exact_terms('PPO500 and 0001U "prior authorization"') == ["prior authorization", "PPO500", "0001U"]
+
+
+def test_years_are_not_codes():
+    assert exact_terms("What changed in the 2024 plan compared to 1999?") == []
+    assert exact_terms("Code 2024U and 20245 are billed separately") == ["2024U", "20245"]
@@ -0,0 +1,109 @@
+import numpy as np
+
+from ingestion.dedupe import NearDuplicateIndex
+from ingestion.manifest import Manifest
+from ingestion.pipeline import IngestionPipeline, PipelineConfig
+from retrieval.store import VectorStore
+
+
+def test_chunks_from_many_files_share_embedding_calls(tmp_path):
+    source = tmp_path / "html" / "example.com"
+    source.mkdir(parents=True)
+    for i in range(30):
+        (source / f"page{i}.html").write_text(f"<html><body><h1>Page {i}</h1><p>About item {i}.</p></body></html>")
+    (source / "bad.html").write_text("<html><body><p>POISON</p></body></html>")
+    calls = []
+
+    def embed(texts):
+        calls.append(len(texts))
+        if any("POISON" in text for text in texts):
+            raise RuntimeError("cannot embed")
+        return np.random.default_rng(len(calls)).random((len(texts), 8)).tolist()
+
+    store = VectorStore(tmp_path, "docs", index='flat')
+    config = PipelineConfig(convert_processes=1, embed_batch_wait=5.0)
+    pipeline = IngestionPipeline(store, embed, config, manifest=Manifest(str(tmp_path / "manifest.db")))
+    stats = pipeline.run(sorted(source.glob("*.html")))
+
+    # One group for every file, then one call per file after the poisoned text failed it
+    assert calls[0] == 31 and len(calls) == 32
+    assert (stats.files, stats.errors) == (30, 1)
+    assert store.count() == 30
+    store.close()
+
+
+def _embed(texts):
+    return np.random.default_rng(len(texts)).random((len(texts), 8)).tolist()
+
+
+def test_unreadable_files_keep_their_chunks_and_settings_changes_reindex(tmp_path):
+    source = tmp_path / "html" / "example.com"
+    source.mkdir(parents=True)
+    for i in range(3):
+        (source / f"page{i}.html").write_text(f"<html><body><p>Details about product {i}.</p></body></html>")
+    store = VectorStore(tmp_path, "docs", index='flat')
+    manifest = Manifest(str(tmp_path / "manifest.db"))
+    config = PipelineConfig(convert_processes=1)
+    IngestionPipeline(store, _embed, config, manifest=manifest).run(sorted(source.glob("*.html")))
+    assert store.count() == 3
+
+    (source / "page0.html").write_bytes(b"\xff\xfe not utf-8 \xff")
+    pipeline = IngestionPipeline(store, _embed, config, manifest=manifest)
+    stats = pipeline.run(sorted(source.glob("*.html")))
+    assert (stats.errors, stats.skipped) == (1, 2)
+    assert pipeline.prune_missing(source.parent) == 0
+    assert store.count() == 3
+
+    changed = PipelineConfig(convert_processes=1, chunk_tokens=256)
+    stats = IngestionPipeline(store, _embed, changed, manifest=manifest).run(sorted(source.glob("page[12].html")))
+    assert (stats.files, stats.skipped) == (2, 0)
+    store.close()
+
+
+def test_failed_chunk_writes_are_not_counted_as_file_errors(tmp_path):
+    source = tmp_path / "html" / "example.com"
+    source.mkdir(parents=True)
+    for i in range(2):
+        (source / f"page{i}.html").write_text(f"<html><body><p>Details about product {i}.</p></body></html>")
+
+    class FailingStore(VectorStore):
+        def upsert(self, ids, embeddings=None, documents=None, metadatas=None):
+            raise RuntimeError("disk full")
+
+    store = FailingStore(tmp_path, "docs", index='flat')
+    pipeline = IngestionPipeline(store, _embed, PipelineConfig(convert_processes=1),
+                                 manifest=Manifest(str(tmp_path / "manifest.db")))
+    stats = pipeline.run(sorted(source.glob("*.html")))
+    assert (stats.files, stats.errors, stats.failed_chunks) == (2, 0, 2)
+    store.close()
+
+
+def test_chunks_claimed_by_a_file_that_failed_to_embed_are_redone(tmp_path):
+    source = tmp_path / "html" / "example.com"
+    source.mkdir(parents=True)
+    shared = "<h2>Opening hours</h2><p>Our branches are open from nine to five on weekdays and until noon on Saturdays.</p>"
+    (source / "a.html").write_text(f"<html><body><h1>Bank</h1><h2>Alpha</h2><p>POISON in the alpha page.</p>{shared}</body></html>")
+    (source / "b.html").write_text(f"<html><body><h1>Bank</h1><h2>Beta</h2><p>The beta page covers loans.</p>{shared}</body></html>")
+
+    def poisoned(texts):
+        if any("POISON" in text for text in texts):
+            raise RuntimeError("cannot embed")
+        return _embed(texts)
+
+    store = VectorStore(tmp_path, "docs", index='flat')
+    manifest = Manifest(str(tmp_path / "manifest.db"))
+    config = PipelineConfig(convert_processes=1, embed_batch_wait=5.0)
+    dedupe = NearDuplicateIndex(manifest)
+    stats = IngestionPipeline(store, poisoned, config, manifest=manifest, dedupe=dedupe).run(
+        sorted(source.glob("*.html")))
+    assert (stats.files, stats.errors) == (1, 1)
+    # b.html deduplicated against a chunk a.html never stored, so it is redone on the next run
+    assert manifest.get_hash(str(source / "b.html")) == ''
+
+    stats = IngestionPipeline(store, _embed, config, manifest=manifest, dedupe=dedupe).run(
+        sorted(source.glob("*.html")))
+    assert stats.files == 2
+    for path in ("a.html", "b.html"):
+        chunk_ids = manifest.get_chunk_ids(str(source / path))
+        assert len(store.get(ids=chunk_ids)['ids']) == len(chunk_ids)
+    store.close()
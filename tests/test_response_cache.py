@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from content_agent.response_cache import MemoryResponseStore, PlaceholderFiller, ResponseCache
+
+WILL = {'fname': 'Will', 'lname': 'Grant'}
+JANE = {'fname': 'Jane', 'lname': 'Doe'}
+
+
+@pytest.mark.parametrize("step", [1, 2, 3, 7])
+def test_filler_fills_placeholders_split_across_deltas(step):
+    text = "Hi {{fname}} {{lname}}, we will grant you {access} {{"
+    filler = PlaceholderFiller(WILL)
+    out = ''.join(filler.feed(text[i:i + step]) for i in range(0, len(text), step)) + filler.flush()
+    assert out == "Hi Will Grant, we will grant you {access} {{"
+
+
+def test_cached_template_keeps_words_that_are_also_names():
+    cache = ResponseCache(MemoryResponseStore())
+    cache.put("Write to Will about the grant", "context", WILL, "Hi {{fname}}, Will you apply for the Grant?")
+    assert cache.get("Write to Jane about the grant", "context", JANE) == "Hi Jane, Will you apply for the Grant?"
+    assert cache.get("Write to Jane about the grant", "other context", JANE) is None
+
+
+def test_similar_prompts_with_different_identifiers_do_not_share_responses():
+    # Every prompt embeds to the same vector, so only the identifier check keeps them apart
+    cache = ResponseCache(MemoryResponseStore(), embed=lambda prompt: np.ones(4, dtype=np.float32) / 2)
+    cache.put("Remind the customer with phone 555-0142 about renewal", "context", JANE, "Call 555-0142 to renew")
+    assert cache.get("Remind the customer with phone 555-0199 about renewal", "context", JANE) is None
+    assert cache.get("Please remind the customer with phone 555-0142 about renewal", "context", JANE) == \
+        "Call 555-0142 to renew"
+
+
+def test_ccid_values_are_templatized_in_the_key():
+    cache = ResponseCache(MemoryResponseStore())
+    cache.put("Offer an upgrade to account 1001", "context", {**WILL, 'ccid': '1001'}, "Account {{ccid}} qualifies")
+    assert cache.get("Offer an upgrade to account 2002", "context", {**JANE, 'ccid': '2002'}) == \
+        "Account 2002 qualifies"
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+from retrieval.store import VectorStore
+
+DIM = 16
+
+
+def _vectors(count: int, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _ids(count: int, start: int = 0) -> list[str]:
+    return [f"doc-{i}" for i in range(start, start + count)]
+
+
+def _top_ids(store: VectorStore, queries: np.ndarray, k: int) -> list[list[str]]:
+    return store.query(query_embeddings=queries.tolist(), n_results=k, include=())['ids']
+
+
+@pytest.fixture
+def vectors():
+    return _vectors(1000)
+
+
+def test_hnsw_recall_matches_flat(tmp_path, vectors):
+    flat = VectorStore(tmp_path, "flat", index='flat')
+    graph = VectorStore(tmp_path, "graph", index='hnsw')
+    for store in (flat, graph):
+        store.upsert(_ids(len(vectors)), embeddings=vectors.tolist())
+    assert graph.wait_for_index(60)
+    assert graph.index is not None and len(graph.index) == len(vectors)
+
+    queries = _vectors(50, seed=1)
+    expected = _top_ids(flat, queries, 10)
+    found = _top_ids(graph, queries, 10)
+    recall = np.mean([len(set(e) & set(f)) / 10 for e, f in zip(expected, found)])
+    assert recall >= 0.9
+    flat.close()
+    graph.close()
+
+
+def test_search_is_exact_while_the_graph_builds(tmp_path, vectors):
+    store = VectorStore(tmp_path, "docs", index='auto', hnsw_threshold=500)
+    store.upsert(_ids(600), embeddings=vectors[:600].tolist())
+    # Writes during the build append; the builder picks them up before swapping the graph in
+    store.upsert(_ids(400, start=600), embeddings=vectors[600:].tolist())
+    store.delete(_ids(10))
+    assert _top_ids(store, vectors[500:501], 1) == [["doc-500"]]
+    assert store.wait_for_index(60)
+    assert store.index is not None
+    assert store.count() == 990
+    assert _top_ids(store, vectors[900:901], 1) == [["doc-900"]]
+    assert "doc-0" not in _top_ids(store, vectors[:1], 5)[0]
+    store.close()
+
+    reopened = VectorStore(tmp_path, "docs", index='auto', hnsw_threshold=500)
+    assert reopened.index is not None and reopened.builder is None
+    assert reopened.generation == store.generation
+    assert _top_ids(reopened, vectors[950:951], 1) == [["doc-950"]]
+    reopened.close()
+
+
+@pytest.mark.parametrize("index,storage", [('flat', None), ('hnsw', None), ('hnsw', 'int8')])
+def test_delete_and_reopen(tmp_path, vectors, index, storage):
+    store = VectorStore(tmp_path, "docs", index=index, storage=storage)
+    store.upsert(_ids(300), embeddings=vectors[:300].tolist(), documents=[f"text {i}" for i in range(300)])
+    store.wait_for_index(60)
+    store.delete(_ids(100))
+    store.upsert(["doc-150"], embeddings=vectors[299:300].tolist(), documents=["moved"])
+    store.close()
+
+    reopened = VectorStore(tmp_path, "docs", index=index)
+    assert reopened.count() == 200
+    assert reopened.get(ids=["doc-5"])['ids'] == []
+    assert reopened.get(ids=["doc-150"])['documents'] == ["moved"]
+    top = _top_ids(reopened, vectors[:100], 3)
+    assert not {id for ids in top for id in ids} & set(_ids(100))
+    assert _top_ids(reopened, vectors[200:201], 1) == [["doc-200"]]
+    reopened.close()
+
+
+@pytest.mark.parametrize("empty_graph_first", [True, False])
+def test_writes_after_the_last_graph_checkpoint_are_repaired(tmp_path, vectors, empty_graph_first):
+    store = VectorStore(tmp_path, "docs", index='hnsw')
+    if empty_graph_first:
+        # The build of the empty store is swapped in before any write, so every node comes after its checkpoint
+        assert store.wait_for_index(60)
+    store.upsert(_ids(300), embeddings=vectors[:300].tolist())
+    store.wait_for_index(60)
+    store.upsert(_ids(100, start=300), embeddings=vectors[300:400].tolist())
+    # Simulate a crash: vectors and records are on disk, the graph state is not
+    store._flush()
+    store.con.close()
+
+    reopened = VectorStore(tmp_path, "docs", index='hnsw')
+    assert len(reopened.index) == 400
+    assert _top_ids(reopened, vectors[350:351], 1) == [["doc-350"]]
+    reopened.close()
+
+
+def test_read_only_store_follows_writes(tmp_path, vectors):
+    writer = VectorStore(tmp_path, "docs", index='auto', hnsw_threshold=200)
+    writer.upsert(_ids(100), embeddings=vectors[:100].tolist())
+    reader = VectorStore(tmp_path, "docs", read_only=True)
+    assert reader.count() == 100
+
+    writer.upsert(_ids(300, start=100), embeddings=vectors[100:400].tolist())
+    writer.wait_for_index(60)
+    writer.delete(_ids(50))
+    assert reader.count() == 350
+    assert reader.index is not None
+    assert _top_ids(reader, vectors[380:381], 1) == [["doc-380"]]
+    assert "doc-0" not in _top_ids(reader, vectors[:1], 5)[0]
+    with pytest.raises(ValueError):
+        reader.delete(["doc-60"])
+    reader.close()
+    writer.close()
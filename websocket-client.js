@@ -8,8 +8,11 @@ const API_KEY = process.env.APPSYNC_API_KEY || '';
 const CHANNEL_NAMESPACE = 'default';
 const CHANNEL = process.env.CHANNEL || 'test-channel';
 const USE_CLOUDFRONT = process.env.USE_CLOUDFRONT !== 'false'; // Default to true
+// Local orchestrator stream server, e.g. ws://localhost:8080 (python -m orchestrator_agent.server)
+const LOCAL_ENDPOINT = process.env.LOCAL_ENDPOINT || '';
+const PROMPT = process.env.PROMPT || '';
 
-if (!API_KEY) {
+if (!API_KEY && !LOCAL_ENDPOINT) {
   console.error('Error: APPSYNC_API_KEY environment variable is required');
   console.error('Retrieve it with: aws ssm get-parameter --name /appsync/chat-events/api-key --with-decryption --query Parameter.Value --output text');
   process.exit(1);
@@ -49,7 +52,7 @@ class AppSyncWebSocketClient {
    */
   async connect() {
     return new Promise((resolve, reject) => {
-      const wsUrl = `wss://${this.domain}/event/realtime`;
+      const wsUrl = LOCAL_ENDPOINT ? `${LOCAL_ENDPOINT}/event/realtime` : `wss://${this.domain}/event/realtime`;
 
       console.log(`Connecting to: ${wsUrl}`);
       console.log(`Channel: ${this.channel}`);
@@ -244,14 +247,20 @@ async function main() {
     console.log('\n✓ Connected and subscribed! Listening for events...\n');
     console.log('Press Ctrl+C to exit\n');
 
-    // Example: Publish a test event after 3 seconds
-    setTimeout(() => {
-      console.log('\n📤 Publishing test event...');
-      client.publish({
-        message: 'Hello from Node.js client!',
-        timestamp: new Date().toISOString(),
-      });
-    }, 3000);
+    if (PROMPT) {
+      // The local server streams the conversation's events back on this channel
+      console.log('\n📤 Publishing prompt...');
+      client.publish({ prompt: PROMPT });
+    } else {
+      // Example: Publish a test event after 3 seconds
+      setTimeout(() => {
+        console.log('\n📤 Publishing test event...');
+        client.publish({
+          message: 'Hello from Node.js client!',
+          timestamp: new Date().toISOString(),
+        });
+      }, 3000);
+    }
 
   } catch (error) {
     console.error('Failed to connect:', error);